@@ -0,0 +1,247 @@
+"""
+Views assíncronas para as rotas dominadas por espera de I/O. Sob ASGI
+(uvicorn) cada requisição parada é uma corrotina, não um worker preso.
+As rotas só usam estas versões com ASYNC_VIEWS=True (veja api/urls.py);
+sob WSGI continuam as views DRF de api/views.py, com o mesmo contrato.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_safe
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .authentication import StatelessJWTAuthentication
+from .cache import (
+    RESTAURANT_LIST_SCOPE, menu_scope, get_cache, aget_version, response_digest, response_key,
+    ais_driver_order_allowed, aallow_driver_order,
+)
+from .geo import get_driver_index
+from .models import Restaurant, Order
+from .pagination import ChangeCursor, decode_change_cursor, parse_feed_wait
+from .serializers import LocationSerializer, OrderDisplaySerializer
+from .streams import order_events, format_sse, restaurant_order_changes, driver_order_changes
+from .tracking import get_location_buffer
+from .views import PublicRestaurantListView, PublicRestaurantMenuView
+
+
+def _json(data, status=status.HTTP_200_OK, headers=None):
+    # Mesmo renderer das views DRF, para que as respostas sejam idênticas.
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status, headers=headers)
+
+
+def _auth_error(request, authenticator, exc):
+    # Como o APIView do DRF: o detalhe da exceção sai como está, com o WWW-Authenticate.
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+    return _json(data, status=exc.status_code, headers={'WWW-Authenticate': authenticator.authenticate_header(request)})
+
+
+def _parse_body(request):
+    # Os mesmos parsers das views DRF (JSON, formulário e multipart); o corpo já está em memória.
+    return Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES]).data
+
+
+async def _authenticate(request, role):
+    """
+    Autentica pelo JWT e confere o papel. Retorna (usuário, None) ou
+    (None, resposta de erro).
+    """
+    authenticator = StatelessJWTAuthentication()
+    try:
+        auth = await sync_to_async(authenticator.authenticate)(request)
+    except AuthenticationFailed as exc:
+        return None, _auth_error(request, authenticator, exc)
+    if auth is None:
+        return None, _auth_error(request, authenticator, NotAuthenticated())
+    user = auth[0]
+    # Tokens antigos, sem o claim "role", caem numa consulta ao banco.
+    user_role = user.token.get('role') or await sync_to_async(lambda: user.role)()
+    if user_role != role:
+        return None, _json({"detail": "Você não tem permissão para executar essa ação."}, status=status.HTTP_403_FORBIDDEN)
+    return user, None
+
+
+@csrf_exempt
+@require_http_methods(['PUT', 'PATCH'])
+async def driver_location_update(request, pk):
+    user, error = await _authenticate(request, 'driver')
+    if error is not None:
+        return error
+
+    if not await ais_driver_order_allowed(user.id, pk):
+        order = await Order.objects.filter(pk=pk, driver_id=user.id).only('id', 'status').afirst()
+        if order is None:
+            return _json({"detail": "Pedido não encontrado ou não pertence a você."}, status=status.HTTP_404_NOT_FOUND)
+        if order.status == 'out_for_delivery':
+            await aallow_driver_order(user.id, pk)
+
+    try:
+        data = _parse_body(request)
+    except APIException as exc:
+        return _json({"detail": exc.detail}, status=exc.status_code)
+    serializer = LocationSerializer(data=data)
+    if not serializer.is_valid():
+        return _json(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    location = {
+        'lat': serializer.validated_data['lat'],
+        'lng': serializer.validated_data['lng'],
+        'driver_id': user.id,
+    }
+    # O buffer só guarda a posição; a escrita no Firebase acontece na thread de flush.
+    get_location_buffer().submit(pk, location)
+    get_driver_index().update(user.id, location['lat'], location['lng'], idle=False)
+    order_events.publish(pk, 'location', location)
+    return _json({"status": "localização atualizada com sucesso"})
+
+
+@require_safe
+async def customer_track_order(request, pk):
+    user, error = await _authenticate(request, 'customer')
+    if error is not None:
+        return error
+    if not await Order.objects.filter(pk=pk, customer_id=user.id).aexists():
+        return _json({"detail": "Pedido não encontrado ou não pertence a você."}, status=status.HTTP_404_NOT_FOUND)
+    return _json({
+        "message": "Acesso permitido. Ouça por atualizações no caminho especificado.",
+        "firebase_database_url": settings.FIREBASE_DATABASE_URL,
+        "firebase_path": f"/order_locations/{pk}",
+    })
+
+
+async def _cached_list(request, scope, view, **kwargs):
+    """
+    Versão assíncrona do CachedListMixin: 304 e hits saem direto do cache.
+    No miss a view DRF monta a página (cursor, serializer) e preenche o cache.
+    """
+    digest = response_digest(await aget_version(scope), request)
+    etag = f'"{digest}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    data = await get_cache().aget(response_key(scope, digest))
+    if data is None:
+        return await sync_to_async(_render)(view, request, **kwargs)
+    return _json(data, headers={'ETag': etag})
+
+
+def _render(view, request, **kwargs):
+    response = view(request, **kwargs)
+    response.render()
+    return response
+
+
+@require_safe
+async def public_restaurant_list(request):
+    return await _cached_list(request, RESTAURANT_LIST_SCOPE, PublicRestaurantListView.as_view())
+
+
+@require_safe
+async def public_restaurant_menu(request, restaurant_pk):
+    return await _cached_list(
+        request, menu_scope(restaurant_pk), PublicRestaurantMenuView.as_view(), restaurant_pk=restaurant_pk
+    )
+
+
+async def _changes_feed(request, notifier, key, orders):
+    """
+    Corpo comum dos feeds de mudanças, como em OrderChangesFeedView: `orders`
+    são os pedidos do feed e `notifier` avisa das mudanças na chave `key`.
+    O long-poll espera no event loop.
+    """
+    since = request.GET.get('since')
+    if not since:
+        cursor = ChangeCursor.starting_at(timezone.now())
+        recent = [pair async for pair in orders.changed_since(cursor.watermark).values_list('id', 'updated_at')]
+        return _json({"results": [], "cursor": cursor.advance(recent).encode(), "has_more": False})
+
+    try:
+        cursor = decode_change_cursor(since)
+    except ValidationError as exc:
+        return _json(exc.detail, status=status.HTTP_400_BAD_REQUEST)
+    deadline = time.monotonic() + parse_feed_wait(request.GET.get('wait'))
+    limit = settings.API_MAX_PAGE_SIZE
+
+    while True:
+        version = notifier.version(key)
+        changes = cursor.unseen([
+            order async for order in
+            orders.with_display_relations().changed_since(cursor.watermark)[:limit + len(cursor.seen) + 1]
+        ])
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+        await notifier.wait_async(key, version, min(remaining, settings.ORDER_FEED_POLL_INTERVAL))
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        since = cursor.advance([(order.pk, order.updated_at) for order in changes], has_more).encode()
+    return _json({
+        "results": OrderDisplaySerializer(changes, many=True).data,
+        "cursor": since,
+        "has_more": has_more,
+    })
+
+
+@require_safe
+async def restaurant_order_changes_feed(request):
+    """Versão assíncrona do RestaurantOrderChangesView."""
+    user, error = await _authenticate(request, 'owner')
+    if error is not None:
+        return error
+    restaurant_id = await Restaurant.objects.filter(owner_id=user.id).values_list('id', flat=True).afirst()
+    if restaurant_id is None:
+        return _json({"results": [], "cursor": None, "has_more": False})
+    return await _changes_feed(request, restaurant_order_changes, restaurant_id, Order.objects.filter(restaurant_id=restaurant_id))
+
+
+@require_safe
+async def driver_order_changes_feed(request):
+    """Versão assíncrona do DriverOrderChangesView: os pedidos do despacho em lote chegam por aqui."""
+    user, error = await _authenticate(request, 'driver')
+    if error is not None:
+        return error
+    return await _changes_feed(request, driver_order_changes, user.id, Order.objects.filter(driver_id=user.id))
+
+
+@require_safe
+async def customer_order_stream(request, pk):
+    """
+    Stream SSE (text/event-stream) com a localização e o status de um pedido
+    do cliente. Pensada para rodar sob ASGI: cada conexão parada é só uma
+    corrotina esperando eventos, sem ocupar um worker.
+    """
+    user, error = await _authenticate(request, 'customer')
+    if error is not None:
+        return error
+
+    order = await Order.objects.filter(pk=pk, customer_id=user.id).only('id', 'status').afirst()
+    if order is None:
+        return _json({"detail": "Pedido não encontrado ou não pertence a você."}, status=status.HTTP_404_NOT_FOUND)
+
+    async def events():
+        subscription = order_events.subscribe(order.pk)
+        try:
+            yield format_sse('status', {'status': order.status})
+            while True:
+                pending = await subscription.next_events(settings.ORDER_STREAM_KEEPALIVE)
+                if not pending:
+                    # Comentário SSE: mantém proxies e load balancers com a conexão aberta.
+                    yield ": keepalive\n\n"
+                for event, data in pending:
+                    yield format_sse(event, data)
+        finally:
+            order_events.unsubscribe(order.pk, subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,223 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import RevokedToken, User
+
+
+def get_cache():
+    return caches[settings.AUTH_CACHE_ALIAS]
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh token que carrega o papel do usuário. O claim é copiado para os
+    access tokens gerados a partir dele, então as permissões não precisam
+    buscar o usuário no banco.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        return token
+
+
+# Revogação: tokens são identificados pelo jti; "revogar tudo" de um usuário
+# invalida os tokens emitidos antes do instante registrado. As revogações
+# ficam na tabela RevokedToken; se o cache de autenticação for compartilhado
+# entre processos (Redis, Memcached), também nele, e a checagem a cada
+# requisição lê do cache. O cache guarda também a ausência de revogação:
+# uma chave que falta (nunca consultada, ou perdida numa eviction ou num
+# flush) é buscada na tabela, então perder o cache não desfaz revogações.
+# Com um cache local (LocMemCache) cada processo guarda uma cópia da tabela,
+# recarregada a cada AUTH_REVOCATION_REFRESH segundos: revogações de outros
+# processos valem depois desse intervalo.
+
+def revocations_in_cache():
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+class RevocationList:
+    """
+    Cópia local das revogações ainda válidas (chave -> revoked_at). A tabela é
+    lida no máximo uma vez por intervalo, não a cada requisição; o que este
+    processo revoga entra na hora.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._loaded_at = None
+
+    def get_many(self, keys):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= settings.AUTH_REVOCATION_REFRESH:
+                # Sempre no principal: uma réplica atrasada deixaria passar um token recém-revogado.
+                self._entries = dict(
+                    RevokedToken.objects.using(DEFAULT_DB_ALIAS)
+                    .filter(expires_at__gt=datetime.now(timezone.utc))
+                    .values_list('key', 'revoked_at')
+                )
+                self._loaded_at = time.monotonic()
+            return {key: self._entries[key] for key in keys if key in self._entries}
+
+    def add(self, key, revoked_at):
+        with self._lock:
+            self._entries[key] = revoked_at
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._loaded_at = None
+
+
+local_revocations = RevocationList()
+
+
+def _denied_key(jti):
+    return f'jwt-denied:{jti}'
+
+
+def _revoked_after_key(user_id):
+    return f'jwt-revoked-after:{user_id}'
+
+
+def _revoke(key, revoked_at, timeout):
+    now = datetime.now(timezone.utc)
+    # Revogações vencidas não servem para mais nada.
+    RevokedToken.objects.filter(expires_at__lte=now).delete()
+    # Upsert numa query só (INSERT ... ON CONFLICT).
+    RevokedToken.objects.bulk_create(
+        [RevokedToken(key=key, revoked_at=revoked_at, expires_at=now + timedelta(seconds=timeout))],
+        update_conflicts=True, unique_fields=['key'], update_fields=['revoked_at', 'expires_at'],
+    )
+    if revocations_in_cache():
+        get_cache().set(key, revoked_at, timeout)
+    else:
+        local_revocations.add(key, revoked_at)
+
+
+def revoke_token(token):
+    now = int(datetime.now(timezone.utc).timestamp())
+    remaining = token['exp'] - now
+    if remaining > 0:
+        _revoke(_denied_key(token['jti']), now, remaining)
+
+
+def revoke_user_tokens(user_id):
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME
+    _revoke(_revoked_after_key(user_id), int(datetime.now(timezone.utc).timestamp()), int(lifetime.total_seconds()))
+
+
+# Valor guardado no cache para "a tabela não tem esta revogação".
+NOT_REVOKED = 'not-revoked'
+
+
+def _cached_revocations(keys, expires_at):
+    cache = get_cache()
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = datetime.now(timezone.utc)
+        rows = (
+            RevokedToken.objects.using(DEFAULT_DB_ALIAS)
+            .filter(key__in=missing, expires_at__gt=now).values_list('key', 'revoked_at', 'expires_at')
+        )
+        for key, revoked_at, row_expires_at in rows:
+            found[key] = revoked_at
+            cache.set(key, revoked_at, max(1, int((row_expires_at - now).total_seconds())))
+        # add, não set: se uma revogação foi gravada depois da leitura da
+        # tabela, a entrada dela no cache não é sobrescrita.
+        timeout = max(1, expires_at - int(now.timestamp()))
+        for key in missing:
+            if key not in found:
+                cache.add(key, NOT_REVOKED, timeout)
+    return {key: value for key, value in found.items() if value != NOT_REVOKED}
+
+
+def is_token_revoked(token):
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    keys = [_denied_key(token['jti']), _revoked_after_key(user_id)]
+    if revocations_in_cache():
+        found = _cached_revocations(keys, token['exp'])
+    else:
+        found = local_revocations.get_many(keys)
+    if found.get(keys[0]) is not None:
+        return True
+    revoked_after = found.get(keys[1])
+    return revoked_after is not None and token.get('iat', 0) <= revoked_after
+
+
+# Usuário para os poucos casos que precisam dele. O cache guarda só os campos
+# de perfil: o hash da senha não sai do banco (os outros campos, se lidos,
+# são carregados sob demanda).
+CACHED_USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'phone_number', 'is_active')
+
+
+def _user_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def get_cached_user(user_id):
+    cache = get_cache()
+    user = cache.get(_user_key(user_id))
+    if user is None:
+        user = User.objects.only(*CACHED_USER_FIELDS).filter(pk=user_id).first()
+        if user is not None:
+            cache.set(_user_key(user_id), user, settings.AUTH_USER_CACHE_TIMEOUT)
+    return user
+
+
+def forget_cached_user(user_id):
+    get_cache().delete(_user_key(user_id))
+
+
+class ApiTokenUser(TokenUser):
+    """
+    Usuário montado só a partir do token: id e papel vêm dos claims.
+    `user` carrega o User completo (com cache curto) quando realmente preciso.
+    """
+
+    @cached_property
+    def id(self):
+        # O simplejwt grava o user_id como string; a chave primária é inteira.
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def role(self):
+        role = self.token.get('role')
+        if role is None:
+            # Token emitido antes do claim existir.
+            user = self.user
+            role = user.role if user is not None else None
+        return role
+
+    @cached_property
+    def user(self):
+        return get_cached_user(self.id)
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Autentica pelo JWT sem consultar a tabela de usuários. Tokens revogados
+    são recusados (veja is_token_revoked).
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_token_revoked(token):
+            raise InvalidToken({"detail": "O token foi revogado.", "code": "token_revoked"})
+        return token
@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .routers import mark_recent_write
+
+
+RESTAURANT_LIST_SCOPE = 'public-restaurants'
+# Resultados da busca e o índice em memória de api/search.py.
+SEARCH_SCOPE = 'search'
+
+
+def menu_scope(restaurant_id):
+    return f'public-menu:{restaurant_id}'
+
+
+def get_cache():
+    return caches[settings.PUBLIC_CACHE_ALIAS]
+
+
+def get_version(scope):
+    """
+    Retorna a versão atual de um escopo de cache. A versão faz parte das chaves
+    e do ETag, então invalidar é só trocar a versão: as entradas antigas deixam
+    de ser lidas e expiram sozinhas.
+    """
+    cache = get_cache()
+    version = cache.get(f'version:{scope}')
+    if version is None:
+        cache.add(f'version:{scope}', str(time.time_ns()), None)
+        version = cache.get(f'version:{scope}')
+    return version
+
+
+async def aget_version(scope):
+    cache = get_cache()
+    version = await cache.aget(f'version:{scope}')
+    if version is None:
+        await cache.aadd(f'version:{scope}', str(time.time_ns()), None)
+        version = await cache.aget(f'version:{scope}')
+    return version
+
+
+def bump_version(scope):
+    get_cache().set(f'version:{scope}', str(time.time_ns()), None)
+    # A próxima leitura repopula o cache: precisa vir do principal, não da réplica.
+    mark_recent_write(f'scope:{scope}')
+
+
+def _driver_order_key(order_id):
+    return f'order-driver:{order_id}'
+
+
+class HitMissCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+driver_auth_stats = HitMissCounter()
+
+
+def is_driver_order_allowed(driver_id, order_id):
+    """
+    Verifica no cache se o pedido está em entrega com este entregador.
+    Retorna False em caso de miss: quem chama deve confirmar no banco.
+    """
+    allowed = get_cache().get(_driver_order_key(order_id)) == driver_id
+    driver_auth_stats.record(allowed)
+    return allowed
+
+
+async def ais_driver_order_allowed(driver_id, order_id):
+    allowed = await get_cache().aget(_driver_order_key(order_id)) == driver_id
+    driver_auth_stats.record(allowed)
+    return allowed
+
+
+def allow_driver_order(driver_id, order_id):
+    get_cache().set(_driver_order_key(order_id), driver_id, settings.DRIVER_AUTH_CACHE_TIMEOUT)
+
+
+async def aallow_driver_order(driver_id, order_id):
+    await get_cache().aset(_driver_order_key(order_id), driver_id, settings.DRIVER_AUTH_CACHE_TIMEOUT)
+
+
+def forget_driver_order(order_id):
+    get_cache().delete(_driver_order_key(order_id))
+
+
+def response_digest(version, request):
+    # A URL completa inclui o cursor da paginação.
+    return hashlib.sha1(f'{version}:{request.build_absolute_uri()}'.encode()).hexdigest()
+
+
+def response_key(scope, digest):
+    return f'response:{scope}:{digest}'
+
+
+class CachedListMixin:
+    """
+    Cache read-through para listagens públicas. Subclasses informam o escopo
+    em get_cache_scope(); a resposta é guardada por URL completa (inclui o
+    cursor da paginação) e recebe um ETag para que clientes com
+    If-None-Match recebam 304 sem tocar no banco nem serializar nada.
+    """
+
+    def get_cache_scope(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        scope = self.get_cache_scope()
+        digest = response_digest(get_version(scope), request)
+        etag = f'"{digest}"'
+
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        cache = get_cache()
+        key = response_key(scope, digest)
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, settings.PUBLIC_CACHE_TIMEOUT)
+        return Response(data, headers={'ETag': etag})
@@ -0,0 +1,238 @@
+"""
+Despacho em lote (DISPATCH_MODE=batch): a cada DISPATCH_BATCH_INTERVAL
+segundos os pedidos prontos sem entregador são casados com os entregadores
+livres do índice de api/geo.py, minimizando a distância total até os
+restaurantes, em vez de cada entregador disputar o pedido no claim.
+"""
+import functools
+import importlib.util
+import logging
+import os
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import allow_driver_order
+from .geo import get_driver_index
+from .models import Order, User
+from .streams import driver_order_changes, restaurant_order_changes
+
+logger = logging.getLogger(__name__)
+
+# Custo dos pares fora do raio na matriz do solver: maior que qualquer soma de distâncias reais.
+INFEASIBLE = 1e9
+
+
+def candidate_pairs(orders, index, k, max_radius_km):
+    """
+    Para cada pedido [(order_id, lat, lng)], os `k` entregadores livres mais
+    próximos no índice. Retorna [(distância_km, order_id, driver_id)].
+    """
+    return [
+        (distance, order_id, driver_id)
+        for order_id, lat, lng in orders
+        for distance, driver_id in index.nearest(lat, lng, k, max_radius_km)
+    ]
+
+
+def solve_greedy(pairs):
+    """Pega os pares do mais curto ao mais longo, pulando pedidos e entregadores já usados."""
+    used_orders, used_drivers, assignment = set(), set(), []
+    for distance, order_id, driver_id in sorted(pairs):
+        if order_id in used_orders or driver_id in used_drivers:
+            continue
+        used_orders.add(order_id)
+        used_drivers.add(driver_id)
+        assignment.append((distance, order_id, driver_id))
+    return assignment
+
+
+@functools.cache
+def optimal_solver_available():
+    """
+    Se o SciPy (opcional; sem ele o casamento é guloso) está instalado. Só
+    procura o pacote: o SciPy é importado na primeira rodada que o usar, não
+    na inicialização do worker (api/views.py importa este módulo).
+    """
+    return importlib.util.find_spec('scipy') is not None
+
+
+def solve_optimal(pairs):
+    """
+    Casamento de custo mínimo (linear_sum_assignment do SciPy) sobre os
+    pares candidatos. Pares fora da lista custam INFEASIBLE, então o solver
+    primeiro maximiza o número de pedidos atendidos e depois minimiza a
+    distância total.
+    """
+    import numpy
+    from scipy.optimize import linear_sum_assignment
+
+    order_ids = sorted({order_id for _, order_id, _ in pairs})
+    driver_ids = sorted({driver_id for _, _, driver_id in pairs})
+    if not order_ids:
+        return []
+    rows = {order_id: i for i, order_id in enumerate(order_ids)}
+    columns = {driver_id: j for j, driver_id in enumerate(driver_ids)}
+    cost = numpy.full((len(order_ids), len(driver_ids)), INFEASIBLE)
+    row_index = numpy.fromiter((rows[order_id] for _, order_id, _ in pairs), dtype=numpy.intp, count=len(pairs))
+    column_index = numpy.fromiter((columns[driver_id] for _, _, driver_id in pairs), dtype=numpy.intp, count=len(pairs))
+    cost[row_index, column_index] = numpy.fromiter((distance for distance, _, _ in pairs), dtype=float, count=len(pairs))
+
+    matched_rows, matched_columns = linear_sum_assignment(cost)
+    return [
+        (float(cost[i, j]), order_ids[i], driver_ids[j])
+        for i, j in zip(matched_rows, matched_columns) if cost[i, j] < INFEASIBLE
+    ]
+
+
+def solve(pairs, method='auto'):
+    """`method`: 'optimal' (exige SciPy), 'greedy' ou 'auto' (optimal se o SciPy estiver instalado)."""
+    if method == 'auto':
+        method = 'optimal' if optimal_solver_available() else 'greedy'
+    if method == 'optimal':
+        if not optimal_solver_available():
+            raise RuntimeError("O despacho ótimo precisa do SciPy (pip install scipy).")
+        return solve_optimal(pairs)
+    return solve_greedy(pairs)
+
+
+def _reserve_driver(driver_id):
+    # Um entregador pode estar livre no índice de mais de um worker; com um
+    # cache compartilhado só a primeira rodada o recebe.
+    return cache.add(f'dispatch-driver:{driver_id}', True, settings.DISPATCH_BATCH_INTERVAL * 2)
+
+
+def _release_driver(driver_id):
+    cache.delete(f'dispatch-driver:{driver_id}')
+
+
+def release_driver(driver_id):
+    """Entrega encerrada: o entregador volta livre ao índice e já pode entrar na próxima rodada."""
+    get_driver_index().mark_idle(driver_id)
+    _release_driver(driver_id)
+
+
+def run_dispatch_round(index=None, method='auto'):
+    """
+    Uma rodada: casa os pedidos pendentes com os entregadores livres e grava
+    as atribuições numa única transação. Cada UPDATE só pega o pedido se ele
+    ainda estiver sem entregador, então um claim simultâneo vence sem
+    conflito, e só depois de travar a linha do entregador e conferir que ele
+    não tem outra entrega. Retorna [(distância_km, order_id, driver_id)] das atribuições feitas.
+    """
+    if index is None:
+        index = get_driver_index()
+    orders = list(
+        Order.objects.filter(
+            status='out_for_delivery', driver=None,
+            restaurant__latitude__isnull=False, restaurant__longitude__isnull=False,
+        ).order_by('created_at', 'id')
+        .values_list('id', 'restaurant_id', 'restaurant__latitude', 'restaurant__longitude')
+        [:settings.DISPATCH_BATCH_MAX_ORDERS]
+    )
+    if not orders or not len(index):
+        return []
+    restaurants = {order_id: restaurant_id for order_id, restaurant_id, _, _ in orders}
+    pairs = candidate_pairs(
+        [(order_id, lat, lng) for order_id, _, lat, lng in orders], index,
+        settings.DISPATCH_BATCH_CANDIDATES, settings.DISPATCH_RADIUS_KM,
+    )
+    # O índice pode estar atrasado (claim feito em outro worker): quem já tem
+    # um pedido em entrega fica fora da rodada.
+    busy = set(
+        Order.objects.filter(status='out_for_delivery', driver_id__in={driver_id for _, _, driver_id in pairs})
+        .values_list('driver_id', flat=True)
+    )
+    for driver_id in busy:
+        index.mark_busy(driver_id)
+    pairs = [pair for pair in pairs if pair[2] not in busy]
+
+    assigned = []
+    now = timezone.now()
+    with transaction.atomic():
+        # Em ordem de entregador, para que duas rodadas não travem em ordens opostas.
+        for distance, order_id, driver_id in sorted(solve(pairs, method), key=lambda pair: pair[2]):
+            if not _reserve_driver(driver_id):
+                continue
+            # O cache pode ser local: a garantia de um pedido por entregador vem
+            # do lock na linha dele. Uma rodada concorrente espera aqui e relê o
+            # estado depois do commit da outra.
+            list(User.objects.select_for_update().filter(pk=driver_id).values_list('pk'))
+            busy = Order.objects.filter(status='out_for_delivery', driver_id=driver_id).exists()
+            if not busy and Order.objects.filter(pk=order_id, status='out_for_delivery', driver__isnull=True).update(
+                driver_id=driver_id, updated_at=now
+            ):
+                assigned.append((distance, order_id, driver_id))
+            else:
+                # Pedido levado por um claim ou entregador já ocupado: fica livre para a próxima rodada.
+                _release_driver(driver_id)
+
+    # Como no claim, o UPDATE não dispara signals.
+    for _, order_id, driver_id in assigned:
+        index.mark_busy(driver_id)
+        allow_driver_order(driver_id, order_id)
+        driver_order_changes.notify(driver_id)
+        restaurant_order_changes.notify(restaurants[order_id])
+    return assigned
+
+
+class BatchDispatcher:
+    """
+    Thread que roda run_dispatch_round a cada `interval` segundos no processo
+    que tem o índice. Criada sob demanda e recriada após um fork, como a
+    thread do LocationBuffer.
+    """
+
+    def __init__(self, interval, method='auto'):
+        self.interval = interval
+        self.method = method
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def ensure_running(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='batch-dispatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # Espalha as rodadas dos workers para não consultarem o banco ao mesmo tempo.
+        while not self._stop.wait(self.interval * random.uniform(0.9, 1.1)):
+            try:
+                close_old_connections()
+                assigned = run_dispatch_round(method=self.method)
+                if assigned:
+                    logger.info("Despacho em lote: %d pedidos atribuídos.", len(assigned))
+            except Exception:
+                logger.exception("Falha na rodada de despacho; tentando de novo na próxima.")
+            finally:
+                close_old_connections()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def ensure_batch_dispatcher():
+    """Liga a thread de despacho se DISPATCH_MODE=batch; chamada quando um entregador fica livre."""
+    global _dispatcher
+    if settings.DISPATCH_MODE != 'batch':
+        return
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = BatchDispatcher(settings.DISPATCH_BATCH_INTERVAL, settings.DISPATCH_SOLVER)
+    _dispatcher.ensure_running()
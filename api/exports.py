@@ -0,0 +1,121 @@
+"""
+Exportação do histórico de pedidos em streaming (NDJSON ou CSV). Os pedidos
+são lidos com .iterator() em linhas planas (values_list) e os itens de cada
+bloco de ORDER_EXPORT_CHUNK_SIZE pedidos vêm numa única consulta, então a
+memória usada não depende do tamanho do histórico.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import groupby, islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+ORDER_FIELDS = (
+    'id', 'created_at', 'updated_at', 'status', 'total_price', 'delivery_address',
+    'customer__username', 'driver__username',
+)
+ORDER_KEYS = ('id', 'created_at', 'updated_at', 'status', 'total_price', 'delivery_address', 'customer', 'driver')
+CSV_HEADER = ORDER_KEYS + ('items',)
+
+
+def day_range(start=None, end=None):
+    """Filtro de created_at para os dias [start, end] (inclusive), no fuso do projeto."""
+    lookup = {}
+    if start is not None:
+        lookup['created_at__gte'] = timezone.make_aware(datetime.combine(start, time.min))
+    if end is not None:
+        lookup['created_at__lt'] = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return lookup
+
+
+def iter_orders(restaurant_id, start=None, end=None, using=None):
+    """Gera (pedido, itens) com o pedido como dict plano e os itens como lista de dicts."""
+    chunk_size = settings.ORDER_EXPORT_CHUNK_SIZE
+    rows = (
+        Order.objects.using(using).filter(restaurant_id=restaurant_id, **day_range(start, end))
+        .order_by('id').values_list(*ORDER_FIELDS).iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        items = (
+            OrderItem.objects.using(using).filter(order_id__in=[row[0] for row in chunk])
+            .order_by('order_id', 'id').values_list('order_id', 'menu_item_id', 'name', 'unit_price', 'quantity')
+        )
+        by_order = {
+            order_id: [
+                {'menu_item': menu_item_id, 'name': name, 'unit_price': str(unit_price), 'quantity': quantity}
+                for _, menu_item_id, name, unit_price, quantity in group
+            ]
+            for order_id, group in groupby(items, key=lambda item: item[0])
+        }
+        for row in chunk:
+            yield dict(zip(ORDER_KEYS, row)), by_order.get(row[0], [])
+
+
+class Echo:
+    """Arquivo falso do csv.writer: devolve a linha em vez de guardá-la (CSV em streaming)."""
+
+    def write(self, value):
+        return value
+
+
+def export_orders(restaurant_id, file_format, start=None, end=None, using=None):
+    """
+    Gera o histórico em pedaços de texto, uma linha por pedido, em NDJSON
+    ou CSV. Cada pedaço junta ORDER_EXPORT_CHUNK_SIZE linhas, para que o
+    servidor não faça uma escrita por pedido.
+    """
+    orders = iter_orders(restaurant_id, start, end, using)
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        lines = (writer.writerow(_csv_row(order, items)) for order, items in orders)
+        yield writer.writerow(CSV_HEADER)
+    else:
+        lines = (_ndjson_line(order, items) for order, items in orders)
+    while True:
+        chunk = ''.join(islice(lines, settings.ORDER_EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _csv_row(order, items):
+    summary = '; '.join(f"{item['quantity']}x {item['name']}" for item in items)
+    return [
+        order['id'], order['created_at'].isoformat(), order['updated_at'].isoformat(), order['status'],
+        order['total_price'], order['delivery_address'], order['customer'] or '', order['driver'] or '', summary,
+    ]
+
+
+def _ndjson_line(order, items):
+    order.update(
+        created_at=order['created_at'].isoformat(), updated_at=order['updated_at'].isoformat(),
+        total_price=str(order['total_price']), items=items,
+    )
+    return json.dumps(order, ensure_ascii=False) + '\n'
+
+
+def streaming_content(request, chunks):
+    """
+    Conteúdo para o StreamingHttpResponse. Sob ASGI o Django consome um
+    iterador síncrono com sync_to_async(list), montando o arquivo inteiro em
+    memória; lá os pedaços são puxados um a um por um gerador assíncrono.
+    """
+    if isinstance(request, ASGIRequest):
+        return _async_chunks(chunks)
+    return chunks
+
+
+async def _async_chunks(chunks):
+    # thread_sensitive: o .iterator() continua na conexão da thread da view.
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
@@ -0,0 +1,33 @@
+import os
+import threading
+
+from django.conf import settings
+
+_app = None
+_lock = threading.Lock()
+
+
+def get_firebase_app():
+    """
+    Inicializa o Firebase na primeira vez que for usado. O firebase_admin (e
+    o grpc e as bibliotecas do Google Cloud que ele carrega) só é importado
+    aqui, então processos que não falam com o Firebase, como comandos do
+    manage.py, não pagam esse custo na inicialização.
+    """
+    global _app
+    if _app is None:
+        with _lock:
+            if _app is None:
+                import firebase_admin
+                from firebase_admin import credentials
+
+                cred = credentials.Certificate(os.path.join(settings.BASE_DIR, settings.FIREBASE_CREDENTIALS_PATH))
+                _app = firebase_admin.initialize_app(cred, {
+                    'databaseURL': settings.FIREBASE_DATABASE_URL
+                })
+    return _app
+
+
+def get_database_reference(path='/'):
+    from firebase_admin import db
+    return db.reference(path, app=get_firebase_app())
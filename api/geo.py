@@ -0,0 +1,187 @@
+"""
+Índice espacial em memória das últimas posições dos entregadores, usado no
+despacho (entregadores livres mais próximos de um restaurante). É por
+processo, como o hub de eventos de api/streams.py: cada worker conhece os
+entregadores que falaram com ele recentemente.
+"""
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lng, radius_km):
+    """(lat_min, lat_max, lng_min, lng_max) que contém o círculo; serve de pré-filtro no banco."""
+    dlat = radius_km / KM_PER_DEGREE
+    # Perto dos polos o grau de longitude encolhe; limita para não dividir por zero.
+    dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+class DriverIndex:
+    """
+    Grade de células de `cell_deg` graus. Cada entregador fica na célula da
+    última posição; uma busca visita só as células que cobrem o raio e mede
+    a distância exata dos candidatos. Posições mais velhas que `ttl`
+    segundos são ignoradas (o entregador fechou o app ou mudou de worker).
+    """
+
+    def __init__(self, cell_deg, ttl):
+        self.cell_deg = cell_deg
+        self.ttl = ttl
+        self._drivers = {}  # driver_id -> (lat, lng, idle, visto em)
+        self._cells = {}  # (linha, coluna) -> {driver_id}
+        self._lock = threading.Lock()
+        self._next_prune = time.monotonic() + ttl
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def __len__(self):
+        return len(self._drivers)
+
+    def update(self, driver_id, lat, lng, idle):
+        cell = self._cell(lat, lng)
+        with self._lock:
+            previous = self._drivers.get(driver_id)
+            if previous is not None:
+                old_cell = self._cell(previous[0], previous[1])
+                if old_cell != cell:
+                    self._discard(old_cell, driver_id)
+            now = time.monotonic()
+            self._drivers[driver_id] = (lat, lng, idle, now)
+            self._cells.setdefault(cell, set()).add(driver_id)
+        # Limpeza preguiçosa: no máximo uma varredura por `ttl` segundos.
+        if now >= self._next_prune:
+            self.prune()
+
+    def mark_busy(self, driver_id):
+        with self._lock:
+            entry = self._drivers.get(driver_id)
+            if entry is not None:
+                self._drivers[driver_id] = (entry[0], entry[1], False, entry[3])
+
+    def mark_idle(self, driver_id):
+        with self._lock:
+            entry = self._drivers.get(driver_id)
+            if entry is not None:
+                self._drivers[driver_id] = (entry[0], entry[1], True, entry[3])
+
+    def remove(self, driver_id):
+        with self._lock:
+            entry = self._drivers.pop(driver_id, None)
+            if entry is not None:
+                self._discard(self._cell(entry[0], entry[1]), driver_id)
+
+    def prune(self):
+        """Remove as posições expiradas. Retorna quantas saíram."""
+        now = time.monotonic()
+        cutoff = now - self.ttl
+        with self._lock:
+            self._next_prune = now + self.ttl
+            stale = [driver_id for driver_id, entry in self._drivers.items() if entry[3] < cutoff]
+            for driver_id in stale:
+                entry = self._drivers.pop(driver_id)
+                self._discard(self._cell(entry[0], entry[1]), driver_id)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._drivers.clear()
+            self._cells.clear()
+
+    def _discard(self, cell, driver_id):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(driver_id)
+            if not members:
+                del self._cells[cell]
+
+    def within(self, lat, lng, radius_km, idle_only=True):
+        """[(distância_km, driver_id)] dos entregadores até `radius_km`, do mais perto ao mais longe."""
+        return sorted(self._scan(lat, lng, radius_km, idle_only))
+
+    def nearest(self, lat, lng, k, max_radius_km=None, idle_only=True):
+        """
+        Os `k` entregadores mais próximos, como [(distância_km, driver_id)].
+        O raio começa em uma célula e dobra até achar `k` candidatos: todo
+        entregador dentro do raio varrido foi visto, então os `k` primeiros
+        são exatos.
+        """
+        if max_radius_km is None:
+            max_radius_km = settings.DISPATCH_MAX_RADIUS_KM
+        radius = self.cell_deg * KM_PER_DEGREE
+        while True:
+            radius = min(radius, max_radius_km)
+            found = self._scan(lat, lng, radius, idle_only)
+            if len(found) >= k or radius >= max_radius_km:
+                return heapq.nsmallest(k, found)
+            radius *= 2
+
+    def _scan(self, lat, lng, radius_km, idle_only):
+        lat_min, lat_max, lng_min, lng_max = bounding_box(lat, lng, radius_km)
+        row_min, col_min = self._cell(lat_min, lng_min)
+        row_max, col_max = self._cell(lat_max, lng_max)
+        cutoff = time.monotonic() - self.ttl
+        found = []
+        with self._lock:
+            cells = self._cells
+            drivers = self._drivers
+            # Com poucos entregadores é mais barato olhar as células ocupadas do que varrer a grade.
+            if (row_max - row_min + 1) * (col_max - col_min + 1) > len(cells):
+                candidates = (
+                    members for (row, col), members in cells.items()
+                    if row_min <= row <= row_max and col_min <= col <= col_max
+                )
+            else:
+                candidates = (
+                    cells[(row, col)] for row in range(row_min, row_max + 1)
+                    for col in range(col_min, col_max + 1) if (row, col) in cells
+                )
+            for members in candidates:
+                for driver_id in members:
+                    d_lat, d_lng, idle, seen = drivers[driver_id]
+                    if seen < cutoff or (idle_only and not idle):
+                        continue
+                    distance = haversine_km(lat, lng, d_lat, d_lng)
+                    if distance <= radius_km:
+                        found.append((distance, driver_id))
+        return found
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_driver_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DriverIndex(settings.DISPATCH_GRID_CELL_DEG, settings.DISPATCH_DRIVER_TTL)
+    return _index
+
+
+def reset_driver_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting in ('DISPATCH_GRID_CELL_DEG', 'DISPATCH_DRIVER_TTL'):
+        reset_driver_index()
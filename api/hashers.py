@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, PBKDF2SHA1PasswordHasher, ScryptPasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Muitos logins simultâneos. Tente novamente em instantes."
+    default_code = 'hashing_busy'
+
+
+class HashingPool:
+    """
+    Pool limitado para o cálculo de hashes de senha. No máximo `workers`
+    hashes rodam ao mesmo tempo (o scrypt libera o GIL) e no máximo
+    `max_pending` esperam na fila; além disso a requisição recebe 503 em vez
+    de disputar CPU com o resto da API.
+    O limite é por processo e a thread da requisição espera o resultado: ele
+    só protege as demais requisições quando o processo atende várias ao mesmo
+    tempo (workers gthread ou ASGI). Com workers síncronos cada processo faz
+    um login por vez e o pool não limita nada.
+    """
+
+    def __init__(self, workers, max_pending, timeout):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def run(self, func, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool, _pool_pid
+    # Recriado após um fork: as threads do processo pai não existem no filho.
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = HashingPool(
+                    settings.PASSWORD_HASHING_WORKERS,
+                    settings.PASSWORD_HASHING_MAX_PENDING,
+                    settings.PASSWORD_HASHING_TIMEOUT,
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    global _pool
+    if setting.startswith('PASSWORD_HASHING_'):
+        with _pool_lock:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = None
+
+
+class BoundedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    Scrypt (memory-hard) com custo ajustável via settings e cálculo no
+    HashingPool. Hashes com parâmetros antigos, ou de outros algoritmos
+    (PBKDF2), são refeitos com os atuais no próximo login.
+    """
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = get_hashing_pool().run(_scrypt, password, salt, n, r, p)
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
+
+
+class BoundedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 dos hashes antigos, só verificados até o login seguinte os refazer
+    em scrypt. O cálculo também passa pelo HashingPool: senão uma rajada de
+    logins de contas antigas escaparia do limite.
+    """
+
+    def encode(self, password, salt, iterations=None):
+        return get_hashing_pool().run(super().encode, password, salt, iterations)
+
+
+class BoundedPBKDF2SHA1PasswordHasher(PBKDF2SHA1PasswordHasher):
+    def encode(self, password, salt, iterations=None):
+        return get_hashing_pool().run(super().encode, password, salt, iterations)
+
+
+def _scrypt(password, salt, n, r, p):
+    # O scrypt usa cerca de 128 * r * (n + p) bytes; o limite padrão do OpenSSL
+    # (32 MiB) não comporta custos maiores, então o limite acompanha os parâmetros.
+    return hashlib.scrypt(
+        password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=n * r * p * 128 * 2, dklen=64
+    )
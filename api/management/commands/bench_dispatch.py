@@ -0,0 +1,145 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.authentication import RoleRefreshToken
+from api.geo import DriverIndex, haversine_km
+from api.models import User, Restaurant, Order
+from .bench_login_storm import percentiles
+
+# Região usada para as posições sintéticas (aprox. a cidade de São Paulo).
+LAT_RANGE = (-23.75, -23.35)
+LNG_RANGE = (-46.85, -46.35)
+
+
+def random_point(rng):
+    return rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o despacho geográfico: consultas dos k entregadores livres mais próximos no índice "
+        "em memória (contra uma varredura linear) e a rota de pedidos disponíveis por raio, com "
+        "os pedidos gravados numa transação desfeita no final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=10000)
+        parser.add_argument('--orders', type=int, default=5000, help="Pedidos prontos para entrega.")
+        parser.add_argument('--restaurants', type=int, default=500)
+        parser.add_argument('--k', type=int, default=5, help="Entregadores pedidos em cada consulta.")
+        parser.add_argument('--queries', type=int, default=2000, help="Consultas medidas no índice.")
+        parser.add_argument('--requests', type=int, default=100, help="Requisições medidas em cada variante da rota.")
+        parser.add_argument('--radius', type=float, default=5.0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        results = {'index': self.measure_index(rng, options)}
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        try:
+            with override_settings(ALLOWED_HOSTS=allowed_hosts), transaction.atomic():
+                cache.clear()
+                results['endpoint'] = self.measure_endpoint(rng, options)
+                transaction.set_rollback(True)
+        finally:
+            cache.clear()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        index = results['index']
+        self.stdout.write(
+            f"índice: {options['drivers']} entregadores, {index['updates_per_second']:.0f} atualizações/s"
+        )
+        self.stdout.write(f"{'consulta':<28} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}")
+        for name in ('nearest', 'linear_scan'):
+            self.write_row(name, index[name])
+        for name, row in results['endpoint'].items():
+            self.write_row(name, row, row['queries_per_request'])
+
+    def write_row(self, name, row, queries='-'):
+        self.stdout.write(f"{name:<28} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {queries:>8}")
+
+    def measure_index(self, rng, options):
+        index = DriverIndex(settings.DISPATCH_GRID_CELL_DEG, settings.DISPATCH_DRIVER_TTL)
+        positions = {}
+        started = time.perf_counter()
+        for driver_id in range(options['drivers']):
+            lat, lng = random_point(rng)
+            # Um em cada quatro está em entrega.
+            index.update(driver_id, lat, lng, idle=driver_id % 4 != 0)
+            positions[driver_id] = (lat, lng, driver_id % 4 != 0)
+        updates_per_second = options['drivers'] / (time.perf_counter() - started)
+
+        points = [random_point(rng) for _ in range(options['queries'])]
+        nearest = []
+        for lat, lng in points:
+            start = time.perf_counter()
+            index.nearest(lat, lng, options['k'])
+            nearest.append((time.perf_counter() - start) * 1000)
+
+        # Referência: calcular a distância de todos os entregadores livres.
+        linear = []
+        for lat, lng in points[:max(options['queries'] // 10, 2)]:
+            start = time.perf_counter()
+            sorted(
+                (haversine_km(lat, lng, d_lat, d_lng), driver_id)
+                for driver_id, (d_lat, d_lng, idle) in positions.items() if idle
+            )[:options['k']]
+            linear.append((time.perf_counter() - start) * 1000)
+
+        return {
+            'updates_per_second': round(updates_per_second),
+            'nearest': percentiles(nearest),
+            'linear_scan': percentiles(linear),
+        }
+
+    def measure_endpoint(self, rng, options):
+        owners = User.objects.bulk_create(
+            User(username=f'bench-geo-dono-{i}', role='owner') for i in range(options['restaurants'])
+        )
+        customer = User.objects.create_user(username='bench-geo-cliente', role='customer')
+        driver = User.objects.create_user(username='bench-geo-entregador', role='driver')
+        locations = [random_point(rng) for _ in owners]
+        restaurants = Restaurant.objects.bulk_create(
+            Restaurant(owner=owner, name=f'Restaurante {i}', address='Rua', phone='11', latitude=lat, longitude=lng)
+            for i, (owner, (lat, lng)) in enumerate(zip(owners, locations))
+        )
+        Order.objects.bulk_create(
+            Order(customer=customer, restaurant=rng.choice(restaurants), status='out_for_delivery',
+                  total_price=Decimal('30.00'), delivery_address='Rua B')
+            for _ in range(options['orders'])
+        )
+
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {RoleRefreshToken.for_user(driver).access_token}')
+        url = reverse('driver-available-orders')
+        variants = {
+            'available-orders': lambda: {},
+            'available-orders-nearby': lambda: dict(zip(('lat', 'lng'), random_point(rng)), radius=options['radius']),
+        }
+        results = {}
+        for name, params in variants.items():
+            client.get(url, params())
+            timings = []
+            queries = []
+            for _ in range(options['requests']):
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    response = client.get(url, params())
+                    timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{name}: HTTP {response.status_code} {response.content[:200]!r}")
+                queries.append(len(ctx.captured_queries))
+            results[name] = {**percentiles(timings), 'queries_per_request': round(sum(queries) / len(queries), 2)}
+        return results
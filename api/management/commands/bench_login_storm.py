@@ -0,0 +1,178 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from api.models import User
+
+PASSWORD = 'senha-benchmark-123'
+USERNAME = 'bench-storm-cliente'
+
+
+def percentiles(timings):
+    if len(timings) < 2:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    points = statistics.quantiles(timings, n=100)
+    return {'p50_ms': round(points[49], 2), 'p95_ms': round(points[94], 2), 'p99_ms': round(points[98], 2)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Simula um pico de logins (POST /api/token/) e mede, ao mesmo tempo, a latência de um "
+        "endpoint barato. Compara o pool de hashing limitado com um pool do tamanho da tempestade. "
+        "Sem --server, tudo roda em threads deste processo; com --server, contra o Gunicorn com o "
+        "tipo de worker do deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help="Clientes fazendo login sem parar.")
+        parser.add_argument('--duration', type=float, default=5.0, help="Segundos de cada fase.")
+        parser.add_argument('--probe', default='public-restaurant-list', help="Nome da rota medida durante o pico.")
+        parser.add_argument('--modes', default='bounded,unbounded')
+        parser.add_argument(
+            '--server', choices=['wsgi', 'gthread', 'asgi'],
+            help="Sobe o Gunicorn neste modo (veja bench_servers; gthread e asgi são os do Dockerfile) "
+                 "e mede por HTTP. O pool de hashing é por processo: só com gthread ou asgi um login "
+                 "esperando por ele não prende o worker inteiro.",
+        )
+        parser.add_argument('--workers', type=int, default=2, help="Processos do Gunicorn (com --server).")
+        parser.add_argument('--worker-threads', type=int, default=8, help="Threads por processo no modo gthread.")
+        parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        # Os logins rodam em outras threads (outras conexões), então o usuário precisa estar gravado.
+        User.objects.filter(username=USERNAME).delete()
+        User.objects.create_user(username=USERNAME, password=PASSWORD, role='customer')
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=allowed_hosts):
+                results['idle'] = self.measure_phase(options, {}, storm_threads=0)
+                for mode in options['modes'].split(','):
+                    overrides = {}
+                    if mode == 'unbounded':
+                        overrides = {'PASSWORD_HASHING_WORKERS': options['threads'], 'PASSWORD_HASHING_MAX_PENDING': 0}
+                    results[mode] = self.measure_phase(options, overrides, storm_threads=options['threads'])
+        finally:
+            User.objects.filter(username=USERNAME).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'fase':<10} {'logins/s':>9} {'503':>6} {'login p95':>10} {'probe p50':>10} {'probe p95':>10} {'probe p99':>10}")
+        for phase, row in results.items():
+            login_p95 = row['login']['p95_ms']
+            self.stdout.write(
+                f"{phase:<10} {row['logins_per_second']:>9.1f} {row['rejected']:>6} "
+                f"{login_p95 if login_p95 is not None else '-':>10} "
+                f"{row['probe']['p50_ms']:>10} {row['probe']['p95_ms']:>10} {row['probe']['p99_ms']:>10}"
+            )
+
+    def measure_phase(self, options, overrides, storm_threads):
+        if options['server'] is None:
+            with override_settings(**overrides):
+                return self.measure(options, storm_threads)
+        # Importado aqui: bench_servers importa percentiles deste módulo.
+        from .bench_servers import run_server
+        env = {name: str(value) for name, value in overrides.items()}
+        with run_server(options['server'], options['workers'], options['worker_threads'], env) as base_url:
+            return asyncio.run(self.measure_server(base_url, options, storm_threads))
+
+    def measure(self, options, storm_threads):
+        stop = threading.Event()
+        lock = threading.Lock()
+        login_timings = []
+        rejected = []
+
+        def storm():
+            client = Client()
+            payload = {'username': USERNAME, 'password': PASSWORD}
+            try:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    response = client.post(reverse('token_obtain_pair'), payload, content_type='application/json')
+                    elapsed = (time.perf_counter() - start) * 1000
+                    with lock:
+                        if response.status_code == 200:
+                            login_timings.append(elapsed)
+                        else:
+                            rejected.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=storm) for _ in range(storm_threads)]
+        for worker in workers:
+            worker.start()
+
+        probe = Client()
+        url = reverse(options['probe'])
+        probe_timings = []
+        deadline = time.perf_counter() + options['duration']
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            probe.get(url)
+            probe_timings.append((time.perf_counter() - start) * 1000)
+
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+        return {
+            'logins_per_second': round(len(login_timings) / options['duration'], 1),
+            'rejected': len(rejected),
+            'login': percentiles(login_timings),
+            'probe': percentiles(probe_timings),
+        }
+
+    async def measure_server(self, base_url, options, storm_threads):
+        """Como measure, mas com os logins e a sonda chegando ao servidor por HTTP."""
+        # base_url termina em /api; reverse() já devolve o caminho com /api.
+        origin = base_url.removesuffix('/api')
+        login_timings = []
+        rejected = []
+        probe_timings = []
+        deadline = time.perf_counter() + options['duration']
+        limits = httpx.Limits(max_connections=storm_threads + 1)
+
+        async with httpx.AsyncClient(base_url=origin, limits=limits, timeout=60) as client:
+            async def storm():
+                payload = {'username': USERNAME, 'password': PASSWORD}
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        response = await client.post(reverse('token_obtain_pair'), json=payload)
+                    except httpx.HTTPError:
+                        rejected.append('erro')
+                        continue
+                    elapsed = (time.perf_counter() - start) * 1000
+                    if response.status_code == 200:
+                        login_timings.append(elapsed)
+                    else:
+                        rejected.append(response.status_code)
+
+            async def probe():
+                url = reverse(options['probe'])
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        await client.get(url)
+                    except httpx.HTTPError:
+                        continue
+                    probe_timings.append((time.perf_counter() - start) * 1000)
+
+            await asyncio.gather(probe(), *(storm() for _ in range(storm_threads)))
+
+        return {
+            'logins_per_second': round(len(login_timings) / options['duration'], 1),
+            'rejected': len(rejected),
+            'login': percentiles(login_timings),
+            'probe': percentiles(probe_timings),
+        }
@@ -0,0 +1,74 @@
+import json
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import User, Restaurant, MenuItem
+from api.views import OrderListCreateView
+
+
+class Command(BaseCommand):
+    help = "Mede queries e latência da criação de pedidos (POST /api/orders/) por tamanho de carrinho."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,20', help="Tamanhos de carrinho separados por vírgula.")
+        parser.add_argument('--repeat', type=int, default=20, help="Pedidos criados por tamanho de carrinho.")
+        parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        # Tudo roda dentro de uma transação desfeita no final: o banco não é alterado.
+        with transaction.atomic():
+            results = self.run(sizes, options['repeat'])
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'itens':>6} {'queries':>8} {'p50 (ms)':>10} {'máx (ms)':>10}")
+        for row in results:
+            self.stdout.write(f"{row['cart_size']:>6} {row['queries']:>8} {row['p50_ms']:>10.2f} {row['max_ms']:>10.2f}")
+
+    def run(self, sizes, repeat):
+        owner = User.objects.create_user(username='bench-dono', role='owner')
+        customer = User.objects.create_user(username='bench-cliente', role='customer')
+        restaurant = Restaurant.objects.create(owner=owner, name='Bench', address='Rua', phone='11')
+        menu_items = MenuItem.objects.bulk_create(
+            MenuItem(restaurant=restaurant, name=f'Item {i}', price=Decimal('12.50'))
+            for i in range(max(sizes))
+        )
+
+        view = OrderListCreateView.as_view()
+        factory = APIRequestFactory()
+        results = []
+        for size in sizes:
+            payload = {
+                'restaurant': restaurant.pk,
+                'delivery_address': 'Rua B, 2',
+                'items': [{'menu_item': item.pk, 'quantity': 1} for item in menu_items[:size]],
+            }
+            timings = []
+            queries = []
+            for _ in range(repeat):
+                request = factory.post('/api/orders/', payload, format='json')
+                force_authenticate(request, user=customer)
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    response = view(request)
+                    timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 201, response.data
+                queries.append(len(ctx.captured_queries))
+            results.append({
+                'cart_size': size,
+                'queries': max(queries),
+                'p50_ms': statistics.median(timings),
+                'max_ms': max(timings),
+            })
+        return results
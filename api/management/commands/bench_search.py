@@ -0,0 +1,186 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.models import User, Restaurant, MenuItem
+from api.search import build_search_index, normalize, search
+from .bench_login_storm import percentiles
+
+DISHES = (
+    'Pizza', 'Feijoada', 'Açaí', 'Pão de Queijo', 'Coxinha', 'Moqueca', 'Parmegiana', 'Estrogonofe',
+    'Picanha', 'Lasanha', 'Pastel', 'Tapioca', 'Brigadeiro', 'Pudim', 'Salada', 'Hambúrguer',
+    'Escondidinho', 'Baião de Dois', 'Galinhada', 'Yakisoba', 'Temaki', 'Risoto', 'Omelete', 'Cuscuz',
+    'Vatapá', 'Acarajé', 'Bobó', 'Quibe', 'Esfiha', 'Torta',
+)
+FLAVORS = (
+    'Calabresa', 'Frango', 'Carne', 'Camarão', 'Queijo', 'Catupiry', 'Bacon', 'Palmito', 'Cogumelos',
+    'Atum', 'Costela', 'Linguiça', 'Chocolate', 'Morango', 'Doce de Leite', 'Maracujá', 'Limão',
+    'Banana', 'Abóbora', 'Mandioca',
+)
+STYLES = ('Especial', 'da Casa', 'Tradicional', 'Grande', 'Individual', 'Caseiro', 'Vegano', 'Picante', 'Gratinado')
+INGREDIENTS = (
+    'tomate', 'cebola', 'alho', 'manjericão', 'orégano', 'azeite', 'requeijão', 'mussarela', 'presunto',
+    'ovo', 'milho', 'ervilha', 'batata palha', 'arroz', 'feijão', 'farofa', 'vinagrete', 'coentro',
+    'pimenta', 'leite de coco', 'gengibre', 'castanha', 'mel', 'canela', 'granola',
+)
+RESTAURANT_NAMES = ('Cantina', 'Lanchonete', 'Pizzaria', 'Sabor', 'Cozinha', 'Empório', 'Boteco', 'Bistrô', 'Casa')
+RESTAURANT_SUFFIXES = ('da Vovó', 'Mineiro', 'Baiano', 'do Zé', 'Paulista', 'Nordestino', 'Gaúcho', 'da Praça')
+
+
+def typo(word, rng):
+    # Troca duas letras vizinhas ou apaga uma: "pizza" -> "piza", "feijoada" -> "fejioada".
+    position = rng.randrange(1, len(word) - 1)
+    if rng.random() < 0.5:
+        return word[:position] + word[position + 1:]
+    return word[:position - 1] + word[position] + word[position - 1] + word[position + 1:]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a busca (api/search.py) sobre um cardápio sintético em português, gravado numa "
+        "transação desfeita no final: latência por tipo de consulta (palavra exata, sem acento, "
+        "prefixo, erro de digitação, duas palavras), a varredura com icontains como referência e "
+        "a rota /public/search/. No índice em memória, mede também o tempo de montagem."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100000)
+        parser.add_argument('--restaurants', type=int, default=1000)
+        parser.add_argument('--queries', type=int, default=200, help="Consultas medidas por tipo.")
+        parser.add_argument('--requests', type=int, default=100, help="Requisições medidas na rota.")
+        parser.add_argument(
+            '--backend', choices=('auto', 'postgres', 'memory'), default=settings.SEARCH_BACKEND,
+            help="Mesmo significado de SEARCH_BACKEND.",
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        if options['backend'] == 'postgres' and connection.vendor != 'postgresql':
+            raise CommandError("--backend postgres exige o PostgreSQL como banco.")
+        rng = random.Random(options['seed'])
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        try:
+            with override_settings(ALLOWED_HOSTS=allowed_hosts, SEARCH_BACKEND=options['backend']), transaction.atomic():
+                cache.clear()
+                results = self.measure(rng, options)
+                transaction.set_rollback(True)
+        finally:
+            cache.clear()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"backend: {results['backend']}, {options['items']} itens, {options['restaurants']} restaurantes")
+        if 'index_build_s' in results:
+            self.stdout.write(f"montagem do índice em memória: {results['index_build_s']} s")
+        self.stdout.write(f"{'consulta':<24} {'p50':>9} {'p95':>9} {'p99':>9} {'resultados':>11}")
+        for name, row in results['queries'].items():
+            self.stdout.write(
+                f"{name:<24} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['avg_results']:>11}"
+            )
+        row = results['endpoint']
+        self.stdout.write(
+            f"{'rota /public/search/':<24} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} "
+            f"{row['queries_per_request']:>8} queries"
+        )
+
+    def measure(self, rng, options):
+        self.create_menu(rng, options)
+        backend = options['backend']
+        if backend == 'auto':
+            backend = 'postgres' if connection.vendor == 'postgresql' else 'memory'
+        results = {'backend': backend}
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE api_restaurant, api_menuitem')
+        if backend == 'memory':
+            start = time.perf_counter()
+            build_search_index()
+            results['index_build_s'] = round(time.perf_counter() - start, 2)
+            # A primeira busca monta o índice do processo: fica fora da medição.
+            search('pizza')
+
+        words = [normalize(word) for word in ('Feijoada', 'Calabresa', 'Picanha', 'Moqueca', 'Catupiry', 'Costela')]
+        accented = [normalize(word) for word in ('Açaí', 'Camarão', 'Hambúrguer', 'Maracujá', 'Acarajé', 'Limão')]
+        groups = {
+            'palavra': lambda: rng.choice(words),
+            'sem acento': lambda: rng.choice(accented),
+            'prefixo': lambda: rng.choice(words + accented)[:4],
+            'erro de digitação': lambda: typo(rng.choice(words), rng),
+            'duas palavras': lambda: f'{rng.choice(DISHES)} {rng.choice(FLAVORS)}',
+        }
+        results['queries'] = {}
+        for name, make_query in groups.items():
+            results['queries'][name] = self.time_calls(lambda query: len(search(query)), make_query, options['queries'])
+        # Referência: LIKE em nome e descrição, sem índice, sem ranking e sem ignorar acentos;
+        # sem ranking, é preciso ler todos os itens que casam para escolher os melhores.
+        results['queries']['icontains (referência)'] = self.time_calls(
+            lambda query: len(list(
+                MenuItem.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
+                .values_list('id', flat=True)
+            )),
+            groups['palavra'], max(options['queries'] // 10, 2),
+        )
+        results['endpoint'] = self.measure_endpoint(rng, groups, options)
+        return results
+
+    def time_calls(self, call, make_query, count):
+        timings, found = [], 0
+        for _ in range(count):
+            query = make_query()
+            start = time.perf_counter()
+            found += call(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        return {**percentiles(timings), 'avg_results': round(found / count, 1)}
+
+    def measure_endpoint(self, rng, groups, options):
+        client = Client()
+        url = reverse('public-search')
+        makers = list(groups.values())
+        timings, queries = [], []
+        for number in range(options['requests']):
+            # `n` só deixa cada URL diferente: mede a busca, não o cache de respostas.
+            params = {'q': rng.choice(makers)(), 'n': number}
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = client.get(url, params)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f"HTTP {response.status_code} {response.content[:200]!r}")
+            queries.append(len(ctx.captured_queries))
+        return {**percentiles(timings), 'queries_per_request': round(sum(queries) / len(queries), 2)}
+
+    def create_menu(self, rng, options):
+        owners = User.objects.bulk_create(
+            User(username=f'bench-busca-dono-{i}', role='owner') for i in range(options['restaurants'])
+        )
+        restaurants = Restaurant.objects.bulk_create(
+            Restaurant(
+                owner=owner, name=f'{rng.choice(RESTAURANT_NAMES)} {rng.choice(RESTAURANT_SUFFIXES)} {i}',
+                address='Rua', phone='11',
+            )
+            for i, owner in enumerate(owners)
+        )
+        MenuItem.objects.bulk_create(
+            (
+                MenuItem(
+                    restaurant=rng.choice(restaurants),
+                    name=f'{rng.choice(DISHES)} de {rng.choice(FLAVORS)} {rng.choice(STYLES)}',
+                    description=f"Acompanha {', '.join(rng.sample(INGREDIENTS, 4))}.",
+                    price=Decimal('25.00'),
+                )
+                for _ in range(options['items'])
+            ),
+            batch_size=2000,
+        )
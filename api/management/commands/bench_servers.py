@@ -0,0 +1,248 @@
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+
+from api.authentication import RoleRefreshToken
+from api.models import User, Restaurant, MenuItem, Order
+from api.pagination import ChangeCursor
+from .bench_login_storm import percentiles
+
+PREFIX = 'bench-srv-'
+# Espera dos long-polls dos painéis. Sob WSGI o long-poll vem desligado
+# (ORDER_FEED_MAX_WAIT=0); aqui é ligado nos dois modos para medir o custo.
+POLL_WAIT = 25
+
+SERVERS = {
+    # modo: (worker do gunicorn, aplicação, ASYNC_VIEWS)
+    'wsgi': ('sync', 'config.wsgi:application', 'False'),
+    # O modo WSGI do Dockerfile: cada worker atende --threads requisições por vez.
+    'gthread': ('gthread', 'config.wsgi:application', 'False'),
+    'asgi': ('uvicorn.workers.UvicornWorker', 'config.asgi:application', 'True'),
+}
+
+CONNECTIONS = {
+    # Reuso de conexões com o banco (veja DATABASES em config/settings.py).
+    'none': {'DB_POOL': 'False', 'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_POOL': 'False', 'DB_CONN_MAX_AGE': '60'},
+    'pool': {'DB_POOL': 'True'},
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def run_server(mode, workers, threads=1, env=None, timeout=30):
+    """
+    Sobe o Gunicorn no modo `mode` (veja SERVERS), com o sink de localização
+    em memória e as variáveis extras de `env`, e devolve a URL base da API.
+    """
+    worker_class, application, async_views = SERVERS[mode]
+    port = free_port()
+    # Com --threads > 1 o Gunicorn troca o worker sync pelo gthread sem avisar.
+    threads = threads if worker_class == 'gthread' else 1
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'),
+        'ASYNC_VIEWS': async_views,
+        'LOCATION_SINK': 'api.tracking.InMemorySink',
+        **(env or {}),
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--threads', str(threads), '--worker-class', worker_class, '--timeout', str(timeout), application],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}/api'
+        wait_until_ready(base_url, server)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def wait_until_ready(base_url, server):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise CommandError(f"O servidor saiu com código {server.returncode}.")
+        try:
+            if httpx.get(f'{base_url}/public/restaurants/', timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise CommandError("O servidor não respondeu em 30 segundos.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe a API com workers WSGI síncronos e com workers ASGI (uvicorn), mantém conexões de "
+        "long-poll do painel abertas e mede a vazão de pings de localização e leituras de cardápio "
+        "com muitas conexões simultâneas. Com --connections compara também o reuso de conexões com "
+        "o banco (sem reuso, persistentes e pool). Os dados são gravados no banco e apagados no final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='wsgi,asgi')
+        parser.add_argument('--workers', type=int, default=2, help="Processos do gunicorn em cada modo.")
+        parser.add_argument('--threads', type=int, default=8, help="Threads por processo no modo gthread.")
+        parser.add_argument(
+            '--connections', default='',
+            help=f"Modos de conexão com o banco, separados por vírgula ({', '.join(CONNECTIONS)}). "
+                 "Padrão: o que estiver configurado no ambiente.",
+        )
+        parser.add_argument(
+            '--mix', choices=['io', 'db'], default='io',
+            help="io: pings de localização e cardápio (quase sem banco); db: pedidos do cliente e rastreamento.",
+        )
+        parser.add_argument('--concurrency', type=int, default=50, help="Conexões fazendo requisições sem parar.")
+        parser.add_argument('--pollers', type=int, default=20, help="Conexões paradas no long-poll do painel.")
+        parser.add_argument('--duration', type=float, default=5.0, help="Segundos medidos em cada modo.")
+        parser.add_argument('--timeout', type=float, default=10.0, help="Timeout de cada requisição medida.")
+        parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        modes = options['modes'].split(',')
+        for mode in modes:
+            if mode not in SERVERS:
+                raise CommandError(f"Modo desconhecido: {mode} (use {', '.join(SERVERS)}).")
+        connection_modes = options['connections'].split(',') if options['connections'] else [None]
+        for connection_mode in connection_modes:
+            if connection_mode is not None and connection_mode not in CONNECTIONS:
+                raise CommandError(f"Modo de conexão desconhecido: {connection_mode} (use {', '.join(CONNECTIONS)}).")
+
+        # Os servidores são outros processos, então os dados precisam estar gravados.
+        self.cleanup()
+        results = {}
+        try:
+            data = self.seed()
+            for mode in modes:
+                for connection_mode in connection_modes:
+                    label = f'{mode}/{connection_mode}' if connection_mode else mode
+                    results[label] = self.measure(mode, connection_mode, data, options)
+        finally:
+            self.cleanup()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'modo':<16} {'req/s':>8} {'erros':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for mode, row in results.items():
+            latency = row['latency']
+            self.stdout.write(
+                f"{mode:<16} {row['requests_per_second']:>8.1f} {row['errors']:>6} "
+                f"{latency['p50_ms'] or '-':>9} {latency['p95_ms'] or '-':>9} {latency['p99_ms'] or '-':>9}"
+            )
+
+    def cleanup(self):
+        # Restaurante, cardápio e pedidos saem em cascata a partir do dono.
+        Order.objects.filter(customer__username__startswith=PREFIX).delete()
+        User.objects.filter(username__startswith=PREFIX).delete()
+
+    def seed(self):
+        owner = User.objects.create_user(username=f'{PREFIX}dono', role='owner')
+        customer = User.objects.create_user(username=f'{PREFIX}cliente', role='customer')
+        driver = User.objects.create_user(username=f'{PREFIX}entregador', role='driver')
+        restaurant = Restaurant.objects.create(owner=owner, name='Restaurante Benchmark', address='Rua', phone='11')
+        MenuItem.objects.bulk_create(
+            MenuItem(restaurant=restaurant, name=f'Item {i}', price=Decimal('10.00') + i % 7) for i in range(30)
+        )
+        order = Order.objects.create(
+            customer=customer, restaurant=restaurant, driver=driver, status='out_for_delivery',
+            total_price=Decimal('30.00'), delivery_address='Rua B',
+        )
+        return {
+            'restaurant': restaurant.pk,
+            'order': order.pk,
+            'cursor': ChangeCursor.starting_at(order.updated_at).advance([(order.pk, order.updated_at)]).encode(),
+            'owner_token': str(RoleRefreshToken.for_user(owner).access_token),
+            'customer_token': str(RoleRefreshToken.for_user(customer).access_token),
+            'driver_token': str(RoleRefreshToken.for_user(driver).access_token),
+        }
+
+    def measure(self, mode, connection_mode, data, options):
+        env = {'ORDER_FEED_MAX_WAIT': str(POLL_WAIT), **CONNECTIONS.get(connection_mode, {})}
+        with run_server(mode, options['workers'], options['threads'], env, timeout=POLL_WAIT + 30) as base_url:
+            return asyncio.run(self.load(base_url, data, options))
+
+    async def load(self, base_url, data, options):
+        limits = httpx.Limits(max_connections=options['concurrency'] + options['pollers'])
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=options['timeout']) as client:
+            owner = {'Authorization': f"Bearer {data['owner_token']}"}
+            driver = {'Authorization': f"Bearer {data['driver_token']}"}
+            customer = {'Authorization': f"Bearer {data['customer_token']}"}
+
+            async def io_request():
+                if random.random() < 0.5:
+                    return await client.patch(
+                        f"/driver/orders/{data['order']}/location/", headers=driver,
+                        json={'lat': random.uniform(-23.6, -23.5), 'lng': random.uniform(-46.7, -46.6)},
+                    )
+                return await client.get(f"/public/restaurants/{data['restaurant']}/menu/")
+
+            async def db_request():
+                if random.random() < 0.5:
+                    return await client.get('/orders/', headers=customer)
+                return await client.get(f"/customer/orders/{data['order']}/track/", headers=customer)
+
+            request = io_request if options['mix'] == 'io' else db_request
+
+            async def poll():
+                # Painel esperando mudanças que não vêm: ocupa a conexão até o fim da medição.
+                params = {'since': data['cursor'], 'wait': POLL_WAIT}
+                while True:
+                    try:
+                        await client.get('/restaurant/orders/changes/', params=params, headers=owner,
+                                         timeout=POLL_WAIT + 10)
+                    except httpx.HTTPError:
+                        pass
+
+            pollers = [asyncio.create_task(poll()) for _ in range(options['pollers'])]
+            # Dá tempo para os long-polls chegarem ao servidor antes da medição.
+            await asyncio.sleep(0.5)
+
+            timings = []
+            errors = 0
+            deadline = time.perf_counter() + options['duration']
+
+            async def work():
+                nonlocal errors
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        response = await request()
+                    except httpx.HTTPError:
+                        errors += 1
+                        continue
+                    if response.status_code >= 400:
+                        errors += 1
+                    else:
+                        timings.append((time.perf_counter() - start) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(work() for _ in range(options['concurrency'])))
+            elapsed = time.perf_counter() - started
+            for task in pollers:
+                task.cancel()
+            await asyncio.gather(*pollers, return_exceptions=True)
+
+        return {
+            'requests_per_second': round(len(timings) / elapsed, 1),
+            'errors': errors,
+            'latency': percentiles(timings),
+        }
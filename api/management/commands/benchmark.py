@@ -0,0 +1,316 @@
+import itertools
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from api.authentication import RoleRefreshToken
+from api.models import User, Restaurant, MenuItem, Order, OrderItem
+from api.stats import rebuild_stats
+
+PASSWORD = 'senha-benchmark-123'
+
+# Rotas que não cabem em medição requisição/resposta, com o motivo.
+SKIPPED = {
+    'customer-order-stream': "stream infinito (SSE)",
+}
+
+# Settings ligados só enquanto a rota é medida.
+ROUTE_SETTINGS = {
+    # /metrics/ só existe com o profiling ligado.
+    'metrics': {'PROFILING_ENABLED': True, 'PROFILING_METRICS_TOKEN': None},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Popula uma base sintética e mede cada rota de api/urls.py: latência p50/p95/p99, "
+        "requisições por segundo de um cliente sequencial e queries por requisição. Tudo roda numa transação desfeita no final e com o "
+        "sink de localização em memória, sem Firebase."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--items', type=int, default=30, help="Itens de cardápio por restaurante.")
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--drivers', type=int, default=20)
+        parser.add_argument('--customers', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=100, help="Requisições medidas por rota.")
+        parser.add_argument('--warmup', type=int, default=5, help="Requisições descartadas antes de medir.")
+        parser.add_argument('--only', help="Rotas a medir, separadas por vírgula (padrão: todas).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Salva o resultado em JSON neste arquivo.")
+        parser.add_argument('--compare', help="JSON de uma execução anterior para comparar o p95.")
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        # O Client de teste usa o host "testserver".
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        try:
+            with override_settings(LOCATION_SINK='api.tracking.InMemorySink', ALLOWED_HOSTS=allowed_hosts), \
+                    transaction.atomic():
+                cache.clear()
+                dataset = self.seed(options)
+                results = self.run(dataset, options)
+                transaction.set_rollback(True)
+        finally:
+            cache.clear()
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'dataset': {key: options[key] for key in ('restaurants', 'items', 'orders', 'drivers', 'customers')},
+                'requests_per_route': options['requests'],
+                'skipped': SKIPPED,
+            },
+            'results': results,
+        }
+        self.print_report(results)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                self.print_comparison(json.load(baseline)['results'], results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Resultado salvo em {options['output']}")
+
+    def seed(self, options):
+        password = make_password(PASSWORD)
+        owners = User.objects.bulk_create(
+            User(username=f'bench-dono-{i}', role='owner', password=password) for i in range(options['restaurants'])
+        )
+        customers = User.objects.bulk_create(
+            User(username=f'bench-cliente-{i}', role='customer', password=password) for i in range(options['customers'])
+        )
+        drivers = User.objects.bulk_create(
+            User(username=f'bench-entregador-{i}', role='driver', password=password) for i in range(options['drivers'])
+        )
+        restaurants = Restaurant.objects.bulk_create(
+            Restaurant(owner=owner, name=f'Restaurante {i}', address='Rua', phone='11') for i, owner in enumerate(owners)
+        )
+        menu_items = MenuItem.objects.bulk_create(
+            MenuItem(restaurant=restaurant, name=f'Item {i}', price=Decimal('10.00') + i % 7)
+            for restaurant in restaurants
+            for i in range(options['items'])
+        )
+        menus = {restaurant.pk: [] for restaurant in restaurants}
+        for item in menu_items:
+            menus[item.restaurant_id].append(item)
+
+        statuses = ['pending', 'in_progress', 'out_for_delivery', 'delivered', 'cancelled']
+        orders = Order.objects.bulk_create(
+            Order(
+                customer=random.choice(customers),
+                restaurant=random.choice(restaurants),
+                driver=random.choice(drivers) if i % 3 == 0 else None,
+                status=random.choice(statuses),
+                total_price=Decimal('30.00'),
+                delivery_address='Rua B',
+            )
+            for i in range(options['orders'])
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menu_item=item, quantity=1, name=item.name, unit_price=item.price)
+            for order in orders
+            for item in random.sample(menus[order.restaurant_id], min(3, options['items']))
+        )
+
+        # Pedidos extras prontos para entrega, para que cada claim medido tenha um pedido livre.
+        claimable = Order.objects.bulk_create(
+            Order(customer=customers[0], restaurant=restaurants[0], status='out_for_delivery',
+                  total_price=Decimal('30.00'), delivery_address='Rua B')
+            for _ in range(options['requests'] + options['warmup'])
+        )
+        # E pedidos já com o entregador medido, um por entrega confirmada.
+        deliverable = Order.objects.bulk_create(
+            Order(customer=customers[0], restaurant=restaurants[0], driver=drivers[0], status='out_for_delivery',
+                  total_price=Decimal('30.00'), delivery_address='Rua B')
+            for _ in range(options['requests'] + options['warmup'])
+        )
+        preparing = Order.objects.create(
+            customer=customers[0], restaurant=restaurants[0], status='pending',
+            total_price=Decimal('30.00'), delivery_address='Rua B',
+        )
+        delivering = Order.objects.create(
+            customer=customers[0], restaurant=restaurants[0], driver=drivers[0],
+            status='out_for_delivery', total_price=Decimal('30.00'), delivery_address='Rua B',
+        )
+        # bulk_create não passa pelos signals: o agregado do painel é montado de uma vez.
+        rebuild_stats()
+
+        # Um par de tokens novo por logout medido: o logout revoga o access token usado.
+        sessions = [RoleRefreshToken.for_user(customers[0]) for _ in range(options['requests'] + options['warmup'])]
+        return {
+            'owner': owners[0],
+            'customer': customers[0],
+            'driver': drivers[0],
+            'restaurant': restaurants[0],
+            'menu': menus[restaurants[0].pk],
+            'order': preparing,
+            'claimable': iter(claimable),
+            'deliverable': iter(deliverable),
+            'delivering': delivering,
+            'sessions': iter([(str(refresh.access_token), str(refresh)) for refresh in sessions]),
+        }
+
+    def scenarios(self, data):
+        """
+        Uma entrada por rota: (nome, usuário autenticado, função que recebe o
+        client e faz uma requisição).
+        """
+        restaurant = data['restaurant']
+        menu = data['menu']
+        counter = itertools.count()
+        refresh = str(RoleRefreshToken.for_user(data['customer']))
+
+        def revoke(client):
+            access, refresh = next(data['sessions'])
+            return client.post(
+                reverse('token_revoke'), {'refresh': refresh}, content_type='application/json',
+                HTTP_AUTHORIZATION=f'Bearer {access}',
+            )
+
+        # Palavra inteira, prefixo e erro de digitação sobre os nomes da base sintética.
+        search_terms = itertools.cycle(['item', 'restaurante 1', 'ite', 'itme'])
+
+        def drain(response):
+            # Rotas em streaming: o tempo inclui gerar o corpo inteiro.
+            b''.join(response.streaming_content)
+            return response
+
+        # Importação que reescreve o cardápio do restaurante: o tamanho não cresce entre as medições.
+        menu_rows = json.dumps([
+            {'id': item.pk, 'name': item.name, 'description': 'Atualizado', 'price': str(item.price), 'is_available': True}
+            for item in menu
+        ])
+
+        def order_payload():
+            return {
+                'restaurant': restaurant.pk,
+                'delivery_address': 'Rua B, 2',
+                'items': [{'menu_item': item.pk, 'quantity': 1} for item in random.sample(menu, min(3, len(menu)))],
+            }
+
+        return [
+            ('user-registration', None, lambda c: c.post(reverse('user-registration'), {
+                'username': f'bench-novo-{next(counter)}', 'password': PASSWORD,
+                'email': 'novo@example.com', 'role': 'customer',
+            }, content_type='application/json')),
+            ('token_obtain_pair', None, lambda c: c.post(reverse('token_obtain_pair'), {
+                'username': data['customer'].username, 'password': PASSWORD,
+            }, content_type='application/json')),
+            ('token_refresh', None, lambda c: c.post(reverse('token_refresh'), {'refresh': refresh}, content_type='application/json')),
+            ('token_revoke', None, revoke),
+            ('user-profile', data['customer'], lambda c: c.get(reverse('user-profile'))),
+            ('restaurant-list-create', data['owner'], lambda c: c.get(reverse('restaurant-list-create'))),
+            ('restaurant-detail', data['owner'], lambda c: c.patch(
+                reverse('restaurant-detail', args=[restaurant.pk]), {'phone': '1133334444'}, content_type='application/json')),
+            ('menu-item-list-create', data['owner'], lambda c: c.post(
+                reverse('menu-item-list-create', args=[restaurant.pk]),
+                {'name': f'Novo {next(counter)}', 'description': '', 'price': '19.90'}, content_type='application/json')),
+            ('menu-import', data['owner'], lambda c: c.post(
+                reverse('menu-import', args=[restaurant.pk]), menu_rows, content_type='application/json')),
+            ('menu-export', data['owner'], lambda c: drain(c.get(reverse('menu-export', args=[restaurant.pk])))),
+            ('menu-item-detail', data['owner'], lambda c: c.patch(
+                reverse('menu-item-detail', args=[restaurant.pk, menu[0].pk]), {'price': '21.00'}, content_type='application/json')),
+            ('public-restaurant-list', None, lambda c: c.get(reverse('public-restaurant-list'))),
+            ('public-restaurant-menu', None, lambda c: c.get(reverse('public-restaurant-menu', args=[restaurant.pk]))),
+            ('public-search', None, lambda c: c.get(reverse('public-search'), {'q': next(search_terms)})),
+            ('order-list', data['customer'], lambda c: c.get(reverse('order-list-create'))),
+            ('order-create', data['customer'], lambda c: c.post(
+                reverse('order-list-create'), order_payload(), content_type='application/json')),
+            ('restaurant-order-list', data['owner'], lambda c: c.get(reverse('restaurant-order-list'))),
+            ('restaurant-order-changes', data['owner'], lambda c: c.get(reverse('restaurant-order-changes'))),
+            ('restaurant-order-export', data['owner'], lambda c: drain(c.get(reverse('restaurant-order-export')))),
+            ('restaurant-stats', data['owner'], lambda c: c.get(reverse('restaurant-stats'))),
+            ('restaurant-order-detail', data['owner'], lambda c: c.patch(
+                reverse('restaurant-order-detail', args=[data['order'].pk]), {'status': 'in_progress'},
+                content_type='application/json')),
+            ('driver-available-orders', data['driver'], lambda c: c.get(reverse('driver-available-orders'))),
+            ('driver-claim-order', data['driver'], lambda c: c.patch(
+                reverse('driver-claim-order', args=[next(data['claimable']).pk]))),
+            ('driver-deliver-order', data['driver'], lambda c: c.patch(
+                reverse('driver-deliver-order', args=[next(data['deliverable']).pk]))),
+            ('driver-order-changes', data['driver'], lambda c: c.get(reverse('driver-order-changes'))),
+            ('driver-update-location', data['driver'], lambda c: c.patch(
+                reverse('driver-update-location', args=[data['delivering'].pk]),
+                {'lat': random.uniform(-23.6, -23.5), 'lng': random.uniform(-46.7, -46.6)}, content_type='application/json')),
+            ('customer-track-order', data['customer'], lambda c: c.get(
+                reverse('customer-track-order', args=[data['delivering'].pk]))),
+            ('metrics', None, lambda c: c.get(reverse('metrics'))),
+        ]
+
+    def run(self, data, options):
+        only = set(options['only'].split(',')) if options['only'] else None
+        results = {}
+        for name, user, request in self.scenarios(data):
+            if only and name not in only:
+                continue
+            with override_settings(**ROUTE_SETTINGS.get(name, {})):
+                timings, queries, elapsed = self.measure(name, user, request, options)
+
+            percentiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+            results[name] = {
+                'p50_ms': round(percentiles[49], 3),
+                'p95_ms': round(percentiles[94], 3),
+                'p99_ms': round(percentiles[98], 3),
+                # Um único cliente, uma requisição por vez: é o inverso da latência
+                # média, não a vazão do servidor (para concorrência, veja bench_servers).
+                'sequential_rps': round(len(timings) / elapsed, 1),
+                'queries_per_request': round(statistics.mean(queries), 2),
+            }
+        return results
+
+    def measure(self, name, user, request, options):
+        headers = {}
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {RoleRefreshToken.for_user(user).access_token}'
+        # Client novo por rota: a pilha de middlewares é montada com os settings da rota.
+        client = Client(**headers)
+
+        for _ in range(options['warmup']):
+            request(client)
+
+        timings = []
+        queries = []
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = request(client)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{name}: HTTP {response.status_code} {response.content[:200]!r}")
+            queries.append(len(ctx.captured_queries))
+        return timings, queries, time.perf_counter() - started
+
+    def print_report(self, results):
+        self.stdout.write(f"{'rota':<28} {'p50':>8} {'p95':>8} {'p99':>8} {'seq/s':>8} {'queries':>8}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<28} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+                f"{row['sequential_rps']:>8.1f} {row['queries_per_request']:>8.2f}"
+            )
+
+    def print_comparison(self, baseline, results):
+        self.stdout.write(f"\n{'rota':<28} {'p95 antes':>10} {'p95 agora':>10} {'variação':>9} {'queries':>12}")
+        for name, row in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            change = (row['p95_ms'] / before['p95_ms'] - 1) * 100 if before['p95_ms'] else 0
+            self.stdout.write(
+                f"{name:<28} {before['p95_ms']:>10.2f} {row['p95_ms']:>10.2f} {change:>+8.1f}% "
+                f"{before['queries_per_request']:>5.1f} → {row['queries_per_request']:<5.1f}"
+            )
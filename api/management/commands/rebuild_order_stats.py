@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula o agregado de pedidos por restaurante, dia e status (RestaurantDailyStats) a partir "
+        "da tabela de pedidos. Use no primeiro deploy e depois de alterações feitas fora da API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int, help="Recalcula só este restaurante (id).")
+
+    def handle(self, *args, **options):
+        rows = rebuild_stats(options['restaurant'])
+        self.stdout.write(f"{rows} linhas gravadas em RestaurantDailyStats.")
@@ -0,0 +1,118 @@
+import json
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.dispatch import candidate_pairs, optimal_solver_available, solve
+from api.geo import DriverIndex
+from .bench_dispatch import random_point
+
+METHODS = ('claim', 'greedy', 'optimal')
+
+
+class Command(BaseCommand):
+    help = (
+        "Simula rodadas de despacho com demanda sintética, sem banco: a cada rodada chegam pedidos "
+        "e os entregadores livres são atribuídos pelo claim (cada pedido vai para um entregador "
+        "qualquer dentro do raio, como na disputa), pelo casamento guloso ou pelo ótimo (SciPy). "
+        "Reporta a distância média até o restaurante e o tempo do solver por tamanho de frota."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fleet', default='100,500,1000,2000', help="Tamanhos de frota, separados por vírgula.")
+        parser.add_argument('--methods', default=','.join(METHODS))
+        parser.add_argument('--rounds', type=int, default=30)
+        parser.add_argument('--demand', type=float, default=0.2, help="Pedidos novos por rodada, em fração da frota.")
+        parser.add_argument('--busy-rounds', type=int, default=5, help="Rodadas que um entregador fica em entrega.")
+        parser.add_argument('--restaurants', type=int, default=300)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        methods = options['methods'].split(',')
+        for method in methods:
+            if method not in METHODS:
+                raise CommandError(f"Método desconhecido: {method} (use {', '.join(METHODS)}).")
+        if 'optimal' in methods and not optimal_solver_available():
+            self.stderr.write("SciPy não instalado: pulando o método optimal.")
+            methods.remove('optimal')
+
+        results = {}
+        for fleet in map(int, options['fleet'].split(',')):
+            for method in methods:
+                # Mesma semente em todos os métodos: a demanda é a mesma.
+                results[f'{fleet}/{method}'] = self.simulate(fleet, method, random.Random(options['seed']), options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{'frota/método':<18} {'atribuídos':>10} {'km médio':>9} {'espera':>7} {'solver ms':>10} {'máx ms':>8}"
+        )
+        for label, row in results.items():
+            self.stdout.write(
+                f"{label:<18} {row['assigned']:>10} {row['avg_pickup_km']:>9} {row['avg_wait_rounds']:>7} "
+                f"{row['avg_solver_ms']:>10} {row['max_solver_ms']:>8}"
+            )
+
+    def simulate(self, fleet, method, rng, options):
+        restaurants = [random_point(rng) for _ in range(options['restaurants'])]
+        # TTL infinito: as rodadas são simuladas, não em tempo real.
+        index = DriverIndex(settings.DISPATCH_GRID_CELL_DEG, ttl=float('inf'))
+        for driver_id in range(fleet):
+            index.update(driver_id, *random_point(rng), idle=True)
+
+        pending = {}  # order_id -> (lat, lng, rodada em que chegou)
+        returning = {}  # rodada -> [driver_id]
+        pickups, waits, solver_ms = [], [], []
+        next_order = 0
+        for round_number in range(options['rounds']):
+            for driver_id in returning.pop(round_number, ()):
+                # Volta a ficar livre onde terminou a entrega.
+                index.update(driver_id, *random_point(rng), idle=True)
+            for _ in range(round(fleet * options['demand'])):
+                pending[next_order] = (*rng.choice(restaurants), round_number)
+                next_order += 1
+
+            orders = [(order_id, lat, lng) for order_id, (lat, lng, _) in pending.items()]
+            start = time.perf_counter()
+            if method == 'claim':
+                assignment = self.claim(orders, index, rng)
+            else:
+                pairs = candidate_pairs(orders, index, settings.DISPATCH_BATCH_CANDIDATES, settings.DISPATCH_RADIUS_KM)
+                assignment = solve(pairs, method)
+            solver_ms.append((time.perf_counter() - start) * 1000)
+
+            for distance, order_id, driver_id in assignment:
+                pickups.append(distance)
+                waits.append(round_number - pending.pop(order_id)[2])
+                index.mark_busy(driver_id)
+                returning.setdefault(round_number + options['busy_rounds'], []).append(driver_id)
+
+        return {
+            'assigned': len(pickups),
+            'unassigned': len(pending),
+            'avg_pickup_km': round(statistics.mean(pickups), 3) if pickups else None,
+            'avg_wait_rounds': round(statistics.mean(waits), 2) if waits else None,
+            'avg_solver_ms': round(statistics.mean(solver_ms), 2),
+            'max_solver_ms': round(max(solver_ms), 2),
+        }
+
+    def claim(self, orders, index, rng):
+        """
+        Disputa do claim: os pedidos chegam aos entregadores em ordem
+        qualquer e cada um fica com algum entregador livre dentro do raio,
+        não necessariamente o mais próximo.
+        """
+        taken, assignment = set(), []
+        for order_id, lat, lng in rng.sample(orders, len(orders)):
+            nearby = [(d, driver_id) for d, driver_id in index.within(lat, lng, settings.DISPATCH_RADIUS_KM)
+                      if driver_id not in taken]
+            if nearby:
+                distance, driver_id = rng.choice(nearby)
+                taken.add(driver_id)
+                assignment.append((distance, order_id, driver_id))
+        return assignment
@@ -0,0 +1,148 @@
+"""
+Importação e exportação do cardápio em lote (JSON ou CSV). A importação
+valida linha a linha, grava as válidas com bulk_create em lotes numa única
+transação e devolve os erros das demais; a exportação é gerada em streaming.
+"""
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ParseError, UnsupportedMediaType, ValidationError
+
+from .cache import SEARCH_SCOPE, bump_version, menu_scope
+from .exports import Echo
+from .models import MenuItem
+from .serializers import MenuItemImportSerializer
+
+FIELDS = ('id', 'name', 'description', 'price', 'is_available')
+UPDATE_FIELDS = ['name', 'description', 'price', 'is_available']
+REQUIRED_COLUMNS = ('name', 'price')
+
+
+def read_rows(request):
+    """
+    Linhas (dicts) do corpo da requisição conforme o Content-Type: CSV e
+    NDJSON são lidos em streaming, linha a linha; JSON (uma lista) passa
+    pelo limite de DATA_UPLOAD_MAX_MEMORY_SIZE do Django.
+    """
+    content_type = request.content_type.split(';')[0].strip()
+    if content_type == 'text/csv':
+        lines = codecs.iterdecode(request.stream or [], 'utf-8-sig')
+        reader = csv.DictReader(lines)
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+        if missing:
+            raise ParseError(f"Colunas obrigatórias ausentes no CSV: {', '.join(missing)}.")
+        return reader
+    if content_type == 'application/x-ndjson':
+        return _ndjson_rows(request.stream or [])
+    if content_type == 'application/json':
+        try:
+            rows = json.loads(request.body or b'[]')
+        except ValueError:
+            raise ParseError("JSON inválido.")
+        if not isinstance(rows, list):
+            raise ParseError("Envie uma lista de itens.")
+        return rows
+    raise UnsupportedMediaType(content_type)
+
+
+def _ndjson_rows(stream):
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise ParseError(f"JSON inválido na linha {number}.")
+
+
+def _clean(row):
+    # No CSV, célula vazia de id ou de is_available significa "não informado".
+    if not isinstance(row, dict):
+        return row
+    return {key: value for key, value in row.items() if not (key in ('id', 'is_available') and value in ('', None))}
+
+
+def import_menu(restaurant, rows):
+    """
+    Cria (linhas sem id) ou atualiza (linhas com o id de um item do próprio
+    restaurante) os itens em lotes de MENU_IMPORT_BATCH_SIZE. Linhas
+    inválidas não interrompem a importação: voltam em `errors` com o número
+    da linha (1 = primeira linha de dados). Retorna {created, updated, errors}.
+    """
+    report = {'created': 0, 'updated': 0, 'errors': []}
+    batch = []
+    seen_ids = set()
+    with transaction.atomic():
+        for number, row in enumerate(rows, start=1):
+            if number > settings.MENU_IMPORT_MAX_ROWS:
+                # Desfaz o que já foi gravado: a importação é tudo ou nada nesse caso.
+                raise ValidationError({"detail": f"A importação aceita no máximo {settings.MENU_IMPORT_MAX_ROWS} linhas."})
+            row = _clean(row)
+            # Linha com id é uma atualização: só as colunas enviadas são validadas.
+            serializer = MenuItemImportSerializer(data=row, partial=isinstance(row, dict) and 'id' in row)
+            if serializer.is_valid():
+                batch.append((number, serializer.validated_data))
+            else:
+                report['errors'].append({'row': number, 'errors': serializer.errors})
+            if len(batch) >= settings.MENU_IMPORT_BATCH_SIZE:
+                _write_batch(restaurant, batch, report, seen_ids)
+                batch = []
+        if batch:
+            _write_batch(restaurant, batch, report, seen_ids)
+        if report['created'] or report['updated']:
+            # bulk_create não dispara post_save: invalida o cardápio público e a busca aqui.
+            transaction.on_commit(lambda: bump_version(menu_scope(restaurant.pk)))
+            transaction.on_commit(lambda: bump_version(SEARCH_SCOPE))
+    return report
+
+
+def _write_batch(restaurant, batch, report, seen_ids):
+    ids = {data['id'] for _, data in batch if 'id' in data}
+    # Atualização parte do item gravado: colunas ausentes na linha mantêm o valor atual.
+    known = MenuItem.objects.filter(restaurant=restaurant).in_bulk(ids) if ids else {}
+    items = []
+    for number, data in batch:
+        if 'id' not in data:
+            items.append(MenuItem(restaurant=restaurant, **data))
+            report['created'] += 1
+            continue
+        if data['id'] not in known:
+            report['errors'].append({'row': number, 'errors': {'id': ["Item não encontrado neste restaurante."]}})
+            continue
+        # O mesmo item duas vezes no arquivo: vale a primeira linha.
+        if data['id'] in seen_ids:
+            report['errors'].append({'row': number, 'errors': {'id': ["Item repetido no arquivo."]}})
+            continue
+        seen_ids.add(data['id'])
+        item = known[data['id']]
+        for field, value in data.items():
+            setattr(item, field, value)
+        items.append(item)
+        report['updated'] += 1
+    # Itens com id caem no ON CONFLICT e são atualizados; os sem id são inseridos.
+    MenuItem.objects.bulk_create(items, update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS)
+
+
+def export_menu(restaurant_id, file_format):
+    """Gera o cardápio em pedaços de texto (CSV ou lista JSON), sem montar tudo em memória."""
+    rows = (
+        MenuItem.objects.filter(restaurant_id=restaurant_id).order_by('id')
+        .values_list(*FIELDS).iterator(chunk_size=settings.MENU_IMPORT_BATCH_SIZE)
+    )
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+        return
+
+    yield '['
+    separator = ''
+    for item_id, name, description, price, is_available in rows:
+        item = {'id': item_id, 'name': name, 'description': description, 'price': str(price), 'is_available': is_available}
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ','
+    yield ']'
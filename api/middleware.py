@@ -0,0 +1,253 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.permissions import SAFE_METHODS
+
+from .routers import amark_recent_write, mark_recent_write
+
+logger = logging.getLogger(__name__)
+
+# Medições da requisição em andamento (None fora de uma requisição perfilada).
+_current = contextvars.ContextVar('api_profile', default=None)
+
+
+class RequestProfile:
+    __slots__ = ('queries', 'db_time', 'serializer_time', '_serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self._serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Usado como connection.execute_wrapper: conta e cronometra cada query.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+def time_serializer(method, *args):
+    """
+    Chama `method` somando o tempo ao perfil da requisição em andamento.
+    Usado pelos serializers da API (api/serializers.py, ProfiledSerializerMixin);
+    serializers aninhados e os itens de uma lista contam só uma vez.
+    """
+    profile = _current.get()
+    if profile is None:
+        return method(*args)
+    profile._serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        return method(*args)
+    finally:
+        profile._serializer_depth -= 1
+        if profile._serializer_depth == 0:
+            profile.serializer_time += time.perf_counter() - start
+
+
+class MetricsRegistry:
+    """
+    Agregados por rota, mantidos em memória no processo e expostos no
+    formato texto do Prometheus.
+    """
+
+    FIELDS = ('requests', 'duration', 'queries', 'db_time', 'serializer_time', 'over_budget')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def record(self, method, route, duration, profile, over_budget):
+        with self._lock:
+            row = self._routes[(method, route)]
+            row['requests'] += 1
+            row['duration'] += duration
+            row['queries'] += profile.queries
+            row['db_time'] += profile.db_time
+            row['serializer_time'] += profile.serializer_time
+            row['over_budget'] += over_budget
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(row) for key, row in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self, extra_counters=()):
+        metrics = [
+            ('api_requests_total', 'counter', 'Requisições atendidas.', 'requests'),
+            ('api_request_duration_seconds_total', 'counter', 'Tempo total das requisições.', 'duration'),
+            ('api_db_queries_total', 'counter', 'Queries executadas.', 'queries'),
+            ('api_db_duration_seconds_total', 'counter', 'Tempo gasto no banco.', 'db_time'),
+            ('api_serializer_duration_seconds_total', 'counter', 'Tempo gasto em serializers.', 'serializer_time'),
+            ('api_query_budget_exceeded_total', 'counter', 'Requisições acima do orçamento de queries.', 'over_budget'),
+        ]
+        snapshot = self.snapshot()
+        lines = []
+        for name, kind, help_text, field in metrics:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (method, route), row in sorted(snapshot.items()):
+                lines.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {row[field]}')
+        for name, help_text, value in extra_counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+metrics = MetricsRegistry()
+
+
+def _profile_query(execute, sql, params, many, context):
+    # Instalado em todas as conexões: só mede dentro de uma requisição
+    # perfilada. O perfil vem do contextvar, que acompanha a requisição
+    # também nas threads do sync_to_async (sob ASGI).
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def _install_query_timing(connection, **kwargs):
+    if _profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profile_query)
+
+
+def _install_on_open_connections(**kwargs):
+    # request_started roda na thread em que a requisição vai consultar o
+    # banco (sob ASGI, a do sync_to_async), como o close_old_connections.
+    for connection in connections.all(initialized_only=True):
+        _install_query_timing(connection)
+
+
+class ProfilingMiddleware:
+    """
+    Mede, por requisição, queries, tempo de banco, tempo de serializers (os
+    que usam time_serializer) e tempo total, agregando por rota em `metrics`. Com PROFILING_HEADERS os
+    valores também vão na resposta (Server-Timing e X-DB-Queries).
+    Desligado (PROFILING_ENABLED=False) o middleware se remove da pilha e
+    não custa nada. Funciona nos dois modos (WSGI e ASGI).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # As conexões são por thread: as novas recebem o wrapper ao conectar e
+        # as já abertas no início da requisição.
+        connection_created.connect(_install_query_timing)
+        request_started.connect(_install_on_open_connections)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - start)
+
+    def finish(self, request, response, profile, duration):
+        match = request.resolver_match
+        route = f'/{match.route}' if match is not None else 'unmatched'
+        budget = settings.PROFILING_QUERY_BUDGET
+        over_budget = budget is not None and profile.queries > budget
+        if over_budget:
+            logger.warning(
+                "%s %s executou %d queries (orçamento: %d).", request.method, route, profile.queries, budget
+            )
+        metrics.record(request.method, route, duration, profile, over_budget)
+
+        if settings.PROFILING_HEADERS:
+            response['X-DB-Queries'] = str(profile.queries)
+            response['Server-Timing'] = (
+                f'db;dur={profile.db_time * 1000:.2f}, '
+                f'serializer;dur={profile.serializer_time * 1000:.2f}, '
+                f'total;dur={duration * 1000:.2f}'
+            )
+            if over_budget:
+                response['X-Query-Budget-Exceeded'] = str(budget)
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Depois de uma escrita bem-sucedida de um usuário autenticado, faz as
+    leituras dele irem para o banco principal por alguns segundos (veja
+    api/routers.py). Sem réplica configurada, sai da pilha. Funciona nos
+    dois modos: sob ASGI não força a troca para uma thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICA_ALIAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        user_id = self.written_by(request, response)
+        if user_id is not None:
+            mark_recent_write(f'user:{user_id}')
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        user_id = self.written_by(request, response)
+        if user_id is not None:
+            await amark_recent_write(f'user:{user_id}')
+        return response
+
+    @staticmethod
+    def written_by(request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return None
+        # O DRF grava o usuário autenticado pelo JWT também no HttpRequest.
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.id
+        return None
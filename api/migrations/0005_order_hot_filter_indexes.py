@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_order_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['restaurant', 'is_available', 'id'], name='menuitem_rest_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('driver__isnull', True), ('status', 'out_for_delivery')), fields=['created_at', 'id'], name='order_available_idx'),
+        ),
+    ]
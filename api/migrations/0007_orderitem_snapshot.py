@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_order_updated_at_auto_now'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='name',
+            field=models.CharField(default='', max_length=100, verbose_name='Nome do Item'),
+        ),
+        # Nulo até o backfill da 0008; a 0009 torna obrigatório.
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True, verbose_name='Preço Unitário'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def backfill_snapshot(apps, schema_editor):
+    """
+    Copia nome e preço do item de cardápio para os itens de pedidos antigos,
+    em lotes por faixa de id, cada lote na sua transação. O preço usado é o
+    atual do cardápio: o preço da época não foi guardado.
+    """
+    OrderItem = apps.get_model('api', 'OrderItem')
+    db = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(
+                OrderItem.objects.using(db)
+                .filter(pk__gt=last_pk, unit_price__isnull=True)
+                .select_related('menu_item')
+                .only('id', 'menu_item__name', 'menu_item__price')
+                .order_by('pk')[:BATCH_SIZE]
+            )
+            if not batch:
+                return
+            for item in batch:
+                item.name = item.menu_item.name
+                item.unit_price = item.menu_item.price
+            OrderItem.objects.using(db).bulk_update(batch, ['name', 'unit_price'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Sem transação única: cada lote é confirmado separadamente, sem segurar
+    # locks na tabela inteira durante o backfill.
+    atomic = False
+
+    dependencies = [
+        ('api', '0007_orderitem_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_snapshot, migrations.RunPython.noop),
+    ]
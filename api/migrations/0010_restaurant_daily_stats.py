@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_orderitem_unit_price_required'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Dia')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('in_progress', 'Em Preparo'), ('out_for_delivery', 'Saiu para a Entrega'), ('cancelled', 'Cancelado')], max_length=20, verbose_name='Status')),
+                ('order_count', models.IntegerField(default=0, verbose_name='Pedidos')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Receita')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='api.restaurant', verbose_name='Restaurante')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'day', 'status'), name='restaurant_daily_stats_unique')],
+            },
+        ),
+    ]
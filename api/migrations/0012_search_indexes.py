@@ -0,0 +1,59 @@
+from django.db import migrations
+
+# As expressões dos índices são as que api/search.py monta com SearchVector
+# e f_unaccent(); se uma mudar, a outra precisa acompanhar.
+RESTAURANT_VECTOR = "setweight(to_tsvector('portuguese_unaccent'::regconfig, COALESCE(name, '')), 'A')"
+MENU_ITEM_VECTOR = (
+    "setweight(to_tsvector('portuguese_unaccent'::regconfig, COALESCE(name, '')), 'A') || "
+    "setweight(to_tsvector('portuguese_unaccent'::regconfig, COALESCE(description, '')), 'B')"
+)
+
+FORWARD_SQL = [
+    # unaccent e pg_trgm são extensões "trusted": o dono do banco pode criá-las.
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Português sem acentos: unaccent antes do stemmer.
+    "CREATE TEXT SEARCH CONFIGURATION portuguese_unaccent (COPY = portuguese)",
+    "ALTER TEXT SEARCH CONFIGURATION portuguese_unaccent "
+    "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem",
+    # unaccent() é STABLE (depende do dicionário); com o dicionário fixo pode
+    # ser IMMUTABLE, o que permite usá-la num índice.
+    "CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT "
+    "AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$",
+    f"CREATE INDEX restaurant_search_idx ON api_restaurant USING gin (({RESTAURANT_VECTOR}))",
+    f"CREATE INDEX menuitem_search_idx ON api_menuitem USING gin (({MENU_ITEM_VECTOR}))",
+    "CREATE INDEX restaurant_name_trgm_idx ON api_restaurant USING gin (f_unaccent(name) gin_trgm_ops)",
+    "CREATE INDEX menuitem_name_trgm_idx ON api_menuitem USING gin (f_unaccent(name) gin_trgm_ops)",
+]
+
+# As extensões ficam: outros objetos do banco podem depender delas.
+BACKWARD_SQL = [
+    "DROP INDEX IF EXISTS menuitem_name_trgm_idx",
+    "DROP INDEX IF EXISTS restaurant_name_trgm_idx",
+    "DROP INDEX IF EXISTS menuitem_search_idx",
+    "DROP INDEX IF EXISTS restaurant_search_idx",
+    "DROP FUNCTION IF EXISTS f_unaccent(text)",
+    "DROP TEXT SEARCH CONFIGURATION IF EXISTS portuguese_unaccent",
+]
+
+
+def run_on_postgres(statements):
+    # Nos outros bancos a busca usa o índice em memória e não há nada a criar.
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_restaurant_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(FORWARD_SQL), run_on_postgres(BACKWARD_SQL)),
+    ]
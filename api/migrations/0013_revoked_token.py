@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Chave')),
+                ('revoked_at', models.BigIntegerField(verbose_name='Revogado em (timestamp)')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Expira em')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_revoked_token'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendente'), ('in_progress', 'Em Preparo'), ('out_for_delivery', 'Saiu para a Entrega'), ('delivered', 'Entregue'), ('cancelled', 'Cancelado')], default='pending', max_length=20, verbose_name='Status'),
+        ),
+        migrations.AlterField(
+            model_name='restaurantdailystats',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendente'), ('in_progress', 'Em Preparo'), ('out_for_delivery', 'Saiu para a Entrega'), ('delivered', 'Entregue'), ('cancelled', 'Cancelado')], max_length=20, verbose_name='Status'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.validators import MinValueValidator, MaxValueValidator
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -20,6 +21,9 @@ class Restaurant(models.Model):
     address = models.CharField(max_length=255, verbose_name="Endereço")
     phone = models.CharField(max_length=15, verbose_name="Telefone")
     is_active = models.BooleanField(default=True, verbose_name="Ativo")
+    # Usadas no despacho: pedidos disponíveis por raio e entregadores mais próximos.
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)], verbose_name="Latitude")
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)], verbose_name="Longitude")
 
     def __str__(self):
         return self.name
@@ -31,14 +35,40 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Preço")
     is_available = models.BooleanField(default=True, verbose_name="Disponivel")
 
+    class Meta:
+        indexes = [
+            # Cardápio público: itens disponíveis de um restaurante, paginados por id
+            models.Index(fields=['restaurant', 'is_available', 'id'], name='menuitem_rest_available_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.restaurant.name}"
     
+class OrderQuerySet(models.QuerySet):
+    def with_display_relations(self):
+        """
+        Carrega de uma vez tudo o que o OrderDisplaySerializer acessa
+        (cliente, restaurante e dono, e os itens), para que listar pedidos
+        custe um número fixo de queries. Os itens trazem nome e preço
+        copiados, então não há join com MenuItem.
+        """
+        return self.select_related('customer', 'restaurant__owner').prefetch_related(
+            models.Prefetch(
+                'orderitem_set',
+                queryset=OrderItem.objects.only('id', 'order_id', 'menu_item_id', 'quantity', 'name', 'unit_price'),
+            )
+        )
+
+    def changed_since(self, watermark):
+        """Pedidos alterados depois da marca d'água do feed (api/pagination.py), na ordem do feed."""
+        return self.filter(updated_at__gt=watermark).order_by('updated_at', 'id')
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pendente'),
         ('in_progress', 'Em Preparo'),
         ('out_for_delivery', 'Saiu para a Entrega'),
+        ('delivered', 'Entregue'),
         ('cancelled', 'Cancelado')
     )
 
@@ -53,7 +83,24 @@ class Order(models.Model):
     delivery_address = models.CharField(max_length=255, verbose_name="Endereço de Entrega")
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
-    updated_at = models.DateTimeField(auto_now_add=True, verbose_name="Atualizado em")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Sustentam a paginação por cursor (created_at, id) das listagens de pedidos
+            models.Index(fields=['customer', '-created_at', '-id'], name='order_customer_created_idx'),
+            models.Index(fields=['restaurant', '-created_at', '-id'], name='order_restaurant_created_idx'),
+            # Feed de mudanças do painel do restaurante
+            models.Index(fields=['restaurant', 'updated_at', 'id'], name='order_restaurant_updated_idx'),
+            # Pedidos aguardando entregador: índice parcial, pequeno mesmo com histórico grande
+            models.Index(
+                fields=['created_at', 'id'],
+                name='order_available_idx',
+                condition=models.Q(status='out_for_delivery', driver__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         return f"Pedido #{self.id} - {self.customer.username}"
@@ -66,6 +113,52 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1, verbose_name="Quantidade")
+    # Cópia do item no momento do pedido: o histórico não muda quando o
+    # cardápio muda e pode ser exibido sem consultar MenuItem.
+    name = models.CharField(max_length=100, default='', verbose_name="Nome do Item")
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Preço Unitário")
+
+    def save(self, *args, **kwargs):
+        # bulk_create não passa por aqui: quem cria em lote preenche a cópia.
+        if self.unit_price is None:
+            self.name = self.menu_item.name
+            self.unit_price = self.menu_item.price
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.quantity}x {self.name} no Pedido #{self.order_id}"
+
+
+class RestaurantDailyStats(models.Model):
+    """
+    Agregado mantido incrementalmente: pedidos e soma de total_price por
+    restaurante, dia de criação do pedido e status atual. O painel do dono
+    lê daqui sem varrer Order (veja api/stats.py).
+    """
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_stats', verbose_name="Restaurante")
+    day = models.DateField(verbose_name="Dia")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Status")
+    order_count = models.IntegerField(default=0, verbose_name="Pedidos")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Receita")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'day', 'status'], name='restaurant_daily_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant_id} {self.day} {self.status}: {self.order_count}"
+
+
+class RevokedToken(models.Model):
+    """
+    Lista de revogação dos JWT (veja api/authentication.py), no banco para
+    valer em todos os processos. `key` identifica um token (pelo jti) ou
+    todos os tokens de um usuário emitidos até `revoked_at`.
+    """
+    key = models.CharField(max_length=64, primary_key=True, verbose_name="Chave")
+    revoked_at = models.BigIntegerField(verbose_name="Revogado em (timestamp)")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Expira em")
 
     def __str__(self):
-        return f"{self.quantity}x {self.menu_item.name} no Pedido #{self.order.id}"
+        return self.key
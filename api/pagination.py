@@ -0,0 +1,125 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class BaseCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset): cada página é buscada a partir da posição
+    da anterior, então o custo não cresce com o tamanho do histórico.
+    O cliente pode pedir ?page_size=N até o limite de API_MAX_PAGE_SIZE.
+    """
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        # Lidos a cada requisição para que possam ser ajustados via settings/env.
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+
+class OrderCursorPagination(BaseCursorPagination):
+    # Pedidos mais recentes primeiro; o id desempata pedidos criados no mesmo instante.
+    ordering = ('-created_at', '-id')
+
+
+class AvailableOrderCursorPagination(BaseCursorPagination):
+    # Para os entregadores, os pedidos mais antigos aparecem primeiro.
+    ordering = ('created_at', 'id')
+
+
+class IdCursorPagination(BaseCursorPagination):
+    ordering = ('id',)
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    Resultados da busca: já vêm ordenados por relevância e limitados a
+    SEARCH_MAX_RESULTS, então a página é escolhida pelo número (?page=N).
+    """
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class ChangeCursor:
+    """
+    Cursor do feed de mudanças. O updated_at é carimbado no save, não no
+    commit: uma transação que demora a terminar (a criação do pedido, uma
+    atualização que esperou o select_for_update) pode aparecer com um instante
+    que o cliente já passou. Por isso o cursor guarda uma marca d'água que fica
+    ORDER_FEED_LOOKBACK segundos atrás do relógio, e a janela depois dela é
+    relida a cada consulta; os pedidos já entregues nessa janela ficam no
+    cursor, pelo par (id, updated_at), e não se repetem.
+    Formato: `<marca em µs>~<id>.<µs depois da marca>~...`, seguro em URLs.
+    """
+
+    def __init__(self, watermark, seen=None):
+        self.watermark = watermark
+        self.seen = seen or {}
+
+    @classmethod
+    def starting_at(cls, now):
+        return cls(now - timedelta(seconds=settings.ORDER_FEED_LOOKBACK))
+
+    def encode(self):
+        micros = (self.watermark - EPOCH) // MICROSECOND
+        return f'{micros}' + ''.join(
+            f'~{pk}.{(updated_at - self.watermark) // MICROSECOND}' for pk, updated_at in sorted(self.seen.items())
+        )
+
+    def unseen(self, orders):
+        """Tira da lista os pedidos já entregues com o mesmo updated_at."""
+        return [order for order in orders if self.seen.get(order.pk) != order.updated_at]
+
+    def advance(self, delivered, has_more=False):
+        """
+        Cursor depois de entregar `delivered` (pares (id, updated_at) na ordem
+        do feed). Com has_more a marca não passa do último entregue, para que
+        o resto da página seguinte continue depois dela.
+        """
+        delivered = list(delivered)
+        watermark = max(self.watermark, datetime.now(timezone.utc) - timedelta(seconds=settings.ORDER_FEED_LOOKBACK))
+        if has_more:
+            watermark = min(watermark, delivered[-1][1] - MICROSECOND)
+        seen = {**self.seen, **dict(delivered)}
+        return ChangeCursor(watermark, {pk: updated_at for pk, updated_at in seen.items() if updated_at > watermark})
+
+
+def decode_change_cursor(cursor):
+    try:
+        micros, *entries = cursor.split('~')
+        watermark = EPOCH + int(micros) * MICROSECOND
+        seen = {}
+        for entry in entries:
+            pk, offset = entry.split('.')
+            seen[int(pk)] = watermark + int(offset) * MICROSECOND
+        return ChangeCursor(watermark, seen)
+    except (ValueError, OverflowError):
+        # OverflowError: instantes fora do alcance de datetime.
+        raise ValidationError({'since': 'Cursor inválido.'})
+
+
+def parse_feed_wait(value):
+    """
+    Segundos de long-poll pedidos em ?wait=, limitados a [0, ORDER_FEED_MAX_WAIT].
+    Valores inválidos ou não finitos ("nan", "inf") viram 0: um nan passaria
+    pelo min() e nunca expiraria.
+    """
+    try:
+        wait = float(value or 0)
+    except ValueError:
+        return 0
+    if not math.isfinite(wait):
+        return 0
+    return max(0, min(wait, settings.ORDER_FEED_MAX_WAIT))
@@ -0,0 +1,118 @@
+import contextvars
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+
+class _Routing:
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+# Estado da requisição em andamento (None fora de uma view de leitura).
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+# Leitura das próprias escritas: depois de gravar, o usuário (ou um escopo de
+# cache) lê do banco principal por REPLICA_STICKY_SECONDS, tempo suficiente
+# para a réplica alcançar. A marca fica no cache padrão, que precisa ser
+# compartilhado entre os processos (veja check_replica_cache).
+
+def _recent_write_key(key):
+    return f'db-recent-write:{key}'
+
+
+def mark_recent_write(*keys):
+    if settings.DATABASE_REPLICA_ALIAS:
+        cache.set_many({_recent_write_key(key): True for key in keys}, settings.REPLICA_STICKY_SECONDS)
+
+
+async def amark_recent_write(*keys):
+    if settings.DATABASE_REPLICA_ALIAS:
+        await cache.aset_many({_recent_write_key(key): True for key in keys}, settings.REPLICA_STICKY_SECONDS)
+
+
+def wrote_recently(*keys):
+    return bool(keys) and bool(cache.get_many([_recent_write_key(key) for key in keys]))
+
+
+def check_replica_cache(app_configs, **kwargs):
+    """
+    Com réplica, o cache padrão precisa ser compartilhado: num LocMemCache a
+    escrita feita num worker não é vista pelo próximo, que leria da réplica
+    atrasada.
+    """
+    if settings.DATABASE_REPLICA_ALIAS and isinstance(caches['default'], (LocMemCache, DummyCache)):
+        return [checks.Error(
+            "DATABASE_REPLICA_ALIAS exige um cache compartilhado entre os processos.",
+            hint="Configure CACHE_BACKEND com Redis ou Memcached, ou remova DB_REPLICA_HOST/DB_REPLICA_NAME.",
+            id='api.E001',
+        )]
+    return []
+
+
+class PrimaryReplicaRouter:
+    """
+    Escritas sempre no principal. Leituras vão para a réplica
+    (DATABASE_REPLICA_ALIAS) só dentro de uma view marcada com
+    ReplicaReadMixin, e voltam ao principal se a própria requisição escrever.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if settings.DATABASE_REPLICA_ALIAS and state is not None and state.use_replica and not state.wrote:
+            return settings.DATABASE_REPLICA_ALIAS
+        # Explícito: sem isso o Django usaria o banco de onde a instância veio.
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A réplica tem os mesmos dados do principal.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # O esquema chega à réplica pela replicação.
+        return db != settings.DATABASE_REPLICA_ALIAS
+
+
+class ReplicaReadMixin:
+    """
+    Para views DRF de leitura: GETs leem da réplica, exceto logo depois de
+    uma escrita do mesmo usuário ou, nas listagens em cache, de uma
+    invalidação do escopo (o cache não pode ser repopulado com dados atrasados).
+    """
+
+    def get_replica_sticky_keys(self):
+        keys = []
+        user = self.request.user
+        if user.is_authenticated:
+            keys.append(f'user:{user.id}')
+        if hasattr(self, 'get_cache_scope'):
+            keys.append(f'scope:{self.get_cache_scope()}')
+        return keys
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _routing.set(_Routing())
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _routing.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (settings.DATABASE_REPLICA_ALIAS and request.method in SAFE_METHODS
+                and not wrote_recently(*self.get_replica_sticky_keys())):
+            _routing.get().use_replica = True
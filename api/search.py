@@ -0,0 +1,269 @@
+"""
+Busca pública em restaurantes ativos (nome) e itens disponíveis do cardápio
+(nome e descrição), sem diferenciar acentos nem maiúsculas. A última palavra
+vale como prefixo ("calab" acha "Calabresa") e erros de digitação são
+tolerados por similaridade de trigramas ("piza" acha "Pizza").
+
+No PostgreSQL a busca usa a configuração textual portuguese_unaccent e os
+índices GIN criados na migração 0012 (veja a seção Busca do README). Nos
+outros bancos (SQLite no desenvolvimento) usa um índice invertido em memória
+com a mesma normalização, reconstruído quando a versão de SEARCH_SCOPE muda.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import BooleanField, CharField, F, Func, Q, Value
+
+from .cache import SEARCH_SCOPE, get_version
+from .models import MenuItem, Restaurant
+
+TEXT_SEARCH_CONFIG = 'portuguese_unaccent'
+
+# Pesos de nome e descrição no índice em memória, os mesmos das classes A e B do ts_rank.
+NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+
+TOKEN_RE = re.compile(r'\w+')
+# Palavras que aparecem em quase tudo ("Pão de Queijo"); o dicionário portuguese do PostgreSQL também as ignora.
+STOPWORDS = frozenset('a o as os e de da do das dos em na no nas nos um uma com por para ao aos'.split())
+
+
+def normalize(text):
+    """Minúsculas e sem acentos: 'Pão' -> 'pao'."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(normalize(text or '')) if token not in STOPWORDS]
+
+
+def trigrams(word):
+    # Como no pg_trgm: dois espaços antes da palavra e um depois.
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def search(query, limit=None):
+    """
+    Os `limit` (padrão SEARCH_MAX_RESULTS) resultados mais relevantes para
+    `query`, como dicts {type, id, score}; type é 'restaurant' ou 'menu_item'.
+    O score só é comparável dentro da mesma busca.
+    """
+    limit = limit or settings.SEARCH_MAX_RESULTS
+    if _uses_postgres():
+        hits = _postgres_search(query, limit)
+    else:
+        hits = get_search_index().search(query, limit, settings.SEARCH_FUZZY_THRESHOLD)
+    return [{'type': kind, 'id': pk, 'score': round(score, 4)} for score, kind, pk in hits]
+
+
+def load_results(hits):
+    """Anexa a cada resultado da página o restaurante ou item, com uma consulta por tipo."""
+    ids = defaultdict(list)
+    for hit in hits:
+        ids[hit['type']].append(hit['id'])
+    objects = {
+        'restaurant': Restaurant.objects.select_related('owner').in_bulk(ids['restaurant']) if ids['restaurant'] else {},
+        'menu_item': MenuItem.objects.select_related('restaurant').in_bulk(ids['menu_item']) if ids['menu_item'] else {},
+    }
+    # Algo removido entre a busca e a leitura some da página.
+    return [
+        {**hit, hit['type']: objects[hit['type']][hit['id']]}
+        for hit in hits if hit['id'] in objects[hit['type']]
+    ]
+
+
+def _uses_postgres():
+    if settings.SEARCH_BACKEND == 'auto':
+        return connections[router.db_for_read(MenuItem)].vendor == 'postgresql'
+    return settings.SEARCH_BACKEND == 'postgres'
+
+
+def _ranked(hits, limit):
+    # Maior score primeiro; o tipo e o id desempatam para a paginação ser estável.
+    return heapq.nsmallest(limit, hits, key=lambda hit: (-hit[0], hit[1], hit[2]))
+
+
+# --- PostgreSQL -------------------------------------------------------------
+
+class Unaccent(Func):
+    # f_unaccent é o unaccent() declarado IMMUTABLE (migração 0012), para poder ser indexado.
+    function = 'f_unaccent'
+    output_field = CharField()
+
+
+class WordSimilar(Func):
+    # `texto <% coluna`: word_similarity acima de pg_trgm.word_similarity_threshold, pelo índice de trigramas.
+    template = '(%(expressions)s)'
+    arg_joiner = ' <%% '
+    output_field = BooleanField()
+
+
+def _postgres_search(query, limit):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    # Os tokens só têm letras e dígitos, então podem ir direto para o to_tsquery.
+    tsquery = SearchQuery(' & '.join(tokens) + ':*', config=TEXT_SEARCH_CONFIG, search_type='raw')
+    text = ' '.join(tokens)
+    # Mesmas expressões dos índices GIN da migração 0012: se mudarem, os índices deixam de ser usados.
+    name_vector = SearchVector('name', config=TEXT_SEARCH_CONFIG, weight='A')
+    sources = (
+        ('restaurant', Restaurant.objects.filter(is_active=True), name_vector),
+        (
+            'menu_item',
+            MenuItem.objects.filter(is_available=True, restaurant__is_active=True),
+            name_vector + SearchVector('description', config=TEXT_SEARCH_CONFIG, weight='B'),
+        ),
+    )
+    hits = []
+    for kind, queryset, vector in sources:
+        rows = (
+            queryset.alias(document=vector)
+            .filter(Q(document=tsquery) | Q(WordSimilar(Value(text), Unaccent('name'))))
+            .annotate(rank=SearchRank(F('document'), tsquery) + TrigramWordSimilarity(Value(text), Unaccent('name')))
+            .order_by('-rank', 'id')
+            .values_list('rank', 'id')[:limit]
+        )
+        hits.extend((rank, kind, pk) for rank, pk in rows)
+    return _ranked(hits, limit)
+
+
+# --- Índice em memória ------------------------------------------------------
+
+class SearchIndex:
+    """
+    Índice invertido: termo normalizado -> {(tipo, id): peso}. O peso é o
+    do campo de maior peso em que o termo aparece (nome ou descrição).
+    Depois de add(), freeze() monta a lista ordenada de termos (prefixos)
+    e o índice de trigramas dos termos (erros de digitação).
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self._postings = defaultdict(dict)
+        self._documents = 0
+        self._terms = []
+        self._trigrams = defaultdict(list)
+
+    def __len__(self):
+        return self._documents
+
+    def add(self, kind, pk, name, description=''):
+        document = (kind, pk)
+        self._documents += 1
+        for weight, text in ((NAME_WEIGHT, name), (DESCRIPTION_WEIGHT, description)):
+            for term in tokenize(text):
+                postings = self._postings[term]
+                if postings.get(document, 0) < weight:
+                    postings[document] = weight
+
+    def freeze(self):
+        self._terms = sorted(self._postings)
+        self._trigrams.clear()
+        for term in self._terms:
+            for trigram in trigrams(term):
+                self._trigrams[trigram].append(term)
+        return self
+
+    def expand(self, token, prefix, threshold):
+        """
+        Termos do índice que casam com `token`, com a qualidade do casamento:
+        1 para o termo exato ou, se `prefix`, para os que começam com ele;
+        para os demais, a similaridade de palavra do pg_trgm (trigramas em
+        comum / trigramas de `token`), se for pelo menos `threshold`.
+        """
+        matches = {}
+        if prefix:
+            position = bisect_left(self._terms, token)
+            while position < len(self._terms) and self._terms[position].startswith(token):
+                matches[self._terms[position]] = 1.0
+                position += 1
+        elif token in self._postings:
+            matches[token] = 1.0
+        token_trigrams = trigrams(token)
+        common = Counter()
+        for trigram in token_trigrams:
+            common.update(self._trigrams.get(trigram, ()))
+        for term, count in common.items():
+            similarity = count / len(token_trigrams)
+            if similarity >= threshold and similarity > matches.get(term, 0):
+                matches[term] = similarity
+        return matches
+
+    def search(self, query, limit, threshold):
+        """
+        Documentos que casam com todas as palavras de `query` (a última como
+        prefixo). O score é a média, por palavra, do melhor peso × qualidade.
+        Retorna [(score, tipo, id)] em ordem de relevância.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores = None
+        for position, token in enumerate(tokens):
+            token_scores = {}
+            for term, quality in self.expand(token, position == len(tokens) - 1, threshold).items():
+                for document, weight in self._postings[term].items():
+                    if weight * quality > token_scores.get(document, 0):
+                        token_scores[document] = weight * quality
+            if scores is not None:
+                token_scores = {
+                    document: scores[document] + score
+                    for document, score in token_scores.items() if document in scores
+                }
+            scores = token_scores
+            if not scores:
+                return []
+        return _ranked(((score / len(tokens), kind, pk) for (kind, pk), score in scores.items()), limit)
+
+
+def build_search_index(version=None):
+    index = SearchIndex(version)
+    chunk_size = settings.SEARCH_INDEX_CHUNK_SIZE
+    for pk, name in Restaurant.objects.filter(is_active=True).values_list('id', 'name').iterator(chunk_size=chunk_size):
+        index.add('restaurant', pk, name)
+    items = (
+        MenuItem.objects.filter(is_available=True, restaurant__is_active=True)
+        .values_list('id', 'name', 'description').iterator(chunk_size=chunk_size)
+    )
+    for pk, name, description in items:
+        index.add('menu_item', pk, name, description)
+    return index.freeze()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """
+    Índice em memória do processo. Qualquer alteração em restaurantes ou
+    itens troca a versão de SEARCH_SCOPE (signals e importação do cardápio),
+    e a próxima busca de cada worker reconstrói o índice a partir do banco.
+    """
+    global _index
+    # Lida antes de montar o índice: uma alteração durante a montagem troca a versão de novo.
+    version = get_version(SEARCH_SCOPE)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = build_search_index(version)
+        return _index
+
+
+def reset_search_index():
+    global _index
+    with _index_lock:
+        _index = None
@@ -1,9 +1,43 @@
+import math
+
 from rest_framework import serializers
+from rest_framework.fields import empty
+from django.conf import settings
 from django.db import transaction
 from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import RoleRefreshToken, is_token_revoked
+from .middleware import time_serializer
+from .stats import record_order_created
 from .models import User, Restaurant, MenuItem, Order, OrderItem
+from .search import tokenize
+
+
+class ProfiledSerializerMixin:
+    """
+    Conta a serialização e a validação no tempo de serializers do
+    ProfilingMiddleware. Todo serializer da API herda dele (via Serializer e
+    ModelSerializer abaixo); numa lista, cada item passa por aqui.
+    """
+
+    def to_representation(self, instance):
+        return time_serializer(super().to_representation, instance)
+
+    def run_validation(self, data=empty):
+        return time_serializer(super().run_validation, data)
+
+
+class Serializer(ProfiledSerializerMixin, serializers.Serializer):
+    pass
+
+
+class ModelSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    pass
+
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(ModelSerializer):
     # Usamos CharField com write_only=True para a senha,
     # para que ela seja usada na criação mas não seja exibida nas respostas da API.
     password = serializers.CharField(write_only=True)
@@ -27,28 +61,60 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         )
         return user
     
-class UserProfileSerializer(serializers.ModelSerializer):
+class RoleTokenObtainPairSerializer(ProfiledSerializerMixin, TokenObtainPairSerializer):
+    # Inclui o claim "role" nos tokens emitidos no login.
+    token_class = RoleRefreshToken
+
+class RevocableTokenRefreshSerializer(ProfiledSerializerMixin, TokenRefreshSerializer):
+    def validate(self, attrs):
+        try:
+            refresh = RefreshToken(attrs['refresh'])
+        except TokenError as exc:
+            raise InvalidToken(exc.args[0])
+        if is_token_revoked(refresh):
+            raise InvalidToken("O token foi revogado.")
+        return super().validate(attrs)
+
+class TokenRevokeSerializer(Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            return RefreshToken(value)
+        except TokenError as exc:
+            raise ValidationError(exc.args[0])
+
+class UserProfileSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'role', 'phone_number')
         read_only_fields = ('username', 'role')
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class RestaurantSerializer(ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
 
     class Meta:
         model = Restaurant
-        fields = ('id', 'owner', 'name', 'address', 'phone', 'is_active')
+        fields = ('id', 'owner', 'name', 'address', 'phone', 'is_active', 'latitude', 'longitude')
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(ModelSerializer):
     restaurant = serializers.ReadOnlyField(source='restaurant.name')
 
     class Meta:
         model = MenuItem
         fields = ('id', 'restaurant', 'name', 'description', 'price', 'is_available')
 
-class OrderItemCreateSerializer(serializers.ModelSerializer):
-    menu_item = serializers.PrimaryKeyRelatedField(queryset=MenuItem.objects.all())
+# Uma linha da importação do cardápio (api/menu_io.py): com id atualiza, sem id cria.
+class MenuItemImportSerializer(ModelSerializer):
+    id = serializers.IntegerField(required=False, min_value=1)
+
+    class Meta:
+        model = MenuItem
+        fields = ('id', 'name', 'description', 'price', 'is_available')
+
+class OrderItemCreateSerializer(ModelSerializer):
+    # Só o id: os itens são buscados todos de uma vez no OrderCreateSerializer.
+    menu_item = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = OrderItem
@@ -56,63 +122,149 @@ class OrderItemCreateSerializer(serializers.ModelSerializer):
 
 
 # 2. Serializer para CRIAR o pedido (só para INPUT)
-class OrderCreateSerializer(serializers.ModelSerializer):
-    items = OrderItemCreateSerializer(many=True)
+class OrderCreateSerializer(ModelSerializer):
+    items = OrderItemCreateSerializer(many=True, allow_empty=False)
 
     class Meta:
         model = Order
         fields = ('restaurant', 'delivery_address', 'items')
 
+    def validate(self, attrs):
+        restaurant = attrs['restaurant']
+        items_data = attrs['items']
+
+        # Uma única query para todos os itens do carrinho, restrita aos itens
+        # disponíveis do restaurante do pedido.
+        menu_item_ids = {item_data['menu_item'] for item_data in items_data}
+        menu_items = MenuItem.objects.filter(
+            restaurant=restaurant, is_available=True, pk__in=menu_item_ids
+        ).only('id', 'name', 'price', 'restaurant_id').in_bulk()
+
+        missing = sorted(menu_item_ids - menu_items.keys())
+        if missing:
+            raise ValidationError({
+                'items': f"Itens indisponíveis ou que não pertencem ao restaurante '{restaurant.name}': {missing}."
+            })
+
+        for item_data in items_data:
+            item_data['menu_item'] = menu_items[item_data['menu_item']]
+        return attrs
+
     def create(self, validated_data):
-        customer = self.context['request'].user
+        customer_id = self.context['request'].user.id
         items_data = validated_data.pop('items')
-        restaurant = validated_data['restaurant']
+
+        total_price = sum(item_data['menu_item'].price * item_data['quantity'] for item_data in items_data)
 
         with transaction.atomic():
-            total_price = 0
-            for item_data in items_data:
-                menu_item = item_data['menu_item']
-                if menu_item.restaurant != restaurant:
-                    raise ValidationError(f"O item '{menu_item.name}' não pertence ao restaurante '{restaurant.name}'.")
-                total_price += menu_item.price * item_data['quantity']
-            
             order = Order.objects.create(
-                customer=customer,
+                customer_id=customer_id,
                 total_price=total_price,
                 **validated_data
             )
-
-            for item_data in items_data:
-                OrderItem.objects.create(
+            OrderItem.objects.bulk_create(
+                OrderItem(
                     order=order,
                     menu_item=item_data['menu_item'],
-                    quantity=item_data['quantity']
+                    quantity=item_data['quantity'],
+                    name=item_data['menu_item'].name,
+                    unit_price=item_data['menu_item'].price,
                 )
+                for item_data in items_data
+            )
+            record_order_created(order)
             return order
 
-# 3. Serializer para EXIBIR um item com detalhes (usado dentro do OrderDisplaySerializer)
-class OrderItemDisplaySerializer(serializers.ModelSerializer):
-    menu_item = MenuItemSerializer()
+# 3. Serializer para EXIBIR um item (usado dentro do OrderDisplaySerializer).
+# Só campos da própria linha, copiados na criação: nenhum join com MenuItem/Restaurant.
+class OrderItemDisplaySerializer(ModelSerializer):
+    menu_item = serializers.IntegerField(source='menu_item_id')
 
     class Meta:
         model = OrderItem
-        fields = ('menu_item', 'quantity')
+        fields = ('menu_item', 'name', 'unit_price', 'quantity')
 
 # 4. Serializer para EXIBIR um pedido completo (só para OUTPUT)
-class OrderDisplaySerializer(serializers.ModelSerializer):
+class OrderDisplaySerializer(ModelSerializer):
     items = OrderItemDisplaySerializer(many=True, source='orderitem_set')
     customer = serializers.ReadOnlyField(source='customer.username')
     restaurant = RestaurantSerializer()
 
     class Meta:
         model = Order
-        fields = ('id', 'customer', 'restaurant', 'items', 'status', 'total_price', 'delivery_address', 'created_at')
+        fields = ('id', 'customer', 'restaurant', 'items', 'status', 'total_price', 'delivery_address', 'created_at', 'updated_at')
+
+# Pedido disponível com a distância até o entregador (api/geo.py)
+class NearbyOrderSerializer(OrderDisplaySerializer):
+    distance_km = serializers.FloatField(read_only=True)
+
+    class Meta(OrderDisplaySerializer.Meta):
+        fields = OrderDisplaySerializer.Meta.fields + ('distance_km',)
 
-class OrderStatusUpdateSerializer(serializers.ModelSerializer):
+class OrderStatusUpdateSerializer(ModelSerializer):
     class Meta:
         model = Order
         fields = ['status',]
 
-class LocationSerializer(serializers.Serializer):
-    lat = serializers.FloatField()
-    lng = serializers.FloatField()    
\ No newline at end of file
+# Filtros da exportação do histórico (?start=&end=&file_format=)
+class OrderExportQuerySerializer(Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    file_format = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({"end": "A data final deve ser igual ou posterior à inicial."})
+        return attrs
+
+class DailyStatsSerializer(Serializer):
+    day = serializers.DateField()
+    orders = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+# Painel do dono (só OUTPUT), montado por api.stats.dashboard
+class RestaurantStatsSerializer(Serializer):
+    since = serializers.DateField()
+    by_status = serializers.DictField(child=serializers.IntegerField())
+    daily = DailyStatsSerializer(many=True)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+# FloatField aceita "nan", "inf" e 1e999, que passam por min_value/max_value
+# (toda comparação com nan é falsa) e quebram o índice de despacho (api/geo.py).
+class FiniteFloatField(serializers.FloatField):
+    default_error_messages = {'non_finite': "Informe um número finito."}
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not math.isfinite(value):
+            self.fail('non_finite')
+        return value
+
+class LocationSerializer(Serializer):
+    lat = FiniteFloatField(min_value=-90, max_value=90)
+    lng = FiniteFloatField(min_value=-180, max_value=180)
+
+# Filtro por raio dos pedidos disponíveis (?lat=&lng=&radius=)
+class NearbyQuerySerializer(Serializer):
+    lat = FiniteFloatField(min_value=-90, max_value=90)
+    lng = FiniteFloatField(min_value=-180, max_value=180)
+    radius = FiniteFloatField(required=False, min_value=0.1)
+
+    def validate_radius(self, value):
+        return min(value, settings.DISPATCH_MAX_RADIUS_KM)
+
+# Busca pública (?q=)
+class SearchQuerySerializer(Serializer):
+    q = serializers.CharField(max_length=100)
+
+    def validate_q(self, value):
+        if not tokenize(value):
+            raise serializers.ValidationError("Informe ao menos uma palavra.")
+        return value
+
+# Um resultado da busca (só OUTPUT): traz o restaurante ou o item, conforme o tipo.
+class SearchResultSerializer(Serializer):
+    type = serializers.CharField()
+    score = serializers.FloatField()
+    restaurant = RestaurantSerializer(required=False)
+    menu_item = MenuItemSerializer(required=False)
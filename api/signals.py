@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import forget_cached_user, revoke_user_tokens
+from .cache import RESTAURANT_LIST_SCOPE, SEARCH_SCOPE, allow_driver_order, bump_version, forget_driver_order, menu_scope
+from .models import User, Restaurant, MenuItem, Order
+from .streams import driver_order_changes, restaurant_order_changes
+
+
+# As versões só mudam depois do commit: uma leitura que perdesse o cache antes
+# disso guardaria os dados antigos já com a versão nova, até o
+# PUBLIC_CACHE_TIMEOUT. O id é lido agora; depois do delete o pk vira None.
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def invalidate_restaurant_cache(sender, instance, **kwargs):
+    restaurant_id = instance.pk
+    transaction.on_commit(lambda: bump_version(RESTAURANT_LIST_SCOPE))
+    # Os itens do cardápio exibem o nome do restaurante.
+    transaction.on_commit(lambda: bump_version(menu_scope(restaurant_id)))
+    invalidate_search()
+
+
+@receiver([post_save, post_delete], sender=MenuItem)
+def invalidate_menu_cache(sender, instance, **kwargs):
+    restaurant_id = instance.restaurant_id
+    transaction.on_commit(lambda: bump_version(menu_scope(restaurant_id)))
+    invalidate_search()
+
+
+def invalidate_search():
+    # Vale também para o índice de busca que cada worker monta.
+    transaction.on_commit(lambda: bump_version(SEARCH_SCOPE))
+
+
+@receiver(post_save, sender=Order)
+def sync_driver_order_cache(sender, instance, **kwargs):
+    # Só pedidos em entrega com entregador definido autorizam envio de localização;
+    # mudança de status ou de entregador invalida a entrada anterior. Só depois
+    # do commit: uma transação desfeita não deixa autorização no cache.
+    order_id, driver_id = instance.pk, instance.driver_id
+    if instance.status == 'out_for_delivery' and driver_id is not None:
+        transaction.on_commit(lambda: allow_driver_order(driver_id, order_id))
+    else:
+        transaction.on_commit(lambda: forget_driver_order(order_id))
+
+
+@receiver(post_delete, sender=Order)
+def forget_deleted_order(sender, instance, **kwargs):
+    order_id = instance.pk
+    transaction.on_commit(lambda: forget_driver_order(order_id))
+
+
+@receiver(post_save, sender=Order)
+def notify_restaurant_order_change(sender, instance, **kwargs):
+    # Só depois do commit: quem está em long-poll precisa enxergar a mudança ao consultar.
+    restaurant_id = instance.restaurant_id
+    transaction.on_commit(lambda: restaurant_order_changes.notify(restaurant_id))
+    driver_id = instance.driver_id
+    if driver_id is not None:
+        transaction.on_commit(lambda: driver_order_changes.notify(driver_id))
+
+
+@receiver(post_init, sender=User)
+def remember_user_is_active(sender, instance, **kwargs):
+    # Pelo __dict__: um is_active adiado (only/defer) não dispara uma consulta aqui.
+    instance._was_active = instance.__dict__.get('is_active')
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    forget_cached_user(instance.pk)
+    # Usuário desativado perde os tokens já emitidos; só na transição, não a
+    # cada save de um usuário que já estava inativo.
+    if instance._was_active and not instance.is_active:
+        revoke_user_tokens(instance.pk)
+    instance._was_active = instance.is_active
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    forget_cached_user(instance.pk)
+    revoke_user_tokens(instance.pk)
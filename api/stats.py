@@ -0,0 +1,98 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, RestaurantDailyStats
+
+# Status que não contam como receita no painel.
+NON_REVENUE_STATUSES = {'cancelled'}
+
+
+def order_day(order):
+    return timezone.localdate(order.created_at)
+
+
+def _apply(restaurant_id, day, status, count, revenue):
+    """
+    Soma `count` e `revenue` à linha (restaurante, dia, status), criando-a
+    se preciso. O UPDATE com F() é atômico, então pedidos simultâneos não
+    perdem incrementos.
+    """
+    lookup = {'restaurant_id': restaurant_id, 'day': day, 'status': status}
+    increments = {'order_count': F('order_count') + count, 'revenue': F('revenue') + revenue}
+    if RestaurantDailyStats.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            RestaurantDailyStats.objects.create(**lookup, order_count=count, revenue=revenue)
+    except IntegrityError:
+        # Outra transação criou a linha entre o UPDATE e o INSERT.
+        RestaurantDailyStats.objects.filter(**lookup).update(**increments)
+
+
+def record_order_created(order):
+    _apply(order.restaurant_id, order_day(order), order.status, 1, order.total_price)
+
+
+def record_status_change(order, old_status):
+    """Move o pedido do agregado do status antigo para o do novo, no dia em que foi criado."""
+    if old_status == order.status:
+        return
+    day = order_day(order)
+    _apply(order.restaurant_id, day, old_status, -1, -order.total_price)
+    _apply(order.restaurant_id, day, order.status, 1, order.total_price)
+
+
+def rebuild_stats(restaurant_id=None):
+    """
+    Recalcula o agregado a partir de Order (backfill ou correção depois de
+    alterações feitas fora da API). Retorna o número de linhas gravadas.
+    """
+    orders = Order.objects.all()
+    stats = RestaurantDailyStats.objects.all()
+    if restaurant_id is not None:
+        orders = orders.filter(restaurant_id=restaurant_id)
+        stats = stats.filter(restaurant_id=restaurant_id)
+
+    rows = (
+        orders.annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        .values('restaurant_id', 'day', 'status')
+        .annotate(order_count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    with transaction.atomic():
+        stats.delete()
+        created = RestaurantDailyStats.objects.bulk_create(
+            (RestaurantDailyStats(**row) for row in rows.iterator()), batch_size=1000
+        )
+    return len(created)
+
+
+def dashboard(restaurant_id, days):
+    """
+    Painel dos últimos `days` dias: pedidos por status e pedidos/receita por
+    dia. Lê no máximo days × status linhas do agregado.
+    """
+    start = timezone.localdate() - timedelta(days=days - 1)
+    rows = RestaurantDailyStats.objects.filter(
+        restaurant_id=restaurant_id, day__gte=start
+    ).values_list('day', 'status', 'order_count', 'revenue')
+
+    by_status = dict.fromkeys((status for status, _ in Order.STATUS_CHOICES), 0)
+    daily = {}
+    for day, status, count, revenue in rows:
+        by_status[status] += count
+        entry = daily.setdefault(day, {'day': day, 'orders': 0, 'revenue': Decimal('0')})
+        entry['orders'] += count
+        if status not in NON_REVENUE_STATUSES:
+            entry['revenue'] += revenue
+    return {
+        'since': start,
+        'by_status': by_status,
+        'daily': [daily[day] for day in sorted(daily)],
+        'revenue': sum((entry['revenue'] for entry in daily.values()), Decimal('0')),
+    }
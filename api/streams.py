@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento publicados no hub de pedidos.
+ORDER_EVENT_TYPES = ('status', 'location')
+
+
+class Subscription:
+    """
+    Fila de um único assinante. Em vez de acumular eventos, guarda só o mais
+    recente de cada tipo (drop-to-latest): um cliente lento recebe a posição
+    atual quando conseguir ler, e nunca atrasa os demais.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+
+    def push(self, event, data):
+        # Pode ser chamado de qualquer thread (views síncronas rodam fora do event loop).
+        with self._lock:
+            self._latest[event] = data
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # Event loop já encerrado: o assinante está indo embora.
+            pass
+
+    async def next_events(self, timeout):
+        """
+        Espera até `timeout` segundos por eventos e devolve uma lista de
+        pares (tipo, dados). Lista vazia significa que nada chegou.
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        with self._lock:
+            events, self._latest = self._latest, {}
+        return list(events.items())
+
+
+class OrderEventHub:
+    """
+    Pub/sub em memória por pedido: as views publicam localização e status e
+    cada conexão de acompanhamento aberta recebe sua cópia. Cada worker tem o
+    seu hub; com um cache compartilhado (Redis ou Memcached) o último evento
+    de cada tipo também vai para o cache, e uma thread de relay entrega aos
+    assinantes deste processo o que outros workers publicaram.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        # (order_id, tipo) -> marca do último evento entregue aqui, para o relay não repetir.
+        self._stamps = {}
+        self._lock = threading.Lock()
+        self._relay_thread = None
+
+    def subscribe(self, order_id):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[order_id].add(subscription)
+        if relay_enabled():
+            self._ensure_relay()
+        return subscription
+
+    def unsubscribe(self, order_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(order_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[order_id]
+                    for event in ORDER_EVENT_TYPES:
+                        self._stamps.pop((order_id, event), None)
+
+    def publish(self, order_id, event, data):
+        stamp = uuid.uuid4().hex
+        if relay_enabled():
+            cache.set(_relay_key(order_id, event), (stamp, data), settings.ORDER_STREAM_RELAY_TIMEOUT)
+        self._deliver(order_id, event, stamp, data)
+
+    def _deliver(self, order_id, event, stamp, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(order_id, ()))
+            if subscribers:
+                self._stamps[(order_id, event)] = stamp
+        for subscription in subscribers:
+            subscription.push(event, data)
+
+    def relay(self):
+        """
+        Uma passada do relay: lê do cache o último evento de cada pedido com
+        assinantes neste processo e entrega os que ainda não passaram por
+        aqui. Retorna quantos eventos foram entregues.
+        """
+        with self._lock:
+            order_ids = list(self._subscribers)
+        if not order_ids:
+            return 0
+        keys = {_relay_key(order_id, event): (order_id, event) for order_id in order_ids for event in ORDER_EVENT_TYPES}
+        delivered = 0
+        for key, (stamp, data) in cache.get_many(list(keys)).items():
+            order_id, event = keys[key]
+            with self._lock:
+                seen = self._stamps.get((order_id, event)) == stamp
+            if not seen:
+                self._deliver(order_id, event, stamp, data)
+                delivered += 1
+        return delivered
+
+    def _ensure_relay(self):
+        # Iniciada no primeiro assinante, já dentro do worker (depois do fork).
+        if self._relay_thread is not None and self._relay_thread.is_alive():
+            return
+        with self._lock:
+            if self._relay_thread is not None and self._relay_thread.is_alive():
+                return
+            self._relay_thread = threading.Thread(target=self._run_relay, name='order-events-relay', daemon=True)
+            self._relay_thread.start()
+
+    def _run_relay(self):
+        while True:
+            time.sleep(settings.ORDER_STREAM_RELAY_INTERVAL)
+            try:
+                self.relay()
+            except Exception:
+                logger.exception("Falha no relay de eventos dos pedidos; tentando de novo.")
+
+    def subscriber_count(self, order_id):
+        with self._lock:
+            return len(self._subscribers.get(order_id, ()))
+
+
+def relay_enabled():
+    """Só um cache compartilhado entre os processos leva eventos de um worker a outro."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def _relay_key(order_id, event):
+    return f'order-event:{order_id}:{event}'
+
+
+order_events = OrderEventHub()
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class ChangeNotifier:
+    """
+    Avisa threads em long-poll de que algo mudou para uma chave (ex.: o id de
+    um restaurante). Cada chave tem um contador; quem espera guarda o valor
+    visto antes de consultar o banco e acorda quando ele muda.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._versions = defaultdict(int)
+        # Esperas de views assíncronas: chave -> {(loop, future)}.
+        self._async_waiters = defaultdict(set)
+
+    def version(self, key):
+        with self._condition:
+            return self._versions[key]
+
+    def notify(self, key):
+        with self._condition:
+            self._versions[key] += 1
+            self._condition.notify_all()
+            waiters = self._async_waiters.pop(key, ())
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def wait(self, key, version, timeout):
+        with self._condition:
+            return self._condition.wait_for(lambda: self._versions[key] != version, timeout)
+
+    async def wait_async(self, key, version, timeout):
+        """
+        Igual a wait(), mas para corrotinas: espera no event loop, sem ocupar
+        uma thread por conexão.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._condition:
+            if self._versions[key] != version:
+                return True
+            self._async_waiters[key].add(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except TimeoutError:
+            return False
+        finally:
+            with self._condition:
+                waiters = self._async_waiters.get(key)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._async_waiters[key]
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+restaurant_order_changes = ChangeNotifier()
+# Pedidos atribuídos a cada entregador (claim ou despacho em lote), por id do entregador.
+driver_order_changes = ChangeNotifier()
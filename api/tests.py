@@ -1,3 +1,2169 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from decimal import Decimal
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from rest_framework import serializers as rest_serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import async_views, dispatch
+from . import urls as api_urls
+from .authentication import RoleRefreshToken, get_cached_user, local_revocations
+from .dispatch import run_dispatch_round, solve
+from .geo import DriverIndex, get_driver_index, haversine_km, reset_driver_index
+from .hashers import get_hashing_pool
+from .cache import driver_auth_stats, get_version, is_driver_order_allowed, menu_scope
+from .middleware import ProfilingMiddleware, ReplicaStickinessMiddleware, metrics as request_metrics
+from .models import User, Restaurant, MenuItem, Order, OrderItem, RestaurantDailyStats, RevokedToken
+from .pagination import decode_change_cursor
+from .routers import PrimaryReplicaRouter, _Routing, _routing, check_replica_cache, mark_recent_write, wrote_recently
+from .search import SearchIndex
+from .streams import ChangeNotifier, OrderEventHub
+from .tracking import InMemorySink, get_location_buffer
+from .views import RestaurantOrderDetailView
+
+
+# Dentro da transação de um TestCase a réplica (espelho do banco de teste)
+# não enxerga os dados criados; o roteamento é testado em ReplicaRoutingTests.
+@override_settings(DATABASE_REPLICA_ALIAS=None)
+class BaseAPITestCase(TestCase):
+    """
+    Monta um cenário mínimo: um dono com restaurante e cardápio,
+    um cliente e um entregador.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='dono', password='senha-forte-123', role='owner')
+        cls.customer = User.objects.create_user(username='cliente', password='senha-forte-123', role='customer')
+        cls.driver = User.objects.create_user(username='entregador', password='senha-forte-123', role='driver')
+        cls.restaurant = Restaurant.objects.create(
+            owner=cls.owner, name='Cantina', address='Rua A, 1', phone='1199999999'
+        )
+        cls.menu_items = [
+            MenuItem.objects.create(restaurant=cls.restaurant, name=f'Prato {i}', price=Decimal('10.00') + i)
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        local_revocations.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def create_orders(self, count, **kwargs):
+        orders = []
+        for _ in range(count):
+            order = Order.objects.create(
+                customer=self.customer,
+                restaurant=self.restaurant,
+                total_price=Decimal('0'),
+                delivery_address='Rua B, 2',
+                **kwargs,
+            )
+            for menu_item in self.menu_items:
+                OrderItem.objects.create(order=order, menu_item=menu_item, quantity=2)
+            orders.append(order)
+        return orders
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+
+class OrderListQueryBudgetTests(BaseAPITestCase):
+    """
+    O número de queries das listagens de pedidos não pode crescer com a
+    quantidade de pedidos retornados.
+    """
+
+    # Pedidos + prefetch dos itens.
+    QUERY_BUDGET = 2
+
+    def assert_constant_queries(self, user, url, **order_kwargs):
+        client = self.client_for(user)
+        self.create_orders(1, **order_kwargs)
+        few = self.count_queries(client, url)
+        self.create_orders(10, **order_kwargs)
+        many = self.count_queries(client, url)
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.QUERY_BUDGET)
+
+    def test_customer_order_list(self):
+        self.assert_constant_queries(self.customer, reverse('order-list-create'))
+
+    def test_restaurant_order_list(self):
+        self.assert_constant_queries(self.owner, reverse('restaurant-order-list'))
+
+    def test_available_orders_list(self):
+        self.assert_constant_queries(
+            self.driver, reverse('driver-available-orders'), status='out_for_delivery'
+        )
+
+    def test_order_display_payload(self):
+        self.create_orders(1)
+        response = self.client_for(self.customer).get(reverse('order-list-create'))
+        order = response.data['results'][0]
+        self.assertEqual(order['customer'], 'cliente')
+        self.assertEqual(order['restaurant']['owner'], 'dono')
+        self.assertEqual(len(order['items']), 4)
+        self.assertEqual(order['items'][0], {
+            'menu_item': self.menu_items[0].pk, 'name': 'Prato 0', 'unit_price': '10.00', 'quantity': 2,
+        })
+
+    def test_order_items_show_price_at_order_time(self):
+        self.create_orders(1)
+        MenuItem.objects.filter(pk=self.menu_items[0].pk).update(name='Prato renomeado', price=Decimal('99.00'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client_for(self.customer).get(reverse('order-list-create'))
+        item = response.data['results'][0]['items'][0]
+        self.assertEqual((item['name'], item['unit_price']), ('Prato 0', '10.00'))
+        self.assertFalse(any('api_menuitem' in query['sql'] for query in ctx.captured_queries))
+
+
+class OrderItemSnapshotMigrationTests(TransactionTestCase):
+    """O backfill da 0008 copia nome e preço para itens criados antes dos campos existirem."""
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('api', target)])
+        return executor.loader.project_state([('api', target)]).apps
+
+    def tearDown(self):
+        # Volta para a última migração, para os testes seguintes.
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('api'))
+
+    def test_backfill_in_batches(self):
+        apps = self.migrate('0007_orderitem_snapshot')
+        models = {name: apps.get_model('api', name) for name in ('User', 'Restaurant', 'MenuItem', 'Order', 'OrderItem')}
+        owner = models['User'].objects.create(username='dono', role='owner')
+        restaurant = models['Restaurant'].objects.create(owner=owner, name='Cantina', address='Rua', phone='11')
+        item = models['MenuItem'].objects.create(restaurant=restaurant, name='Prato', price=Decimal('12.50'))
+        order = models['Order'].objects.create(restaurant=restaurant, total_price=Decimal('0'), delivery_address='Rua B')
+        models['OrderItem'].objects.bulk_create(
+            models['OrderItem'](order=order, menu_item=item, quantity=1) for _ in range(5)
+        )
+
+        backfill = importlib.import_module('api.migrations.0008_backfill_orderitem_snapshot')
+        with mock.patch.object(backfill, 'BATCH_SIZE', 2):
+            apps = self.migrate('0009_orderitem_unit_price_required')
+        rows = set(apps.get_model('api', 'OrderItem').objects.values_list('name', 'unit_price'))
+        self.assertEqual(rows, {('Prato', Decimal('12.50'))})
+
+
+class CursorPaginationTests(BaseAPITestCase):
+
+    def collect_pages(self, client, url):
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_order_pages_are_stable_and_complete(self):
+        orders = self.create_orders(7)
+        client = self.client_for(self.owner)
+        with self.settings(API_PAGE_SIZE=3):
+            ids = self.collect_pages(client, reverse('restaurant-order-list'))
+        # Pedidos criados no mesmo instante são desempatados pelo id.
+        expected = sorted(orders, key=lambda o: (o.created_at, o.id), reverse=True)
+        self.assertEqual(ids, [o.id for o in expected])
+
+    def test_page_size_is_capped(self):
+        self.create_orders(5)
+        client = self.client_for(self.customer)
+        with self.settings(API_MAX_PAGE_SIZE=2):
+            response = client.get(reverse('order-list-create'), {'page_size': 50})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_public_menu_is_paginated_by_id(self):
+        client = APIClient()
+        url = reverse('public-restaurant-menu', args=[self.restaurant.pk])
+        with self.settings(API_PAGE_SIZE=3):
+            ids = self.collect_pages(client, url)
+        self.assertEqual(ids, sorted(item.id for item in self.menu_items))
+
+
+@override_settings(DATABASE_REPLICA_ALIAS=None)
+class IndexUsageTests(TestCase):
+    """
+    Verifica, via EXPLAIN, que a query principal de cada listagem quente usa
+    um índice em vez de varrer a tabela inteira, num volume de dados realista.
+    """
+
+    RESTAURANTS = 40
+    ITEMS_PER_RESTAURANT = 30
+    CUSTOMERS = 100
+    ORDERS = 8000
+
+    @classmethod
+    def setUpTestData(cls):
+        owners = User.objects.bulk_create(
+            User(username=f'dono{i}', role='owner') for i in range(cls.RESTAURANTS)
+        )
+        customers = User.objects.bulk_create(
+            User(username=f'cliente{i}', role='customer') for i in range(cls.CUSTOMERS)
+        )
+        cls.driver = User.objects.create(username='entregador', role='driver')
+        restaurants = Restaurant.objects.bulk_create(
+            Restaurant(owner=owner, name=f'Restaurante {i}', address='Rua', phone='11')
+            for i, owner in enumerate(owners)
+        )
+        MenuItem.objects.bulk_create(
+            MenuItem(restaurant=restaurant, name=f'Item {i}', price=Decimal('9.90'), is_available=i % 5 != 0)
+            for restaurant in restaurants
+            for i in range(cls.ITEMS_PER_RESTAURANT)
+        )
+        statuses = ['pending', 'in_progress', 'cancelled'] * 30 + ['out_for_delivery']
+        Order.objects.bulk_create(
+            Order(
+                customer=customers[i % cls.CUSTOMERS],
+                restaurant=restaurants[i % cls.RESTAURANTS],
+                driver=cls.driver if i % 2 else None,
+                status=statuses[i % len(statuses)],
+                total_price=Decimal('30.00'),
+                delivery_address='Rua B',
+            )
+            for i in range(cls.ORDERS)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.owner = owners[0]
+        cls.customer = customers[0]
+        cls.restaurant = restaurants[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN ' + sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def assert_main_query_uses_index(self, user, url, table):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        main_query = next(q['sql'] for q in ctx.captured_queries if f'FROM "{table}"' in q['sql'])
+        plan = self.explain(main_query)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan, plan)
+            self.assertIn('Index', plan, plan)
+        else:
+            # "SCAN tabela" sem "USING ... INDEX" é uma varredura completa no SQLite.
+            self.assertNotRegex(plan, rf'\bSCAN {table}\b(?! USING)', plan)
+            self.assertIn('INDEX', plan, plan)
+
+    def test_customer_orders_use_index(self):
+        self.assert_main_query_uses_index(self.customer, reverse('order-list-create'), 'api_order')
+
+    def test_restaurant_orders_use_index(self):
+        self.assert_main_query_uses_index(self.owner, reverse('restaurant-order-list'), 'api_order')
+
+    def test_available_orders_use_index(self):
+        self.assert_main_query_uses_index(self.driver, reverse('driver-available-orders'), 'api_order')
+
+    def test_public_menu_uses_index(self):
+        url = reverse('public-restaurant-menu', args=[self.restaurant.pk])
+        self.assert_main_query_uses_index(None, url, 'api_menuitem')
+
+
+class OrderCreateTests(BaseAPITestCase):
+
+    def post_order(self, items, restaurant=None):
+        payload = {
+            'restaurant': (restaurant or self.restaurant).pk,
+            'delivery_address': 'Rua B, 2',
+            'items': items,
+        }
+        return self.client_for(self.customer).post(reverse('order-list-create'), payload, format='json')
+
+    def test_creates_order_with_total(self):
+        response = self.post_order([
+            {'menu_item': self.menu_items[0].pk, 'quantity': 2},
+            {'menu_item': self.menu_items[1].pk, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total_price, Decimal('31.00'))
+        self.assertEqual(order.orderitem_set.count(), 2)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        extra = MenuItem.objects.bulk_create(
+            MenuItem(restaurant=self.restaurant, name=f'Extra {i}', price=Decimal('5.00')) for i in range(20)
+        )
+        # O primeiro pedido do dia cria a linha do agregado (RestaurantDailyStats).
+        self.post_order([{'menu_item': extra[0].pk, 'quantity': 1}])
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post_order([{'menu_item': extra[0].pk, 'quantity': 1}]).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            response = self.post_order([{'menu_item': item.pk, 'quantity': 1} for item in extra])
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_rejects_item_from_another_restaurant(self):
+        other_owner = User.objects.create_user(username='outro', password='senha-forte-123', role='owner')
+        other = Restaurant.objects.create(owner=other_owner, name='Outro', address='Rua C', phone='11')
+        foreign_item = MenuItem.objects.create(restaurant=other, name='Estranho', price=Decimal('1.00'))
+        response = self.post_order([{'menu_item': foreign_item.pk, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_rejects_unavailable_item(self):
+        MenuItem.objects.filter(pk=self.menu_items[0].pk).update(is_available=False)
+        response = self.post_order([{'menu_item': self.menu_items[0].pk, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+
+
+class DriverClaimOrderTests(BaseAPITestCase):
+
+    def test_claim_assigns_driver(self):
+        order = self.create_orders(1, status='out_for_delivery')[0]
+        response = self.client_for(self.driver).patch(reverse('driver-claim-order', args=[order.pk]))
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.driver, self.driver)
+
+    def test_second_claim_conflicts(self):
+        order = self.create_orders(1, status='out_for_delivery')[0]
+        other = User.objects.create_user(username='entregador2', password='senha-forte-123', role='driver')
+        self.client_for(self.driver).patch(reverse('driver-claim-order', args=[order.pk]))
+        response = self.client_for(other).patch(reverse('driver-claim-order', args=[order.pk]))
+        self.assertEqual(response.status_code, 409)
+        order.refresh_from_db()
+        self.assertEqual(order.driver, self.driver)
+
+    def test_cannot_claim_order_not_ready(self):
+        order = self.create_orders(1, status='pending')[0]
+        response = self.client_for(self.driver).patch(reverse('driver-claim-order', args=[order.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Escritas concorrentes exigem o PostgreSQL (o SQLite trava a tabela).")
+class ConcurrentClaimTests(TransactionTestCase):
+    """
+    Vários entregadores disputam o mesmo pedido em paralelo: exatamente um vence.
+    """
+
+    DRIVERS = 8
+
+    def test_exactly_one_driver_wins(self):
+        owner = User.objects.create_user(username='dono', role='owner')
+        restaurant = Restaurant.objects.create(owner=owner, name='Cantina', address='Rua', phone='11')
+        order = Order.objects.create(
+            restaurant=restaurant, status='out_for_delivery', total_price=Decimal('10'), delivery_address='Rua B'
+        )
+        drivers = [User.objects.create_user(username=f'entregador{i}', role='driver') for i in range(self.DRIVERS)]
+        barrier = threading.Barrier(self.DRIVERS)
+        statuses = []
+
+        def claim(driver):
+            client = APIClient()
+            client.force_authenticate(user=driver)
+            try:
+                barrier.wait()
+                statuses.append(client.patch(reverse('driver-claim-order', args=[order.pk])).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim, args=(driver,)) for driver in drivers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Qualquer outro status (500 de lock, por exemplo) também é falha.
+        self.assertEqual(sorted(statuses), [200] + [409] * (self.DRIVERS - 1))
+        order.refresh_from_db()
+        self.assertIn(order.driver, drivers)
+        self.assertTrue(is_driver_order_allowed(order.driver_id, order.pk))
+
+
+class PublicCacheTests(BaseAPITestCase):
+
+    def menu_url(self):
+        return reverse('public-restaurant-menu', args=[self.restaurant.pk])
+
+    def test_second_read_hits_cache(self):
+        client = APIClient()
+        first = client.get(self.menu_url())
+        with self.assertNumQueries(0):
+            second = client.get(self.menu_url())
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        client = APIClient()
+        etag = client.get(reverse('public-restaurant-list'))['ETag']
+        with self.assertNumQueries(0):
+            response = client.get(reverse('public-restaurant-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_menu_item_update_invalidates_menu(self):
+        client = APIClient()
+        etag = client.get(self.menu_url())['ETag']
+        item = self.menu_items[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.owner).patch(
+                reverse('menu-item-detail', args=[self.restaurant.pk, item.pk]), {'price': '99.00'}
+            )
+        self.assertEqual(response.status_code, 200)
+
+        response = client.get(self.menu_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        prices = {row['id']: row['price'] for row in response.data['results']}
+        self.assertEqual(prices[item.pk], '99.00')
+
+    def test_restaurant_update_invalidates_listing(self):
+        client = APIClient()
+        client.get(reverse('public-restaurant-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_for(self.owner).patch(reverse('restaurant-detail', args=[self.restaurant.pk]), {'name': 'Nova Cantina'})
+        response = client.get(reverse('public-restaurant-list'))
+        self.assertEqual(response.data['results'][0]['name'], 'Nova Cantina')
+
+    def test_versions_change_only_after_commit(self):
+        item = self.menu_items[0]
+        before = get_version(menu_scope(self.restaurant.pk))
+        with self.captureOnCommitCallbacks() as callbacks:
+            item.price = Decimal('99.00')
+            item.save()
+        # Antes do commit, um miss guardaria o dado antigo com a versão nova.
+        self.assertEqual(get_version(menu_scope(self.restaurant.pk)), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(menu_scope(self.restaurant.pk)), before)
+
+        # Depois do delete o pk some da instância, mas o restaurante certo é invalidado.
+        restaurant_id = self.restaurant.pk
+        before = get_version(menu_scope(restaurant_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.delete()
+        self.assertNotEqual(get_version(menu_scope(restaurant_id)), before)
+
+
+class MenuBulkImportExportTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.owner)
+        self.import_url = reverse('menu-import', args=[self.restaurant.pk])
+        self.export_url = reverse('menu-export', args=[self.restaurant.pk])
+
+    def import_json(self, rows):
+        return self.client.post(self.import_url, json.dumps(rows), content_type='application/json')
+
+    def test_json_import_creates_updates_and_reports_row_errors(self):
+        item = self.menu_items[0]
+        response = self.import_json([
+            {'name': 'Lasanha', 'price': '32.90', 'description': 'Bolonhesa'},
+            {'id': item.pk, 'price': '15.00'},
+            {'name': 'Sem preço'},
+            {'id': 999999, 'name': 'Fantasma', 'price': '1.00'},
+            {'name': 'Suco', 'price': '7.50', 'is_available': False},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (2, 1))
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+
+        item.refresh_from_db()
+        # Colunas ausentes na linha mantêm o valor gravado.
+        self.assertEqual((item.name, item.price), ('Prato 0', Decimal('15.00')))
+        self.assertFalse(MenuItem.objects.get(restaurant=self.restaurant, name='Suco').is_available)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def queries(count):
+            rows = [{'name': f'Item {i}', 'price': '10.00'} for i in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.import_json(rows).data['created'], count)
+            return len(ctx.captured_queries)
+
+        # 100 linhas: acima disso o SQLite já divide o INSERT pelo limite de parâmetros.
+        self.assertEqual(queries(5), queries(100))
+
+    @override_settings(MENU_IMPORT_BATCH_SIZE=2)
+    def test_csv_upload_in_batches(self):
+        body = 'name,description,price,is_available\nPizza,,45.00,\nRefri,Lata,6.00,false\nErro,,abc,\n'
+        response = self.client.post(self.import_url, body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertEqual(MenuItem.objects.filter(restaurant=self.restaurant).count(), 6)
+
+    def test_csv_without_required_columns(self):
+        response = self.client.post(self.import_url, 'nome,preco\nPizza,1\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+
+    def test_item_from_another_restaurant_is_rejected(self):
+        other_owner = User.objects.create_user(username='dono2', password='senha-forte-123', role='owner')
+        other = Restaurant.objects.create(owner=other_owner, name='Outro', address='Rua', phone='11')
+        foreign = MenuItem.objects.create(restaurant=other, name='Alheio', price=Decimal('5.00'))
+        response = self.import_json([{'id': foreign.pk, 'name': 'Roubado', 'price': '1.00'}])
+        self.assertEqual(response.data['errors'][0]['row'], 1)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.name, 'Alheio')
+        self.assertEqual(
+            self.client_for(other_owner).post(self.import_url, '[]', content_type='application/json').status_code, 404
+        )
+
+    @override_settings(MENU_IMPORT_MAX_ROWS=2)
+    def test_too_many_rows_rolls_back(self):
+        response = self.import_json([{'name': f'Item {i}', 'price': '1.00'} for i in range(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(MenuItem.objects.filter(restaurant=self.restaurant).count(), 4)
+
+    def test_unsupported_content_type(self):
+        response = self.client.post(self.import_url, 'x', content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+
+    def test_import_invalidates_public_menu(self):
+        menu_url = reverse('public-restaurant-menu', args=[self.restaurant.pk])
+        APIClient().get(menu_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_json([{'name': 'Novidade', 'price': '9.90'}])
+        names = {row['name'] for row in APIClient().get(menu_url).data['results']}
+        self.assertIn('Novidade', names)
+
+    def test_csv_export_round_trips(self):
+        response = self.client.get(self.export_url, {'file_format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('id,name,description,price,is_available'))
+
+        response = self.client.post(self.import_url, body.replace('10.00', '11.00'), content_type='text/csv')
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['errors']), (0, 4, []))
+        self.assertEqual(MenuItem.objects.get(pk=self.menu_items[0].pk).price, Decimal('11.00'))
+
+    def test_json_export(self):
+        response = self.client.get(self.export_url)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['id'] for row in rows], [item.pk for item in self.menu_items])
+        self.assertEqual(rows[0]['price'], '10.00')
+        self.assertEqual(self.client.get(self.export_url, {'file_format': 'xml'}).status_code, 400)
+
+    async def test_asgi_export_streams_with_async_iterator(self):
+        expected = await sync_to_async(lambda: b''.join(self.client.get(self.export_url).streaming_content))()
+        headers = {'Authorization': f'Bearer {RoleRefreshToken.for_user(self.owner).access_token}'}
+        response = await AsyncClient().get(self.export_url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), expected)
+
+
+class SearchTests(BaseAPITestCase):
+    url = reverse_lazy('public-search')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        item = lambda restaurant, name, description='', **kwargs: MenuItem.objects.create(
+            restaurant=restaurant, name=name, description=description, price=Decimal('20.00'), **kwargs
+        )
+        cls.pizza = item(cls.restaurant, 'Pizza Margherita', 'Molho de tomate, mussarela e manjericão')
+        cls.pao = item(cls.restaurant, 'Pão de Queijo', 'Porção com dez unidades')
+        cls.acai = item(cls.restaurant, 'Açaí na Tigela', 'Com granola e banana')
+        cls.calabresa = item(cls.restaurant, 'Calabresa Acebolada', 'Linguiça calabresa com cebola')
+        cls.molho = item(cls.restaurant, 'Molho de Manjericão', 'Pesto artesanal')
+        cls.unavailable = item(cls.restaurant, 'Pizza Doce', is_available=False)
+        pizzaria_owner = User.objects.create_user(username='dono-pizzaria', role='owner')
+        cls.pizzaria = Restaurant.objects.create(owner=pizzaria_owner, name='Pizzaria Napoli', address='Rua B', phone='11')
+        closed_owner = User.objects.create_user(username='dono-fechado', role='owner')
+        closed = Restaurant.objects.create(owner=closed_owner, name='Pizzaria Fechada', address='Rua C', phone='11', is_active=False)
+        cls.closed_item = item(closed, 'Pizza Fechada')
+
+    def search(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def found(self, q):
+        return [(result['type'], result[result['type']]['id']) for result in self.search(q).data['results']]
+
+    def test_ignores_accents_and_case(self):
+        self.assertEqual(self.found('pao de queijo')[0], ('menu_item', self.pao.pk))
+        self.assertEqual(self.found('AÇAI')[0], ('menu_item', self.acai.pk))
+
+    def test_prefix_and_typo(self):
+        self.assertIn(('menu_item', self.calabresa.pk), self.found('calab'))
+        self.assertIn(('menu_item', self.pizza.pk), self.found('piza'))
+
+    def test_name_match_ranks_above_description(self):
+        found = self.found('manjericao')
+        self.assertEqual(found[:2], [('menu_item', self.molho.pk), ('menu_item', self.pizza.pk)])
+
+    def test_returns_restaurants_and_items_but_not_hidden_ones(self):
+        found = self.found('pizza')
+        self.assertIn(('restaurant', self.pizzaria.pk), found)
+        self.assertIn(('menu_item', self.pizza.pk), found)
+        self.assertNotIn(('menu_item', self.unavailable.pk), found)
+        self.assertNotIn(('menu_item', self.closed_item.pk), found)
+        result = self.search('napoli').data['results'][0]
+        self.assertEqual(result['restaurant']['name'], 'Pizzaria Napoli')
+        self.assertNotIn('menu_item', result)
+
+    def test_paginates_by_page_number(self):
+        first = self.search('pizza', page_size=1).data
+        self.assertEqual(len(first['results']), 1)
+        self.assertGreaterEqual(first['count'], 2)
+        self.assertIn('page=2', first['next'])
+        second = self.search('pizza', page_size=1, page=2).data
+        self.assertNotEqual(first['results'][0], second['results'][0])
+
+    def test_requires_a_word(self):
+        for params in ({}, {'q': ''}, {'q': ' !? '}, {'q': 'de'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+    def test_follows_menu_changes(self):
+        self.assertEqual(self.search('moqueca').data['count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            item = MenuItem.objects.create(restaurant=self.restaurant, name='Moqueca Baiana', price=Decimal('50.00'))
+        self.assertEqual(self.found('moqueca'), [('menu_item', item.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.search('moqueca').data['count'], 0)
+
+    def test_menu_import_refreshes_search(self):
+        client = self.client_for(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(
+                reverse('menu-import', args=[self.restaurant.pk]),
+                json.dumps([{'name': 'Feijoada Completa', 'price': '45.00'}]), content_type='application/json',
+            )
+        self.assertEqual(len(self.found('feijoada')), 1)
+
+
+class SearchIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add('menu_item', 1, 'Pizza Margherita', 'tomate e manjericão')
+        self.index.add('menu_item', 2, 'Pizza Calabresa', 'calabresa e cebola')
+        self.index.add('restaurant', 1, 'Pizzaria Napoli')
+        self.index.freeze()
+
+    def search(self, query):
+        return self.index.search(query, 10, 0.6)
+
+    def test_every_word_must_match(self):
+        self.assertEqual([pk for _, _, pk in self.search('pizza calabresa')], [2])
+        self.assertEqual(self.search('pizza abacaxi'), [])
+
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(len(self.search('pizz')), 3)
+        self.assertEqual([(kind, pk) for _, kind, pk in self.search('pizzaria nap')], [('restaurant', 1)])
+
+    def test_typo_below_threshold_is_ignored(self):
+        self.assertEqual(self.search('xyzzy'), [])
+        self.assertEqual([pk for _, _, pk in self.search('margerita')], [1])
+
+    def test_ties_are_ordered_by_type_and_id(self):
+        self.assertEqual([(kind, pk) for _, kind, pk in self.search('pizz')],
+                         [('menu_item', 1), ('menu_item', 2), ('restaurant', 1)])
+
+
+class SlowSink(InMemorySink):
+    def write(self, updates):
+        time.sleep(0.5)
+        super().write(updates)
+
+
+@override_settings(LOCATION_SINK='api.tracking.InMemorySink', LOCATION_FLUSH_INTERVAL=60)
+class DriverLocationUpdateTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        # A autorização dos pings entra no cache no commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order = self.create_orders(1, status='out_for_delivery', driver=self.driver)[0]
+        self.url = reverse('driver-update-location', args=[self.order.pk])
+
+    def test_pings_are_coalesced_per_order(self):
+        client = self.client_for(self.driver)
+        for lat in (1.0, 2.0, 3.0):
+            self.assertEqual(client.patch(self.url, {'lat': lat, 'lng': -1.0}).status_code, 200)
+
+        buffer = get_location_buffer()
+        buffer.flush()
+        self.assertEqual(len(buffer.sink.writes), 1)
+        self.assertEqual(
+            buffer.sink.data[f'order_locations/{self.order.pk}'],
+            {'lat': 3.0, 'lng': -1.0, 'driver_id': self.driver.pk},
+        )
+
+    def test_other_driver_is_rejected(self):
+        other = User.objects.create_user(username='entregador2', password='senha-forte-123', role='driver')
+        response = self.client_for(other).patch(self.url, {'lat': 1.0, 'lng': 1.0})
+        self.assertEqual(response.status_code, 404)
+
+    def test_steady_state_pings_do_not_query_database(self):
+        client = self.client_for(self.driver)
+        client.patch(self.url, {'lat': 1.0, 'lng': 1.0})
+        before = driver_auth_stats.snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(client.patch(self.url, {'lat': 2.0, 'lng': 2.0}).status_code, 200)
+        after = driver_auth_stats.snapshot()
+        self.assertEqual(after['hits'], before['hits'] + 1)
+        self.assertEqual(after['misses'], before['misses'])
+
+    def test_reassignment_invalidates_previous_driver(self):
+        other = User.objects.create_user(username='entregador2', password='senha-forte-123', role='driver')
+        self.assertEqual(self.client_for(self.driver).patch(self.url, {'lat': 1.0, 'lng': 1.0}).status_code, 200)
+        self.order.driver = other
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.save()
+        self.assertEqual(self.client_for(self.driver).patch(self.url, {'lat': 1.0, 'lng': 1.0}).status_code, 404)
+        self.assertEqual(self.client_for(other).patch(self.url, {'lat': 1.0, 'lng': 1.0}).status_code, 200)
+
+    def test_rolled_back_assignment_is_not_authorized(self):
+        other = User.objects.create_user(username='entregador2', password='senha-forte-123', role='driver')
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                order = Order.objects.get(pk=self.order.pk)
+                order.driver = other
+                order.save()
+                raise RuntimeError
+        self.assertFalse(is_driver_order_allowed(other.pk, self.order.pk))
+        self.assertTrue(is_driver_order_allowed(self.driver.pk, self.order.pk))
+
+    def test_rejects_non_finite_and_out_of_range_coordinates(self):
+        client = self.client_for(self.driver)
+        buffer = get_location_buffer()
+        buffer.flush()
+        before = dict(buffer.sink.data)
+        bodies = ['{"lat": 1e999, "lng": 0}', '{"lat": 0, "lng": 181}', '{"lat": -91, "lng": 0}']
+        for body in bodies:
+            with self.subTest(body=body):
+                response = client.generic('PATCH', self.url, body, 'application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.patch(self.url, {'lat': 'nan', 'lng': 0}).status_code, 400)
+        buffer.flush()
+        self.assertEqual(buffer.sink.data, before)
+
+    def test_leaving_delivery_clears_authorization(self):
+        self.assertTrue(is_driver_order_allowed(self.driver.pk, self.order.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.owner).patch(
+                reverse('restaurant-order-detail', args=[self.order.pk]), {'status': 'cancelled'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(is_driver_order_allowed(self.driver.pk, self.order.pk))
+
+    @override_settings(LOCATION_SINK='api.tests.SlowSink', LOCATION_FLUSH_INTERVAL=0.01)
+    def test_latency_does_not_depend_on_sink(self):
+        client = self.client_for(self.driver)
+        client.patch(self.url, {'lat': 1.0, 'lng': 1.0})
+        start = time.perf_counter()
+        for _ in range(5):
+            client.patch(self.url, {'lat': 1.0, 'lng': 1.0})
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+
+class OrderEventHubTests(SimpleTestCase):
+
+    async def test_slow_subscriber_gets_only_latest_location(self):
+        hub = OrderEventHub()
+        slow = hub.subscribe(1)
+        for lat in range(100):
+            hub.publish(1, 'location', {'lat': lat})
+        hub.publish(1, 'status', {'status': 'cancelled'})
+        events = await slow.next_events(timeout=1)
+        self.assertEqual(events, [('location', {'lat': 99}), ('status', {'status': 'cancelled'})])
+
+    async def test_publish_from_another_thread(self):
+        hub = OrderEventHub()
+        subscription = hub.subscribe(1)
+        thread = threading.Thread(target=hub.publish, args=(1, 'location', {'lat': 1}))
+        thread.start()
+        events = await subscription.next_events(timeout=1)
+        thread.join()
+        self.assertEqual(events, [('location', {'lat': 1})])
+
+    async def test_unsubscribe(self):
+        hub = OrderEventHub()
+        subscription = hub.subscribe(1)
+        hub.unsubscribe(1, subscription)
+        self.assertEqual(hub.subscriber_count(1), 0)
+        self.assertEqual(await subscription.next_events(timeout=0.01), [])
+
+
+    async def test_relay_delivers_events_published_by_another_worker(self):
+        publisher, hub = OrderEventHub(), OrderEventHub()
+        subscription = hub.subscribe(1)
+        with mock.patch('api.streams.relay_enabled', return_value=True):
+            publisher.publish(1, 'location', {'lat': 1})
+            publisher.publish(2, 'status', {'status': 'delivered'})
+            self.assertEqual(hub.relay(), 1)
+            self.assertEqual(await subscription.next_events(timeout=1), [('location', {'lat': 1})])
+            # Já entregue: a próxima passada não repete o evento.
+            self.assertEqual(hub.relay(), 0)
+            hub.publish(1, 'status', {'status': 'delivered'})
+            self.assertEqual(hub.relay(), 0)
+            self.assertEqual(await subscription.next_events(timeout=1), [('status', {'status': 'delivered'})])
+        hub.unsubscribe(1, subscription)
+        cache.clear()
+
+
+class DriverIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = DriverIndex(cell_deg=0.01, ttl=60)
+
+    def test_nearest_matches_brute_force(self):
+        import random
+        rng = random.Random(7)
+        positions = {i: (rng.uniform(-23.7, -23.4), rng.uniform(-46.8, -46.5)) for i in range(2000)}
+        for driver_id, (lat, lng) in positions.items():
+            self.index.update(driver_id, lat, lng, idle=True)
+        expected = sorted((haversine_km(-23.55, -46.63, lat, lng), driver_id) for driver_id, (lat, lng) in positions.items())
+        self.assertEqual([d for _, d in self.index.nearest(-23.55, -46.63, 10)], [d for _, d in expected[:10]])
+        self.assertEqual(
+            [d for _, d in self.index.within(-23.55, -46.63, 3)], [d for dist, d in expected if dist <= 3]
+        )
+
+    def test_moving_driver_changes_cell(self):
+        self.index.update(1, -23.55, -46.63, idle=True)
+        self.index.update(1, -22.90, -43.20, idle=True)
+        self.assertEqual(self.index.nearest(-23.55, -46.63, 1, max_radius_km=50), [])
+        self.assertEqual([d for _, d in self.index.nearest(-22.90, -43.20, 1)], [1])
+
+    def test_busy_and_stale_drivers_are_skipped(self):
+        self.index.update(1, -23.55, -46.63, idle=True)
+        self.index.update(2, -23.551, -46.63, idle=False)
+        self.assertEqual([d for _, d in self.index.nearest(-23.55, -46.63, 5)], [1])
+        self.assertEqual([d for _, d in self.index.nearest(-23.55, -46.63, 5, idle_only=False)], [1, 2])
+        self.index.mark_busy(1)
+        self.assertEqual(self.index.nearest(-23.55, -46.63, 5), [])
+
+        with mock.patch('api.geo.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(self.index.nearest(-23.55, -46.63, 5, idle_only=False), [])
+            self.assertEqual(self.index.prune(), 2)
+        self.assertEqual(len(self.index), 0)
+
+
+@override_settings(LOCATION_SINK='api.tracking.InMemorySink', LOCATION_FLUSH_INTERVAL=60)
+class NearbyAvailableOrdersTests(BaseAPITestCase):
+    """Pedidos disponíveis por raio e o índice de despacho alimentado pelas views."""
+
+    def setUp(self):
+        super().setUp()
+        reset_driver_index()
+        self.addCleanup(reset_driver_index)
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(latitude=-23.55, longitude=-46.63)
+        far_owner = User.objects.create_user(username='dono2', password='senha-forte-123', role='owner')
+        self.far = Restaurant.objects.create(
+            owner=far_owner, name='Longe', address='Rua C', phone='11', latitude=-23.60, longitude=-46.63
+        )
+        self.near_order = self.create_orders(1, status='out_for_delivery')[0]
+        self.far_order = Order.objects.create(
+            customer=self.customer, restaurant=self.far, status='out_for_delivery',
+            total_price=Decimal('0'), delivery_address='Rua D',
+        )
+        # Restaurante sem coordenadas fica fora da busca por raio.
+        self.unlocated = self.create_orders(1, status='out_for_delivery')[0]
+        Order.objects.filter(pk=self.unlocated.pk).update(restaurant=Restaurant.objects.create(
+            owner=User.objects.create_user(username='dono3', role='owner'), name='Sem mapa', address='R', phone='1'
+        ))
+        self.url = reverse('driver-available-orders')
+
+    def test_orders_within_radius_sorted_by_distance(self):
+        client = self.client_for(self.driver)
+        response = client.get(self.url, {'lat': -23.551, 'lng': -46.63, 'radius': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([o['id'] for o in response.data['results']], [self.near_order.pk, self.far_order.pk])
+        self.assertAlmostEqual(response.data['results'][0]['distance_km'], 0.111, places=2)
+
+        response = client.get(self.url, {'lat': -23.551, 'lng': -46.63, 'radius': 2})
+        self.assertEqual([o['id'] for o in response.data['results']], [self.near_order.pk])
+
+    def test_without_position_lists_everything(self):
+        response = self.client_for(self.driver).get(self.url)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_invalid_position(self):
+        client = self.client_for(self.driver)
+        self.assertEqual(client.get(self.url, {'lat': -23.5}).status_code, 400)
+        self.assertEqual(client.get(self.url, {'lat': 100, 'lng': 0}).status_code, 400)
+        # nan passa por min_value/max_value; nada disso pode chegar ao índice.
+        for lat, lng, radius in (('nan', 0, 5), ('inf', 0, 5), (0, '-inf', 5), (0, 0, 'nan')):
+            with self.subTest(lat=lat, lng=lng, radius=radius):
+                response = client.get(self.url, {'lat': lat, 'lng': lng, 'radius': radius})
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(get_driver_index()), 0)
+
+    def test_views_feed_driver_index(self):
+        client = self.client_for(self.driver)
+        client.get(self.url, {'lat': -23.551, 'lng': -46.63})
+        index = get_driver_index()
+        self.assertEqual(index.nearest(-23.55, -46.63, 1), [(mock.ANY, self.driver.pk)])
+
+        # Aceitar um pedido e mandar localização deixam o entregador ocupado.
+        client.patch(reverse('driver-claim-order', args=[self.near_order.pk]))
+        self.assertEqual(index.nearest(-23.55, -46.63, 1), [])
+        response = client.patch(reverse('driver-update-location', args=[self.near_order.pk]), {'lat': -23.56, 'lng': -46.64})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(index.nearest(-23.56, -46.64, 1, idle_only=False), [(mock.ANY, self.driver.pk)])
+
+
+class DispatchSolverTests(SimpleTestCase):
+    # O guloso pega o par mais curto (A, 1) e deixa B com o entregador longe;
+    # o ótimo troca os dois e soma 3,5 km em vez de 11.
+    PAIRS = [(1.0, 'A', 1), (2.0, 'A', 2), (1.5, 'B', 1), (10.0, 'B', 2)]
+
+    def test_greedy(self):
+        self.assertEqual(sorted(solve(self.PAIRS, 'greedy')), [(1.0, 'A', 1), (10.0, 'B', 2)])
+
+    @unittest.skipUnless(dispatch.optimal_solver_available(), "SciPy não instalado")
+    def test_optimal_minimizes_total_distance(self):
+        self.assertEqual(sorted(solve(self.PAIRS, 'optimal')), [(1.5, 'B', 1), (2.0, 'A', 2)])
+        # Pedido sem candidato fica de fora, em vez de receber um entregador fora do raio.
+        self.assertEqual(solve([(1.0, 'A', 1), (2.0, 'B', 1)], 'optimal'), [(1.0, 'A', 1)])
+
+    def test_auto_falls_back_to_greedy_without_scipy(self):
+        with mock.patch.object(dispatch, 'optimal_solver_available', return_value=False):
+            self.assertEqual(sorted(solve(self.PAIRS)), [(1.0, 'A', 1), (10.0, 'B', 2)])
+            with self.assertRaises(RuntimeError):
+                solve(self.PAIRS, 'optimal')
+
+
+@override_settings(LOCATION_SINK='api.tracking.InMemorySink', LOCATION_FLUSH_INTERVAL=60)
+class BatchDispatchTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(latitude=-23.55, longitude=-46.63)
+        self.index = DriverIndex(cell_deg=0.01, ttl=60)
+        self.far_driver = User.objects.create_user(username='entregador2', password='senha-forte-123', role='driver')
+        self.index.update(self.driver.pk, -23.551, -46.63, idle=True)
+        self.index.update(self.far_driver.pk, -23.58, -46.63, idle=True)
+
+    def test_assigns_nearest_driver_and_notifies(self):
+        order = self.create_orders(1, status='out_for_delivery')[0]
+        client = self.client_for(self.driver)
+        feed = reverse('driver-order-changes')
+        cursor = client.get(feed).data['cursor']
+
+        assigned = run_dispatch_round(self.index, method='greedy')
+        self.assertEqual([(order_id, driver_id) for _, order_id, driver_id in assigned], [(order.pk, self.driver.pk)])
+        order.refresh_from_db()
+        self.assertEqual(order.driver, self.driver)
+        self.assertEqual([d for _, d in self.index.nearest(-23.55, -46.63, 5)], [self.far_driver.pk])
+
+        # O entregador recebe o pedido pelo feed e já pode mandar a localização.
+        response = client.get(feed, {'since': cursor})
+        self.assertEqual([row['id'] for row in response.data['results']], [order.pk])
+        self.assertEqual(
+            client.patch(reverse('driver-update-location', args=[order.pk]), {'lat': 1.0, 'lng': 1.0}).status_code, 200
+        )
+
+    def test_skips_claimed_orders_and_unlocated_restaurants(self):
+        claimed, free = self.create_orders(2, status='out_for_delivery')
+        Order.objects.filter(pk=claimed.pk).update(driver=self.far_driver)
+        unlocated = Order.objects.create(
+            customer=self.customer, status='out_for_delivery', total_price=Decimal('0'), delivery_address='Rua',
+            restaurant=Restaurant.objects.create(
+                owner=User.objects.create_user(username='dono2', role='owner'), name='Sem mapa', address='R', phone='1'
+            ),
+        )
+        assigned = run_dispatch_round(self.index, method='greedy')
+        self.assertEqual([order_id for _, order_id, _ in assigned], [free.pk])
+        unlocated.refresh_from_db()
+        self.assertIsNone(unlocated.driver_id)
+
+    def test_driver_with_active_delivery_is_not_dispatched(self):
+        reset_driver_index()
+        self.addCleanup(reset_driver_index)
+        self.create_orders(1, status='out_for_delivery', driver=self.driver)
+        waiting = self.create_orders(1, status='out_for_delivery')[0]
+        response = self.client_for(self.driver).get(reverse('driver-available-orders'), {'lat': -23.551, 'lng': -46.63})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_driver_index().nearest(-23.55, -46.63, 5), [])
+        self.assertEqual(run_dispatch_round(get_driver_index(), method='greedy'), [])
+        waiting.refresh_from_db()
+        self.assertIsNone(waiting.driver_id)
+
+    def test_round_skips_drivers_busy_in_database(self):
+        # O índice ainda o vê livre (claim feito em outro worker), mas o banco não.
+        self.create_orders(1, status='out_for_delivery', driver=self.driver)
+        waiting = self.create_orders(1, status='out_for_delivery')[0]
+        assigned = run_dispatch_round(self.index, method='greedy')
+        self.assertEqual([(order_id, driver_id) for _, order_id, driver_id in assigned], [(waiting.pk, self.far_driver.pk)])
+        self.assertEqual(self.index.nearest(-23.55, -46.63, 5), [])
+
+    def test_driver_is_dispatched_again_after_delivering(self):
+        reset_driver_index()
+        self.addCleanup(reset_driver_index)
+        get_driver_index().update(self.driver.pk, -23.551, -46.63, idle=True)
+        first, second = self.create_orders(2, status='out_for_delivery')
+        assigned = run_dispatch_round(get_driver_index(), method='greedy')
+        self.assertEqual([(order_id, driver_id) for _, order_id, driver_id in assigned], [(first.pk, self.driver.pk)])
+
+        client = self.client_for(self.driver)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(reverse('driver-deliver-order', args=[first.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'delivered')
+        # Entregue não é mais "em entrega": não dá para entregar de novo e a autorização de localização sai do cache.
+        self.assertEqual(client.patch(reverse('driver-deliver-order', args=[first.pk])).status_code, 404)
+        self.assertFalse(is_driver_order_allowed(self.driver.pk, first.pk))
+
+        assigned = run_dispatch_round(get_driver_index(), method='greedy')
+        self.assertEqual([(order_id, driver_id) for _, order_id, driver_id in assigned], [(second.pk, self.driver.pk)])
+
+    def test_owner_can_mark_order_delivered(self):
+        reset_driver_index()
+        self.addCleanup(reset_driver_index)
+        get_driver_index().update(self.driver.pk, -23.551, -46.63, idle=False)
+        order, waiting = self.create_orders(2, status='out_for_delivery')
+        Order.objects.filter(pk=order.pk).update(driver=self.driver)
+        response = self.client_for(self.owner).patch(
+            reverse('restaurant-order-detail', args=[order.pk]), {'status': 'delivered'}
+        )
+        self.assertEqual(response.status_code, 200)
+        assigned = run_dispatch_round(get_driver_index(), method='greedy')
+        self.assertEqual([(order_id, driver_id) for _, order_id, driver_id in assigned], [(waiting.pk, self.driver.pk)])
+
+    def test_driver_is_released_when_order_was_taken(self):
+        taken, free = self.create_orders(2, status='out_for_delivery')
+        Order.objects.filter(pk=taken.pk).update(driver=self.far_driver)
+        # O solver ainda vê o pedido livre (claim entre a leitura e o UPDATE).
+        with mock.patch.object(dispatch, 'solve', return_value=[(0.1, taken.pk, self.driver.pk)]):
+            self.assertEqual(run_dispatch_round(self.index, method='greedy'), [])
+        self.assertIsNone(cache.get(f'dispatch-driver:{self.driver.pk}'))
+        assigned = run_dispatch_round(self.index, method='greedy')
+        self.assertEqual([(order_id, driver_id) for _, order_id, driver_id in assigned], [(free.pk, self.driver.pk)])
+
+    def test_busy_driver_is_rechecked_inside_transaction(self):
+        waiting = self.create_orders(1, status='out_for_delivery')[0]
+        self.create_orders(1, status='out_for_delivery', driver=self.far_driver)
+        # Outra rodada atribuiu o entregador depois da checagem fora da transação.
+        with mock.patch.object(dispatch, 'solve', return_value=[(0.1, waiting.pk, self.far_driver.pk)]):
+            self.assertEqual(run_dispatch_round(self.index, method='greedy'), [])
+        waiting.refresh_from_db()
+        self.assertIsNone(waiting.driver_id)
+        self.assertIsNone(cache.get(f'dispatch-driver:{self.far_driver.pk}'))
+
+    def test_simulation_reports_each_method(self):
+        output = io.StringIO()
+        call_command('simulate_dispatch', fleet='30', methods='claim,greedy', rounds=3, json=True, stdout=output)
+        results = json.loads(output.getvalue())
+        self.assertEqual(set(results), {'30/claim', '30/greedy'})
+        self.assertIn('avg_pickup_km', results['30/greedy'])
+
+
+class RestaurantStatsTests(BaseAPITestCase):
+
+    url = reverse_lazy('restaurant-stats')
+
+    def place_order(self, quantity=1):
+        response = self.client_for(self.customer).post(reverse('order-list-create'), {
+            'restaurant': self.restaurant.pk, 'delivery_address': 'Rua B, 2',
+            'items': [{'menu_item': self.menu_items[0].pk, 'quantity': quantity}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def set_status(self, order_id, new_status):
+        response = self.client_for(self.owner).patch(reverse('restaurant-order-detail', args=[order_id]), {'status': new_status})
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_and_status_updates_maintain_aggregate(self):
+        first = self.place_order(quantity=1)
+        self.place_order(quantity=2)
+        third = self.place_order(quantity=3)
+        self.set_status(first, 'in_progress')
+        self.set_status(third, 'cancelled')
+
+        response = self.client_for(self.owner).get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['by_status'], {
+            'pending': 1, 'in_progress': 1, 'out_for_delivery': 0, 'delivered': 0, 'cancelled': 1,
+        })
+        today = response.data['daily'][0]
+        self.assertEqual(today['orders'], 3)
+        # Cancelados não contam como receita: 10,00 + 20,00.
+        self.assertEqual(today['revenue'], '30.00')
+        self.assertEqual(response.data['revenue'], '30.00')
+
+    def test_stats_cost_does_not_grow_with_orders(self):
+        for _ in range(5):
+            self.place_order()
+        client = self.client_for(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            client.get(self.url)
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        self.assertFalse(any('"api_order"' in query['sql'] for query in ctx.captured_queries))
+
+    def test_rebuild_matches_incremental_aggregate(self):
+        self.set_status(self.place_order(), 'out_for_delivery')
+        self.place_order(quantity=2)
+        rows = lambda: sorted(RestaurantDailyStats.objects.exclude(order_count=0).values_list('day', 'status', 'order_count', 'revenue'))
+        incremental = rows()
+
+        RestaurantDailyStats.objects.all().delete()
+        call_command('rebuild_order_stats', stdout=io.StringIO())
+        self.assertEqual(rows(), incremental)
+
+    def test_status_update_keeps_concurrent_claim(self):
+        order = Order.objects.get(pk=self.place_order())
+        self.set_status(order.pk, 'out_for_delivery')
+        get_object = RestaurantOrderDetailView.get_object
+
+        def get_object_then_claim(view):
+            instance = get_object(view)
+            # Um entregador aceita o pedido depois que a view já o leu.
+            Order.objects.filter(pk=order.pk).update(driver=self.driver)
+            return instance
+
+        with mock.patch.object(RestaurantOrderDetailView, 'get_object', get_object_then_claim):
+            self.set_status(order.pk, 'cancelled')
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.driver_id), ('cancelled', self.driver.pk))
+        self.assertEqual(RestaurantDailyStats.objects.get(status='out_for_delivery').order_count, 0)
+        self.assertEqual(RestaurantDailyStats.objects.get(status='cancelled').order_count, 1)
+
+    def test_requires_owner(self):
+        self.assertEqual(self.client_for(self.customer).get(self.url).status_code, 403)
+
+
+class RestaurantOrderExportTests(BaseAPITestCase):
+
+    url = reverse_lazy('restaurant-order-export')
+
+    def export(self, **params):
+        response = self.client_for(self.owner).get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_with_items(self):
+        orders = self.create_orders(2)
+        other_owner = User.objects.create_user(username='dono2', role='owner')
+        other = Restaurant.objects.create(owner=other_owner, name='Outro', address='Rua', phone='11')
+        Order.objects.create(customer=self.customer, restaurant=other, total_price=Decimal('1'), delivery_address='Rua')
+
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [order.pk for order in orders])
+        self.assertEqual(rows[0]['customer'], 'cliente')
+        self.assertEqual(
+            rows[0]['items'][0], {'menu_item': self.menu_items[0].pk, 'name': 'Prato 0', 'unit_price': '10.00', 'quantity': 2}
+        )
+
+    def test_csv(self):
+        order = self.create_orders(1)[0]
+        lines = self.export(file_format='csv').splitlines()
+        self.assertEqual(lines[0], 'id,created_at,updated_at,status,total_price,delivery_address,customer,driver,items')
+        self.assertTrue(lines[1].startswith(f'{order.pk},'))
+        self.assertTrue(lines[1].endswith('2x Prato 0; 2x Prato 1; 2x Prato 2; 2x Prato 3'))
+
+    def test_date_range(self):
+        old, recent = self.create_orders(2)
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timezone.timedelta(days=10))
+        today = timezone.localdate()
+        rows = self.export(start=(today - timezone.timedelta(days=1)).isoformat(), end=today.isoformat()).splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [recent.pk])
+        rows = self.export(end=(today - timezone.timedelta(days=5)).isoformat()).splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [old.pk])
+
+    def test_invalid_filters(self):
+        client = self.client_for(self.owner)
+        self.assertEqual(client.get(self.url, {'start': '2026-02-01', 'end': '2026-01-01'}).status_code, 400)
+        self.assertEqual(client.get(self.url, {'file_format': 'xml'}).status_code, 400)
+        owner = User.objects.create_user(username='dono2', role='owner')
+        self.assertEqual(self.client_for(owner).get(self.url).status_code, 404)
+
+    async def test_asgi_streams_chunk_by_chunk(self):
+        orders = await sync_to_async(self.create_orders)(3)
+        expected = await sync_to_async(self.export)()
+        headers = {'Authorization': f'Bearer {RoleRefreshToken.for_user(self.owner).access_token}'}
+        with override_settings(ORDER_EXPORT_CHUNK_SIZE=1):
+            response = await AsyncClient().get(self.url, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            # Gerador assíncrono: o Django não junta o arquivo com sync_to_async(list).
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), len(orders))
+        self.assertEqual(b''.join(chunks).decode(), expected)
+
+
+@override_settings(ORDER_EXPORT_CHUNK_SIZE=250)
+class OrderExportMemoryTests(TestCase):
+    """
+    O export percorre o histórico inteiro com memória constante: o pico de
+    memória de um histórico GROWTH vezes maior fica praticamente igual. Com
+    ORDER_EXPORT_TEST_ORDERS=1000000 o histórico grande tem 1 milhão de
+    pedidos (alguns minutos no SQLite); o padrão é menor para a suíte rodar
+    rápido.
+    """
+    ORDERS = int(os.environ.get('ORDER_EXPORT_TEST_ORDERS', 4000))
+    GROWTH = 4
+    # Folga para o ruído de alocação; um export que materializasse o
+    # histórico cresceria junto com ele (GROWTH vezes).
+    TOLERANCE = 1.5
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = User.objects.create_user(username='cliente', role='customer')
+        cls.small = cls.create_history('pequeno', cls.ORDERS // cls.GROWTH, customer)
+        cls.large = cls.create_history('grande', cls.ORDERS, customer)
+
+    @classmethod
+    def create_history(cls, name, count, customer):
+        owner = User.objects.create_user(username=f'dono-{name}', role='owner')
+        restaurant = Restaurant.objects.create(owner=owner, name=name, address='Rua', phone='11')
+        item = MenuItem.objects.create(restaurant=restaurant, name='Prato', price=Decimal('10.00'))
+        batch = 10000
+        for offset in range(0, count, batch):
+            orders = Order.objects.bulk_create(
+                Order(customer=customer, restaurant=restaurant, total_price=Decimal('10.00'), delivery_address='Rua B')
+                for _ in range(min(batch, count - offset))
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, menu_item=item, quantity=1, name='Prato', unit_price=Decimal('10.00'))
+                for order in orders
+            )
+        return restaurant
+
+    def export_peak(self, restaurant, file_format):
+        import tracemalloc
+        from .exports import export_orders
+
+        lines = 0
+        tracemalloc.start()
+        try:
+            for chunk in export_orders(restaurant.pk, file_format):
+                lines += chunk.count('\n')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return lines - (file_format == 'csv'), peak
+
+    def test_memory_does_not_grow_with_history(self):
+        for file_format in ('ndjson', 'csv'):
+            with self.subTest(file_format=file_format):
+                # Uma passada antes, para caches e imports não entrarem na primeira medida.
+                self.export_peak(self.small, file_format)
+                small_lines, small_peak = self.export_peak(self.small, file_format)
+                large_lines, large_peak = self.export_peak(self.large, file_format)
+                self.assertEqual((small_lines, large_lines), (self.ORDERS // self.GROWTH, self.ORDERS))
+                self.assertLess(
+                    large_peak, small_peak * self.TOLERANCE,
+                    f"{file_format}: pico de {small_peak} bytes com {small_lines} pedidos e {large_peak} com {large_lines}",
+                )
+
+
+@override_settings(LOCATION_SINK='api.tracking.InMemorySink', LOCATION_FLUSH_INTERVAL=60)
+class CustomerOrderStreamTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.order = self.create_orders(1, status='out_for_delivery', driver=self.driver)[0]
+        self.url = reverse('customer-order-stream', args=[self.order.pk])
+
+    def auth_header(self, user):
+        return {'Authorization': f'Bearer {RoleRefreshToken.for_user(user).access_token}'}
+
+    def stream(self, user=None):
+        # A rota só usa a view assíncrona com ASYNC_VIEWS=True; aqui ela é chamada direto.
+        request = self.factory.get(self.url, headers=self.auth_header(user) if user else {})
+        return async_views.customer_order_stream(request, pk=self.order.pk)
+
+    async def test_stream_receives_status_and_location(self):
+        response = await self.stream(self.customer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+
+        first = await anext(chunks)
+        self.assertIn(b'event: status', first)
+        self.assertIn(b'out_for_delivery', first)
+
+        await sync_to_async(self.client_for(self.driver).patch)(
+            reverse('driver-update-location', args=[self.order.pk]), {'lat': 1.5, 'lng': 2.5}
+        )
+        location = await anext(chunks)
+        self.assertIn(b'event: location', location)
+        self.assertIn(b'"lat": 1.5', location)
+
+    async def test_other_customer_gets_404(self):
+        other = await sync_to_async(User.objects.create_user)(username='cliente2', role='customer')
+        response = await self.stream(other)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_requires_authentication(self):
+        response = await self.stream()
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(ORDER_STREAM_KEEPALIVE=15)
+    def test_wsgi_route_returns_snapshot_and_closes(self):
+        response = self.client_for(self.customer).get(self.url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, b'retry: 15000\nevent: status\ndata: {"status": "out_for_delivery"}\n\n')
+
+        other = User.objects.create_user(username='cliente2', role='customer')
+        response = self.client_for(other).get(self.url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['detail'], "Pedido não encontrado ou não pertence a você.")
+
+
+class RestaurantOrderChangesTests(BaseAPITestCase):
+
+    url = reverse_lazy('restaurant-order-changes')
+
+    def test_returns_only_orders_changed_after_cursor(self):
+        first, second = self.create_orders(2)
+        client = self.client_for(self.owner)
+        cursor = client.get(self.url).data['cursor']
+
+        self.assertEqual(client.get(self.url, {'since': cursor}).data['results'], [])
+
+        client.patch(reverse('restaurant-order-detail', args=[first.pk]), {'status': 'in_progress'})
+        response = client.get(self.url, {'since': cursor})
+        self.assertEqual([row['id'] for row in response.data['results']], [first.pk])
+        self.assertEqual(response.data['results'][0]['status'], 'in_progress')
+
+        response = client.get(self.url, {'since': response.data['cursor']})
+        self.assertEqual(response.data['results'], [])
+
+    def test_updated_at_moves_on_save(self):
+        order = self.create_orders(1)[0]
+        created = order.updated_at
+        order.status = 'in_progress'
+        order.save()
+        self.assertGreater(order.updated_at, created)
+
+    def test_invalid_cursor(self):
+        client = self.client_for(self.owner)
+        for since in ('abc', '1~x', '99999999999999999999999', '1~5.99999999999999999999'):
+            with self.subTest(since=since):
+                self.assertEqual(client.get(self.url, {'since': since}).status_code, 400)
+
+    def test_late_commit_behind_cursor_is_delivered_once(self):
+        first, late = self.create_orders(2)
+        client = self.client_for(self.owner)
+        cursor = client.get(self.url).data['cursor']
+
+        # `late` foi salvo antes de `first`, mas a transação dele só terminou
+        # depois que o cliente já tinha recebido `first`.
+        now = timezone.now()
+        Order.objects.filter(pk=late.pk).update(updated_at=now - timezone.timedelta(seconds=1))
+        Order.objects.filter(pk=first.pk).update(status='in_progress', updated_at=now)
+        response = client.get(self.url, {'since': cursor})
+        self.assertEqual([row['id'] for row in response.data['results']], [late.pk, first.pk])
+        cursor = response.data['cursor']
+
+        Order.objects.filter(pk=late.pk).update(status='cancelled', updated_at=now - timezone.timedelta(milliseconds=500))
+        response = client.get(self.url, {'since': cursor})
+        self.assertEqual([row['id'] for row in response.data['results']], [late.pk])
+        self.assertEqual(response.data['results'][0]['status'], 'cancelled')
+        self.assertEqual(client.get(self.url, {'since': response.data['cursor']}).data['results'], [])
+
+    @override_settings(API_MAX_PAGE_SIZE=2)
+    def test_pages_through_window_without_repeats(self):
+        client = self.client_for(self.owner)
+        cursor = client.get(self.url).data['cursor']
+        orders = self.create_orders(5)
+        delivered = []
+        for _ in range(3):
+            response = client.get(self.url, {'since': cursor})
+            delivered += [row['id'] for row in response.data['results']]
+            cursor = response.data['cursor']
+        self.assertEqual(delivered, [order.pk for order in orders])
+        self.assertFalse(response.data['has_more'])
+
+    @override_settings(ORDER_FEED_MAX_WAIT=25, ORDER_FEED_POLL_INTERVAL=10)
+    def test_non_finite_or_negative_wait_does_not_block(self):
+        self.create_orders(1)
+        client = self.client_for(self.owner)
+        cursor = client.get(self.url).data['cursor']
+        for wait in ('nan', 'inf', '-inf', '-5', 'abc'):
+            with self.subTest(wait=wait):
+                start = time.perf_counter()
+                response = client.get(self.url, {'since': cursor, 'wait': wait})
+                self.assertLess(time.perf_counter() - start, 1)
+                self.assertEqual(response.status_code, 200)
+
+    @override_settings(ORDER_FEED_MAX_WAIT=25)
+    def test_long_poll_times_out_without_changes(self):
+        self.create_orders(1)
+        client = self.client_for(self.owner)
+        cursor = client.get(self.url).data['cursor']
+        start = time.perf_counter()
+        response = client.get(self.url, {'since': cursor, 'wait': 0.2})
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['cursor'], cursor)
+
+
+@override_settings(ORDER_FEED_MAX_WAIT=25, ORDER_FEED_POLL_INTERVAL=10)
+class RestaurantOrderLongPollTests(TransactionTestCase):
+
+    def test_long_poll_wakes_up_on_change(self):
+        owner = User.objects.create_user(username='dono', role='owner')
+        restaurant = Restaurant.objects.create(owner=owner, name='Cantina', address='Rua', phone='11')
+        order = Order.objects.create(restaurant=restaurant, total_price=Decimal('10'), delivery_address='Rua B')
+        client = APIClient()
+        client.force_authenticate(user=owner)
+        url = reverse('restaurant-order-changes')
+        cursor = client.get(url).data['cursor']
+
+        def change_status():
+            time.sleep(0.2)
+            order.status = 'in_progress'
+            order.save()
+            connection.close()
+
+        thread = threading.Thread(target=change_status)
+        thread.start()
+        start = time.perf_counter()
+        response = client.get(url, {'since': cursor, 'wait': 5})
+        elapsed = time.perf_counter() - start
+        thread.join()
+
+        # Acordou pela notificação, bem antes do intervalo de reconsulta.
+        self.assertLess(elapsed, 2)
+        self.assertEqual([row['id'] for row in response.data['results']], [order.pk])
+
+
+@override_settings(LOCATION_SINK='api.tracking.InMemorySink', LOCATION_FLUSH_INTERVAL=60)
+class AsyncViewTests(BaseAPITestCase):
+    """As views de api/async_views.py respondem como as views DRF equivalentes."""
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.order = self.create_orders(1, status='out_for_delivery', driver=self.driver)[0]
+
+    def auth_header(self, user):
+        return {'Authorization': f'Bearer {RoleRefreshToken.for_user(user).access_token}'}
+
+    async def test_location_update_buffers_position(self):
+        request = self.factory.patch(
+            f'/api/driver/orders/{self.order.pk}/location/', {'lat': 1.5, 'lng': 2.5},
+            content_type='application/json', headers=self.auth_header(self.driver),
+        )
+        response = await async_views.driver_location_update(request, pk=self.order.pk)
+        self.assertEqual(response.status_code, 200)
+
+        buffer = get_location_buffer()
+        await sync_to_async(buffer.flush)()
+        self.assertEqual(
+            buffer.sink.data[f'order_locations/{self.order.pk}'],
+            {'lat': 1.5, 'lng': 2.5, 'driver_id': self.driver.pk},
+        )
+
+    async def test_location_update_rejects_wrong_role_and_bad_payload(self):
+        url = f'/api/driver/orders/{self.order.pk}/location/'
+        request = self.factory.patch(url, {'lat': 1}, content_type='application/json', headers=self.auth_header(self.customer))
+        self.assertEqual((await async_views.driver_location_update(request, pk=self.order.pk)).status_code, 403)
+
+        request = self.factory.patch(url, {'lat': 'x'}, content_type='application/json', headers=self.auth_header(self.driver))
+        response = await async_views.driver_location_update(request, pk=self.order.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('lat', json.loads(response.content))
+
+        for body in ('{"lat": 1e999, "lng": 0}', '{"lat": "nan", "lng": 0}'):
+            request = self.factory.patch(url, body, content_type='application/json', headers=self.auth_header(self.driver))
+            response = await async_views.driver_location_update(request, pk=self.order.pk)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('lat', json.loads(response.content))
+
+    async def test_location_update_parses_bodies_like_sync_view(self):
+        url = reverse('driver-update-location', args=[self.order.pk])
+        location = {'lat': 1.5, 'lng': 2.5}
+        bodies = [
+            ('application/json', json.dumps(location), 200),
+            ('application/x-www-form-urlencoded', urlencode(location), 200),
+            (MULTIPART_CONTENT, encode_multipart(BOUNDARY, location), 200),
+            ('application/json', '{"lat": ', 400),
+            ('text/plain', 'lat=1.5', 415),
+        ]
+        client = self.client_for(self.driver)
+        for content_type, body, status_code in bodies:
+            with self.subTest(content_type=content_type, body=body[:20]):
+                expected = await sync_to_async(client.generic)('PATCH', url, body, content_type)
+                request = self.factory.patch(url, body, content_type=content_type, headers=self.auth_header(self.driver))
+                response = await async_views.driver_location_update(request, pk=self.order.pk)
+                self.assertEqual(expected.status_code, status_code)
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(json.loads(response.content), expected.json())
+
+    async def test_track_order_matches_sync_view(self):
+        url = reverse('customer-track-order', args=[self.order.pk])
+        expected = await sync_to_async(self.client_for(self.customer).get)(url)
+        request = self.factory.get(url, headers=self.auth_header(self.customer))
+        response = await async_views.customer_track_order(request, pk=self.order.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), expected.data)
+
+        request = self.factory.get(url, headers=self.auth_header(self.driver))
+        self.assertEqual((await async_views.customer_track_order(request, pk=self.order.pk)).status_code, 403)
+
+    async def test_authentication_errors_match_sync_view(self):
+        url = reverse('customer-track-order', args=[self.order.pk])
+        expired = AccessToken.for_user(self.customer)
+        expired.set_exp(lifetime=-timezone.timedelta(minutes=1))
+        for headers in ({}, {'Authorization': 'Bearer abc'}, {'Authorization': f'Bearer {expired}'}):
+            expected = await sync_to_async(self.client.get)(url, headers=headers)
+            response = await async_views.customer_track_order(self.factory.get(url, headers=headers), pk=self.order.pk)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(json.loads(response.content), expected.json())
+            self.assertEqual(response['WWW-Authenticate'], expected['WWW-Authenticate'])
+
+    def test_public_menu_is_served_from_cache(self):
+        url = reverse('public-restaurant-menu', args=[self.restaurant.pk])
+        view = async_to_sync(async_views.public_restaurant_menu)
+        first = view(self.factory.get(url), restaurant_pk=self.restaurant.pk)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(json.loads(first.content)['results']), len(self.menu_items))
+
+        with self.assertNumQueries(0):
+            second = view(self.factory.get(url), restaurant_pk=self.restaurant.pk)
+        self.assertEqual(second.content, first.content)
+
+        response = view(self.factory.get(url, headers={'If-None-Match': second['ETag']}), restaurant_pk=self.restaurant.pk)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(ORDER_FEED_MAX_WAIT=25, ORDER_FEED_POLL_INTERVAL=10)
+    async def test_changes_feed_long_poll_wakes_up_on_notify(self):
+        url = reverse('restaurant-order-changes')
+        headers = self.auth_header(self.owner)
+        response = await async_views.restaurant_order_changes_feed(self.factory.get(url, headers=headers))
+        cursor = json.loads(response.content)['cursor']
+
+        async def change_status():
+            await asyncio.sleep(0.2)
+            await Order.objects.filter(pk=self.order.pk).aupdate(status='in_progress', updated_at=timezone.now())
+            async_views.restaurant_order_changes.notify(self.restaurant.pk)
+
+        start = time.perf_counter()
+        response, _ = await asyncio.gather(
+            async_views.restaurant_order_changes_feed(self.factory.get(url, {'since': cursor, 'wait': 5}, headers=headers)),
+            change_status(),
+        )
+        self.assertLess(time.perf_counter() - start, 2)
+        results = json.loads(response.content)['results']
+        self.assertEqual([row['id'] for row in results], [self.order.pk])
+        self.assertEqual(results[0]['status'], 'in_progress')
+
+    @override_settings(ORDER_FEED_MAX_WAIT=25, ORDER_FEED_POLL_INTERVAL=10)
+    async def test_changes_feed_non_finite_wait_does_not_block(self):
+        url = reverse('restaurant-order-changes')
+        headers = self.auth_header(self.owner)
+        response = await async_views.restaurant_order_changes_feed(self.factory.get(url, headers=headers))
+        cursor = json.loads(response.content)['cursor']
+        for wait in ('nan', 'inf', '-5'):
+            with self.subTest(wait=wait):
+                start = time.perf_counter()
+                request = self.factory.get(url, {'since': cursor, 'wait': wait}, headers=headers)
+                response = await asyncio.wait_for(async_views.restaurant_order_changes_feed(request), 5)
+                self.assertLess(time.perf_counter() - start, 1)
+                self.assertEqual(response.status_code, 200)
+
+    @override_settings(ORDER_FEED_MAX_WAIT=25, ORDER_FEED_POLL_INTERVAL=10)
+    async def test_driver_feed_long_poll_wakes_up_on_dispatch(self):
+        url = reverse('driver-order-changes')
+        headers = self.auth_header(self.driver)
+        expected = await sync_to_async(self.client_for(self.driver).get)(url)
+        response = await async_views.driver_order_changes_feed(self.factory.get(url, headers=headers))
+        cursor = json.loads(response.content)['cursor']
+        self.assertEqual(decode_change_cursor(cursor).seen, decode_change_cursor(expected.data['cursor']).seen)
+        waiting = (await sync_to_async(self.create_orders)(1, status='out_for_delivery'))[0]
+
+        async def dispatch():
+            # O que run_dispatch_round faz ao atribuir um pedido.
+            await asyncio.sleep(0.2)
+            await Order.objects.filter(pk=waiting.pk).aupdate(driver_id=self.driver.pk, updated_at=timezone.now())
+            async_views.driver_order_changes.notify(self.driver.pk)
+
+        start = time.perf_counter()
+        response, _ = await asyncio.gather(
+            async_views.driver_order_changes_feed(self.factory.get(url, {'since': cursor, 'wait': 5}, headers=headers)),
+            dispatch(),
+        )
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual([row['id'] for row in json.loads(response.content)['results']], [waiting.pk])
+
+        request = self.factory.get(url, headers=self.auth_header(self.owner))
+        self.assertEqual((await async_views.driver_order_changes_feed(request)).status_code, 403)
+
+
+class ChangeNotifierAsyncTests(SimpleTestCase):
+
+    async def test_wait_async_times_out_without_changes(self):
+        notifier = ChangeNotifier()
+        self.assertFalse(await notifier.wait_async('r1', notifier.version('r1'), 0.05))
+
+    async def test_wait_async_wakes_up_on_notify_from_thread(self):
+        notifier = ChangeNotifier()
+        version = notifier.version('r1')
+        threading.Timer(0.05, notifier.notify, args=['r1']).start()
+        self.assertTrue(await notifier.wait_async('r1', version, 5))
+        self.assertEqual(notifier._async_waiters, {})
+
+
+@override_settings(DATABASE_REPLICA_ALIAS=None)
+class BenchmarkCommandTests(TestCase):
+
+    def test_benchmark_writes_json_report(self):
+        routes = [
+            'public-restaurant-menu', 'order-create', 'driver-claim-order', 'metrics', 'token_revoke',
+            'restaurant-stats', 'driver-order-changes', 'menu-import', 'menu-export', 'restaurant-order-export',
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'bench.json')
+            call_command(
+                'benchmark', restaurants=2, items=4, orders=20, drivers=2, customers=3,
+                requests=2, warmup=0, only=','.join(routes), output=output, stdout=io.StringIO(),
+            )
+            with open(output) as report:
+                results = json.load(report)['results']
+        self.assertEqual(set(results), set(routes))
+        self.assertIn('p99_ms', results['order-create'])
+        # A base sintética é desfeita no final.
+        self.assertFalse(Order.objects.exists())
+
+    def test_benchmark_covers_every_route(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'bench.json')
+            call_command(
+                'benchmark', restaurants=2, items=4, orders=20, drivers=2, customers=3,
+                requests=2, warmup=0, output=output, stdout=io.StringIO(),
+            )
+            with open(output) as report:
+                report = json.load(report)
+        measured = set(report['results']) | set(report['meta']['skipped'])
+        # order-list-create é medida como order-list (GET) e order-create (POST).
+        if {'order-list', 'order-create'} <= measured:
+            measured.add('order-list-create')
+        self.assertEqual({pattern.name for pattern in api_urls.urlpatterns} - measured, set())
+
+    def test_bench_dispatch_reports_index_and_endpoint(self):
+        output = io.StringIO()
+        call_command('bench_dispatch', drivers=200, orders=30, restaurants=5, queries=20, requests=2, json=True, stdout=output)
+        results = json.loads(output.getvalue())
+        self.assertIn('p99_ms', results['index']['nearest'])
+        self.assertEqual(set(results['endpoint']), {'available-orders', 'available-orders-nearby'})
+        self.assertFalse(Order.objects.exists())
+
+    def test_bench_search_reports_query_latency(self):
+        output = io.StringIO()
+        call_command('bench_search', items=60, restaurants=3, queries=3, requests=2, json=True, stdout=output)
+        results = json.loads(output.getvalue())
+        self.assertIn('p99_ms', results['queries']['erro de digitação'])
+        self.assertIn('queries_per_request', results['endpoint'])
+        self.assertFalse(MenuItem.objects.exists())
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_HEADERS=True, PROFILING_QUERY_BUDGET=1, PROFILING_METRICS_TOKEN=None)
+class ProfilingMiddlewareTests(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        request_metrics.reset()
+
+    def test_headers_report_queries_and_timings(self):
+        response = self.client_for(self.customer).get(reverse('user-profile'))
+        self.assertEqual(response['X-DB-Queries'], '1')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+, serializer;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertNotIn('X-Query-Budget-Exceeded', response)
+
+    async def test_async_requests_are_profiled(self):
+        headers = {'Authorization': f'Bearer {RoleRefreshToken.for_user(self.customer).access_token}'}
+        async def get_response(request):
+            return HttpResponse()
+        self.assertTrue(iscoroutinefunction(ProfilingMiddleware(get_response)))
+        # Carregada antes, para a requisição consultar só o usuário.
+        await sync_to_async(local_revocations.get_many)([])
+        response = await AsyncClient().get(reverse('user-profile'), headers=headers)
+        # A query roda na thread do sync_to_async e ainda conta para a requisição.
+        self.assertEqual(response['X-DB-Queries'], '1')
+        self.assertEqual(request_metrics.snapshot()[('GET', '/api/profile/')]['queries'], 1)
+
+    def test_serializer_time_comes_from_app_serializers(self):
+        self.create_orders(3)
+        self.client_for(self.customer).get(reverse('order-list-create'))
+        self.assertGreater(request_metrics.snapshot()[('GET', '/api/orders/')]['serializer_time'], 0)
+        # A medição vem dos serializers da API; as classes do DRF ficam intactas.
+        self.assertFalse(hasattr(rest_serializers.Serializer.is_valid, '__wrapped__'))
+        self.assertFalse(hasattr(rest_serializers.ListSerializer.data.fget, '__wrapped__'))
+
+    def test_flags_requests_over_budget(self):
+        with self.assertLogs('api.middleware', level='WARNING'):
+            response = self.client_for(self.owner).post(
+                reverse('menu-item-list-create', args=[self.restaurant.pk]), {'name': 'Novo', 'price': '5.00'}
+            )
+        self.assertEqual(response['X-Query-Budget-Exceeded'], '1')
+
+    def test_metrics_endpoint_aggregates_per_route(self):
+        client = self.client_for(self.customer)
+        client.get(reverse('user-profile'))
+        client.get(reverse('user-profile'))
+        body = APIClient().get(reverse('metrics')).content.decode()
+        self.assertIn('api_requests_total{method="GET",route="/api/profile/"} 2', body)
+        self.assertIn('# TYPE api_db_queries_total counter', body)
+        self.assertIn('api_driver_auth_cache_hits_total', body)
+
+    @override_settings(PROFILING_METRICS_TOKEN='segredo')
+    def test_metrics_token(self):
+        self.assertEqual(APIClient().get(reverse('metrics')).status_code, 403)
+        response = APIClient().get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilingDisabledTests(BaseAPITestCase):
+
+    def test_no_headers_and_no_metrics_when_disabled(self):
+        response = self.client_for(self.customer).get(reverse('user-profile'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(APIClient().get(reverse('metrics')).status_code, 404)
+
+
+@override_settings(LOCATION_SINK='api.tracking.InMemorySink', LOCATION_FLUSH_INTERVAL=60)
+class StatelessAuthenticationTests(BaseAPITestCase):
+
+    def bearer(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def login(self, username):
+        response = APIClient().post(reverse('token_obtain_pair'), {'username': username, 'password': 'senha-forte-123'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_login_token_carries_role(self):
+        tokens = self.login('entregador')
+        self.assertEqual(AccessToken(tokens['access'])['role'], 'driver')
+
+    @mock.patch('api.authentication.revocations_in_cache', return_value=False)
+    def test_location_ping_does_not_load_user(self, _):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.create_orders(1, status='out_for_delivery', driver=self.driver)[0]
+        client = self.bearer(self.login('entregador')['access'])
+        url = reverse('driver-update-location', args=[order.pk])
+        # A primeira requisição do processo carrega a lista de revogação; as
+        # seguintes não consultam o banco.
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(client.patch(url, {'lat': 1.0, 'lng': 2.0}).status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('api_revokedtoken', ctx.captured_queries[0]['sql'])
+        with self.assertNumQueries(0):
+            self.assertEqual(client.patch(url, {'lat': 1.0, 'lng': 2.0}).status_code, 200)
+        # Com o cache compartilhado, a primeira checagem do token busca as
+        # chaves dele na tabela e guarda a resposta; as seguintes só leem o cache.
+        with mock.patch('api.authentication.revocations_in_cache', return_value=True):
+            with self.assertNumQueries(1):
+                self.assertEqual(client.patch(url, {'lat': 1.0, 'lng': 2.0}).status_code, 200)
+            with self.assertNumQueries(0):
+                self.assertEqual(client.patch(url, {'lat': 1.0, 'lng': 2.0}).status_code, 200)
+
+    def test_role_is_enforced_from_claim(self):
+        client = self.bearer(self.login('cliente')['access'])
+        self.assertEqual(client.get(reverse('driver-available-orders')).status_code, 403)
+
+    def test_token_without_role_claim_still_works(self):
+        client = self.bearer(AccessToken.for_user(self.customer))
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 200)
+
+    def test_revoked_tokens_are_rejected(self):
+        tokens = self.login('cliente')
+        client = self.bearer(tokens['access'])
+        self.assertEqual(client.post(reverse('token_revoke'), {'refresh': tokens['refresh']}).status_code, 204)
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 401)
+        response = APIClient().post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    @mock.patch('api.authentication.revocations_in_cache', return_value=False)
+    def test_revocation_is_shared_between_processes(self, _):
+        tokens = self.login('cliente')
+        client = self.bearer(tokens['access'])
+        self.assertEqual(client.post(reverse('token_revoke'), {'refresh': tokens['refresh']}).status_code, 204)
+        # Outro worker: a cópia local dele não viu a revogação e é recarregada da tabela.
+        cache.clear()
+        local_revocations.clear()
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 401)
+        self.assertEqual(APIClient().post(reverse('token_refresh'), {'refresh': tokens['refresh']}).status_code, 401)
+
+    @mock.patch('api.authentication.revocations_in_cache', return_value=True)
+    def test_revocation_survives_cache_flush(self, _):
+        tokens = self.login('cliente')
+        client = self.bearer(tokens['access'])
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 200)
+        self.assertEqual(client.post(reverse('token_revoke'), {'refresh': tokens['refresh']}).status_code, 204)
+        # Eviction ou flush do Redis: só a tabela ainda tem as revogações.
+        cache.clear()
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 401)
+        self.assertEqual(APIClient().post(reverse('token_refresh'), {'refresh': tokens['refresh']}).status_code, 401)
+
+        other = self.bearer(self.login('dono')['access'])
+        self.customer.is_active = False
+        self.customer.save()
+        cache.clear()
+        self.assertEqual(self.bearer(tokens['access']).get(reverse('order-list-create')).status_code, 401)
+        self.assertEqual(other.get(reverse('restaurant-list-create')).status_code, 200)
+
+    @mock.patch('api.authentication.revocations_in_cache', return_value=True)
+    def test_revocation_overrides_cached_absence(self, _):
+        tokens = self.login('cliente')
+        client = self.bearer(tokens['access'])
+        # A ausência de revogação fica no cache; revogar depois a substitui.
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 200)
+        self.assertEqual(client.post(reverse('token_revoke')).status_code, 204)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(reverse('order-list-create')).status_code, 401)
+
+    @mock.patch('api.authentication.revocations_in_cache', return_value=False)
+    def test_local_revocation_list_is_refreshed_after_interval(self, _):
+        tokens = self.login('cliente')
+        client = self.bearer(tokens['access'])
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 200)
+        # Revogação feita por outro processo: só a tabela tem o registro.
+        token = AccessToken(tokens['access'])
+        RevokedToken.objects.create(
+            key=f"jwt-denied:{token['jti']}", revoked_at=int(time.time()),
+            expires_at=timezone.now() + timezone.timedelta(minutes=5),
+        )
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 200)
+        with override_settings(AUTH_REVOCATION_REFRESH=0):
+            self.assertEqual(client.get(reverse('order-list-create')).status_code, 401)
+
+    def test_deactivated_user_loses_tokens(self):
+        client = self.bearer(self.login('cliente')['access'])
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 401)
+
+    def test_deleted_user_loses_tokens(self):
+        client = self.bearer(self.login('cliente')['access'])
+        self.customer.delete()
+        self.assertEqual(client.get(reverse('order-list-create')).status_code, 401)
+
+    def test_tokens_are_revoked_only_when_user_is_deactivated(self):
+        with mock.patch('api.signals.revoke_user_tokens') as revoke:
+            self.customer.first_name = 'Ana'
+            self.customer.save()
+            revoke.assert_not_called()
+            self.customer.is_active = False
+            self.customer.save()
+            User.objects.get(pk=self.customer.pk).save()
+            self.customer.save()
+        revoke.assert_called_once_with(self.customer.pk)
+
+    def test_cached_user_leaves_password_out(self):
+        get_cached_user(self.customer.pk)
+        cached = cache.get(f'auth-user:{self.customer.pk}')
+        self.assertEqual(cached.username, 'cliente')
+        self.assertNotIn('password', cached.__dict__)
+        self.assertNotIn(self.customer.password.encode(), pickle.dumps(cached))
+
+    def test_profile_update_reads_from_database(self):
+        client = self.bearer(self.login('cliente')['access'])
+        self.assertEqual(client.get(reverse('user-profile')).data['first_name'], '')
+        client.patch(reverse('user-profile'), {'first_name': 'Ana'})
+        self.assertEqual(client.get(reverse('user-profile')).data['first_name'], 'Ana')
+
+
+class PasswordHashingTests(BaseAPITestCase):
+
+    def login(self, username='cliente'):
+        return APIClient().post(reverse('token_obtain_pair'), {'username': username, 'password': 'senha-forte-123'})
+
+    def test_new_passwords_use_scrypt(self):
+        self.assertTrue(self.customer.password.startswith('scrypt$'))
+
+    def test_pbkdf2_hash_is_upgraded_on_login(self):
+        self.customer.password = make_password('senha-forte-123', hasher='pbkdf2_sha256')
+        self.customer.save()
+        self.assertEqual(self.login().status_code, 200)
+        self.customer.refresh_from_db()
+        self.assertTrue(self.customer.password.startswith('scrypt$'))
+
+    def test_cost_change_is_applied_on_login(self):
+        with self.settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 12):
+            self.assertEqual(self.login().status_code, 200)
+        self.customer.refresh_from_db()
+        self.assertTrue(self.customer.password.startswith(f'scrypt${2 ** 12}$'))
+
+    def test_memory_limit_covers_parallelism(self):
+        # Com p maior que n, o buffer de 128 * r * p bytes domina a memória.
+        with self.settings(PASSWORD_SCRYPT_WORK_FACTOR=16, PASSWORD_SCRYPT_PARALLELISM=64):
+            self.assertTrue(make_password('senha-forte-123').startswith('scrypt$16$'))
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_MAX_PENDING=0, PASSWORD_HASHING_TIMEOUT=0.05)
+    def test_saturated_pool_returns_503(self):
+        release = threading.Event()
+        pool = get_hashing_pool()
+        blocker = threading.Thread(target=pool.run, args=(release.wait,))
+        blocker.start()
+        try:
+            time.sleep(0.05)
+            self.assertEqual(self.login().status_code, 503)
+        finally:
+            release.set()
+            blocker.join()
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_MAX_PENDING=0, PASSWORD_HASHING_TIMEOUT=0.05)
+    def test_pbkdf2_verification_uses_the_pool(self):
+        self.customer.password = make_password('senha-forte-123', hasher='pbkdf2_sha256')
+        self.customer.save()
+        release = threading.Event()
+        pool = get_hashing_pool()
+        blocker = threading.Thread(target=pool.run, args=(release.wait,))
+        blocker.start()
+        try:
+            time.sleep(0.05)
+            # Senha errada: só a verificação do hash antigo roda, e ela também espera vaga.
+            response = APIClient().post(reverse('token_obtain_pair'), {'username': 'cliente', 'password': 'errada'})
+            self.assertEqual(response.status_code, 503)
+        finally:
+            release.set()
+            blocker.join()
+
+
+class StartupImportTests(SimpleTestCase):
+    """
+    Mede com `python -X importtime` o custo de importação de um worker
+    (WSGI + URLconf) e de um comando do manage.py. O Firebase e suas
+    dependências pesadas não podem ser carregados na inicialização, nem o
+    SciPy (e o NumPy) do despacho em lote, quando instalados.
+    """
+
+    IMPORT_BUDGET_MS = 1000
+    HEAVY_MODULES = ('firebase_admin', 'grpc', 'google.cloud', 'scipy', 'numpy')
+
+    def import_time(self, *args):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', *args],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, env=os.environ.copy(),
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            modules[name.strip()] = int(self_us)
+        return sum(modules.values()) / 1000, modules
+
+    def assert_light_startup(self, *args):
+        total_ms, modules = self.import_time(*args)
+        heavy = [name for name in modules if name.startswith(self.HEAVY_MODULES)]
+        self.assertEqual(heavy, [])
+        self.assertLess(total_ms, self.IMPORT_BUDGET_MS)
+
+    def test_worker_startup(self):
+        self.assert_light_startup(
+            '-c', 'import config.wsgi; from django.urls import get_resolver; get_resolver().url_patterns'
+        )
+
+    def test_management_command_startup(self):
+        self.assert_light_startup('manage.py', 'check')
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    """Reuso de conexões configurado por variáveis de ambiente (config/settings.py)."""
+
+    def load_settings(self, expression, **env):
+        # config.settings lê o ambiente na importação: carrega num processo novo,
+        # com o PostgreSQL padrão mesmo que os testes rodem com outro DB_ENGINE.
+        env = {'DB_ENGINE': 'django.db.backends.postgresql', **env}
+        result = subprocess.run(
+            [sys.executable, '-c', f'import json, config.settings as s; print(json.dumps({expression}))'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, env={**os.environ, **env},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def load_database_settings(self, **env):
+        return self.load_settings('s.DATABASES["default"]', **env)
+
+    def test_persistent_connections_by_default(self):
+        database = self.load_database_settings(ASYNC_VIEWS='False', DB_POOL='False', DB_CONN_MAX_AGE='120')
+        self.assertEqual(database['CONN_MAX_AGE'], 120)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertEqual(database['OPTIONS'], {})
+
+    def test_pool_disables_persistent_connections(self):
+        database = self.load_database_settings(DB_POOL='True', DB_POOL_MAX_SIZE='8')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['pool'], {'min_size': 1, 'max_size': 8, 'timeout': 10.0})
+
+    def test_asgi_without_pool_disables_persistent_connections(self):
+        database = self.load_database_settings(ASYNC_VIEWS='True', DB_POOL='False', DB_CONN_MAX_AGE='120')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        database = self.load_database_settings(ASYNC_VIEWS='True', DB_POOL='True')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertIn('pool', database['OPTIONS'])
+
+    def test_sqlite_engine_without_pool(self):
+        database = self.load_database_settings(DB_ENGINE='django.db.backends.sqlite3', DB_POOL='True')
+        self.assertEqual(database['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(database['OPTIONS'], {})
+        database = self.load_database_settings(DB_ENGINE='django.db.backends.sqlite3')
+        self.assertEqual(database['NAME'], os.path.join(settings.BASE_DIR, 'db.sqlite3'))
+
+    def test_order_feed_long_poll_only_under_asgi(self):
+        self.assertEqual(self.load_settings('s.ORDER_FEED_MAX_WAIT', ASYNC_VIEWS='False'), 0)
+        self.assertEqual(self.load_settings('s.ORDER_FEED_MAX_WAIT', ASYNC_VIEWS='True'), 25)
+        self.assertEqual(self.load_settings('s.ORDER_FEED_MAX_WAIT', ASYNC_VIEWS='False', ORDER_FEED_MAX_WAIT='10'), 10)
+
+
+@override_settings(DATABASE_REPLICA_ALIAS='replica', REPLICA_STICKY_SECONDS=5)
+class PrimaryReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_use_primary_outside_read_views(self):
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_read_view_uses_replica_until_it_writes(self):
+        state = _Routing()
+        state.use_replica = True
+        token = _routing.set(state)
+        try:
+            self.assertEqual(self.router.db_for_read(Order), 'replica')
+            self.assertEqual(self.router.db_for_write(Order), 'default')
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+        finally:
+            _routing.reset(token)
+
+    def test_recent_writes_are_remembered(self):
+        self.assertFalse(wrote_recently('user:1'))
+        mark_recent_write('user:1')
+        self.assertTrue(wrote_recently('user:2', 'user:1'))
+        self.assertFalse(wrote_recently())
+
+    def test_replica_is_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'api'))
+        self.assertTrue(self.router.allow_migrate('default', 'api'))
+
+    @override_settings(DATABASE_REPLICA_ALIAS='replica')
+    async def test_stickiness_middleware_runs_async_under_asgi(self):
+        async def get_response(request):
+            return HttpResponse(status=201)
+
+        middleware = ReplicaStickinessMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().post('/api/orders/')
+        request.user = mock.Mock(is_authenticated=True, id=7)
+        self.assertEqual((await middleware(request)).status_code, 201)
+        self.assertTrue(wrote_recently('user:7'))
+
+    def test_replica_requires_shared_cache(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}}
+        with override_settings(DATABASE_REPLICA_ALIAS='replica', CACHES=local):
+            self.assertEqual([error.id for error in check_replica_cache(None)], ['api.E001'])
+        with override_settings(DATABASE_REPLICA_ALIAS='replica', CACHES=shared):
+            self.assertEqual(check_replica_cache(None), [])
+        with override_settings(DATABASE_REPLICA_ALIAS=None, CACHES=local):
+            self.assertEqual(check_replica_cache(None), [])
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, "Sem banco 'replica' configurado (DB_REPLICA_HOST/DB_REPLICA_NAME).")
+@override_settings(DATABASE_REPLICA_ALIAS='replica', REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Ponta a ponta com a réplica espelhando o banco de teste: conta em qual
+    conexão cada leitura acontece.
+    """
+
+    # Condicional: o runner consulta `databases` mesmo de classes puladas.
+    databases = {'default', 'replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        local_revocations.clear()
+        self.owner = User.objects.create_user(username='dono', role='owner')
+        self.customer = User.objects.create_user(username='cliente', role='customer')
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='Cantina', address='Rua', phone='11')
+        self.item = MenuItem.objects.create(restaurant=self.restaurant, name='Prato', price=Decimal('10.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def queries_by_alias(self, request):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = request()
+        self.assertLess(response.status_code, 400, response.content[:200])
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def test_order_history_reads_from_replica(self):
+        primary, replica = self.queries_by_alias(lambda: self.client.get(reverse('order-list-create')))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_customer_reads_own_writes_from_primary(self):
+        self.client.post(reverse('order-list-create'), {
+            'restaurant': self.restaurant.pk, 'delivery_address': 'Rua B',
+            'items': [{'menu_item': self.item.pk, 'quantity': 1}],
+        }, format='json')
+        primary, replica = self.queries_by_alias(lambda: self.client.get(reverse('order-list-create')))
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+        cache.clear()
+        primary, replica = self.queries_by_alias(lambda: self.client.get(reverse('order-list-create')))
+        self.assertEqual(primary, 0)
+
+    def test_public_menu_is_repopulated_from_primary_after_invalidation(self):
+        url = reverse('public-restaurant-menu', args=[self.restaurant.pk])
+        cache.clear()
+        primary, replica = self.queries_by_alias(lambda: APIClient().get(url))
+        self.assertEqual(primary, 0)
+
+        self.item.price = Decimal('12.00')
+        self.item.save()
+        primary, replica = self.queries_by_alias(lambda: APIClient().get(url))
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class FirebaseSink:
+    """
+    Envia as localizações para o Firebase Realtime Database em um único
+    update multi-caminho por flush.
+    """
+
+    def write(self, updates):
+        from .firebase import get_database_reference
+        get_database_reference('/').update(updates)
+
+
+class InMemorySink:
+    """
+    Sink local, usado em testes e benchmarks no lugar do Firebase.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.writes = []
+
+    def write(self, updates):
+        self.writes.append(dict(updates))
+        self.data.update(updates)
+
+
+class LocationBuffer:
+    """
+    Acumula as localizações enviadas pelos entregadores e as repassa ao sink
+    em lote, numa thread em segundo plano. Para cada pedido só a última
+    posição é mantida, então pings que chegam entre dois flushes se fundem
+    em uma única escrita. A requisição nunca espera pela rede.
+    """
+
+    def __init__(self, sink, interval):
+        self.sink = sink
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, order_id, payload):
+        with self._lock:
+            self._pending[f'order_locations/{order_id}'] = payload
+        self._ensure_worker()
+
+    def flush(self):
+        # Um flush por vez, para que um lote antigo nunca sobrescreva um mais novo.
+        with self._flush_lock:
+            with self._lock:
+                updates, self._pending = self._pending, {}
+            if not updates:
+                return
+            try:
+                self.sink.write(updates)
+            except Exception:
+                logger.exception("Falha ao enviar %d localizações; tentando novamente no próximo flush.", len(updates))
+                with self._lock:
+                    # Posições mais novas que chegaram nesse meio tempo têm prioridade.
+                    self._pending = {**updates, **self._pending}
+
+    def _ensure_worker(self):
+        # A thread é criada sob demanda e recriada após um fork (workers do gunicorn).
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='location-buffer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self.interval):
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_location_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                sink = import_string(settings.LOCATION_SINK)()
+                _buffer = LocationBuffer(sink, settings.LOCATION_FLUSH_INTERVAL)
+    return _buffer
+
+
+def reset_location_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            _buffer.flush()
+            _buffer._wakeup.set()
+        _buffer = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting in ('LOCATION_SINK', 'LOCATION_FLUSH_INTERVAL'):
+        reset_location_buffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    if _buffer is not None:
+        _buffer.flush()
@@ -1,45 +1,70 @@
 # api/urls.py
 
+from django.conf import settings
 from django.urls import path
+from . import async_views
 from .views import (
-    UserRegistrationView, UserProfileView,
+    UserRegistrationView, UserProfileView, TokenRevokeView,
     RestaurantListCreateView, RestaurantDetailView,
-    MenuItemListCreateView, MenuItemDetailView, PublicRestaurantListView, PublicRestaurantMenuView, OrderListCreateView, RestaurantOrderListView,
-    RestaurantOrderDetailView, AvailableOrdersListView, DriverClaimOrderView, DriverLocationUpdateView, CustomerTrackOrderView # Importe as novas views
+    MenuItemListCreateView, MenuItemDetailView, MenuImportView, MenuExportView, PublicRestaurantListView, PublicRestaurantMenuView, SearchView, OrderListCreateView, RestaurantOrderListView,
+    RestaurantOrderChangesView, RestaurantOrderDetailView, RestaurantStatsView, RestaurantOrderExportView, AvailableOrdersListView, DriverClaimOrderView, DriverDeliverOrderView, DriverOrderChangesView, DriverLocationUpdateView, CustomerTrackOrderView, CustomerOrderStreamView, # Importe as novas views
+    metrics_view,
 )
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
 
+
+def io_view(view_class, async_view):
+    """
+    Rotas dominadas por espera de I/O: com ASYNC_VIEWS (deploy ASGI) usam a
+    versão assíncrona de api/async_views.py; sob WSGI, a view DRF.
+    """
+    return async_view if settings.ASYNC_VIEWS else view_class.as_view()
+
+
 urlpatterns = [
     # URLs de Autenticação e Perfil
     path('register/', UserRegistrationView.as_view(), name='user-registration'),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
 
     # URLs para Donos de Restaurante (Gerenciamento)
     path('restaurants/', RestaurantListCreateView.as_view(), name='restaurant-list-create'),
     path('restaurants/<int:pk>/', RestaurantDetailView.as_view(), name='restaurant-detail'),
     path('restaurants/<int:restaurant_pk>/menu/', MenuItemListCreateView.as_view(), name='menu-item-list-create'),
+    path('restaurants/<int:restaurant_pk>/menu/import/', MenuImportView.as_view(), name='menu-import'),
+    path('restaurants/<int:restaurant_pk>/menu/export/', MenuExportView.as_view(), name='menu-export'),
     path('restaurants/<int:restaurant_pk>/menu/<int:item_pk>/', MenuItemDetailView.as_view(), name='menu-item-detail'),
 
     # URLs Públicas para Clientes
-    path('public/restaurants/', PublicRestaurantListView.as_view(), name='public-restaurant-list'),
-    path('public/restaurants/<int:restaurant_pk>/menu/', PublicRestaurantMenuView.as_view(), name='public-restaurant-menu'),
+    path('public/restaurants/', io_view(PublicRestaurantListView, async_views.public_restaurant_list), name='public-restaurant-list'),
+    path('public/restaurants/<int:restaurant_pk>/menu/', io_view(PublicRestaurantMenuView, async_views.public_restaurant_menu), name='public-restaurant-menu'),
+    path('public/search/', SearchView.as_view(), name='public-search'),
     # URL de Pedidos
     path('orders/', OrderListCreateView.as_view(), name='order-list-create'),
 
     # URLs para Gerenciamento de Pedidos (Dono do Restaurante)
     path('restaurant/orders/', RestaurantOrderListView.as_view(), name='restaurant-order-list'),
+    path('restaurant/orders/changes/', io_view(RestaurantOrderChangesView, async_views.restaurant_order_changes_feed), name='restaurant-order-changes'),
+    path('restaurant/orders/export/', RestaurantOrderExportView.as_view(), name='restaurant-order-export'),
     path('restaurant/orders/<int:pk>/', RestaurantOrderDetailView.as_view(), name='restaurant-order-detail'),
+    path('restaurant/stats/', RestaurantStatsView.as_view(), name='restaurant-stats'),
 
     # URLs para a Visão do Entregador
     path('driver/available-orders/', AvailableOrdersListView.as_view(), name='driver-available-orders'),
     path('driver/claim-order/<int:pk>/', DriverClaimOrderView.as_view(), name='driver-claim-order'),
+    path('driver/orders/<int:pk>/deliver/', DriverDeliverOrderView.as_view(), name='driver-deliver-order'),
+    path('driver/orders/changes/', io_view(DriverOrderChangesView, async_views.driver_order_changes_feed), name='driver-order-changes'),
 
      # URLs de Rastreamento em Tempo Real
-    path('driver/orders/<int:pk>/location/', DriverLocationUpdateView.as_view(), name='driver-update-location'),
-    path('customer/orders/<int:pk>/track/', CustomerTrackOrderView.as_view(), name='customer-track-order'),
+    path('driver/orders/<int:pk>/location/', io_view(DriverLocationUpdateView, async_views.driver_location_update), name='driver-update-location'),
+    path('customer/orders/<int:pk>/track/', io_view(CustomerTrackOrderView, async_views.customer_track_order), name='customer-track-order'),
+    path('customer/orders/<int:pk>/stream/', io_view(CustomerOrderStreamView, async_views.customer_order_stream), name='customer-order-stream'),
+
+    # Métricas de desempenho (ProfilingMiddleware)
+    path('metrics/', metrics_view, name='metrics'),
 ]
@@ -1,14 +1,34 @@
-import os
+import heapq
+import time
 from rest_framework import generics, status
+from .authentication import get_cached_user, revoke_token
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.permissions import IsAuthenticated
 from .permissions import IsRestauranteOwner, IsCustomer, IsDriver
-from .serializers import UserRegistrationSerializer, UserProfileSerializer, RestaurantSerializer, MenuItemSerializer, OrderCreateSerializer, OrderDisplaySerializer, OrderStatusUpdateSerializer
+from .cache import CachedListMixin, RESTAURANT_LIST_SCOPE, SEARCH_SCOPE, menu_scope, allow_driver_order, is_driver_order_allowed, driver_auth_stats
+from .middleware import metrics as request_metrics
+from .routers import ReplicaReadMixin
+from .stats import dashboard, record_status_change
+from .pagination import (
+    OrderCursorPagination, AvailableOrderCursorPagination, IdCursorPagination, SearchPagination,
+    ChangeCursor, decode_change_cursor, parse_feed_wait,
+)
+from .serializers import UserRegistrationSerializer, UserProfileSerializer, RestaurantSerializer, MenuItemSerializer, OrderCreateSerializer, OrderDisplaySerializer, OrderStatusUpdateSerializer, RestaurantStatsSerializer, OrderExportQuerySerializer
 from .models import User, Restaurant, MenuItem, Order
-from firebase_admin import db
-from .serializers import LocationSerializer
+from .streams import order_events, format_sse, restaurant_order_changes, driver_order_changes
+from .tracking import get_location_buffer
+from .geo import bounding_box, get_driver_index, haversine_km
+from .dispatch import ensure_batch_dispatcher, release_driver
+from .menu_io import export_menu, import_menu, read_rows
+from .exports import export_orders, streaming_content
+from .search import load_results, search
+from .serializers import LocationSerializer, NearbyOrderSerializer, NearbyQuerySerializer, SearchQuerySerializer, SearchResultSerializer, TokenRevokeSerializer
 
 class UserRegistrationView(generics.CreateAPIView):
     """
@@ -33,12 +53,36 @@ class UserRegistrationView(generics.CreateAPIView):
         }
         return Response(response_data, status=status.HTTP_201_CREATED, headers=headers)
     
+class TokenRevokeView(generics.GenericAPIView):
+    """
+    Logout: revoga o access token usado na requisição e, se enviado, o refresh token.
+    """
+    serializer_class = TokenRevokeSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if request.auth is not None:
+            revoke_token(request.auth)
+        refresh = serializer.validated_data.get('refresh')
+        if refresh is not None:
+            revoke_token(refresh)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class UserProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
     
     def get_object(self):
-        return self.request.user
+        # O request.user é montado a partir do token; aqui precisamos do registro completo.
+        # Leituras usam o cache curto de usuários; alterações partem do banco.
+        if self.request.method == 'GET':
+            user = get_cached_user(self.request.user.id)
+            if user is None:
+                raise Http404
+            return user
+        return get_object_or_404(User, pk=self.request.user.id)
     
 class RestaurantListCreateView(generics.ListCreateAPIView):
     serializer_class = RestaurantSerializer
@@ -47,18 +91,18 @@ class RestaurantListCreateView(generics.ListCreateAPIView):
     def get_queryset(self):
         # Retorna apenas restaurante ligado ao dono
         # E um dono so pode ter um restaurante(OneToOneField)
-        return Restaurant.objects.filter(owner=self.request.user)
+        return Restaurant.objects.filter(owner_id=self.request.user.id)
     
     def perform_create(self, serializer):
         # Associa o dono do restaurante ao usuário que está fazendo a requisição.
-        serializer.save(owner=self.request.user)
+        serializer.save(owner_id=self.request.user.id)
 
 class RestaurantDetailView(generics.RetrieveUpdateAPIView):
     serializer_class = RestaurantSerializer
     permission_classes = [IsRestauranteOwner]
 
     def get_queryset(self):
-        return Restaurant.objects.filter(owner=self.request.user)
+        return Restaurant.objects.filter(owner_id=self.request.user.id)
     
 class MenuItemListCreateView(generics.ListCreateAPIView):
     serializer_class = MenuItemSerializer
@@ -70,7 +114,7 @@ class MenuItemListCreateView(generics.ListCreateAPIView):
     
     def perform_create(self, serializer):
         restaurant_pk = self.kwargs['restaurant_pk']
-        restaurant = get_object_or_404(Restaurant, pk=restaurant_pk, owner=self.request.user)
+        restaurant = get_object_or_404(Restaurant, pk=restaurant_pk, owner_id=self.request.user.id)
         serializer.save(restaurant=restaurant)
 
 
@@ -80,7 +124,7 @@ class MenuItemDetailView(generics.RetrieveUpdateAPIView):
 
     def get_queryset(self):
         restaurant_pk = self.kwargs['restaurant_pk']
-        return MenuItem.objects.filter(restaurant__pk=restaurant_pk, restaurant__owner=self.request.user)
+        return MenuItem.objects.filter(restaurant__pk=restaurant_pk, restaurant__owner_id=self.request.user.id)
     
     def get_object(self):
         queryset = self.get_queryset()
@@ -88,26 +132,87 @@ class MenuItemDetailView(generics.RetrieveUpdateAPIView):
         obj = get_object_or_404(queryset, pk=item_pk)
         return obj
     
-class PublicRestaurantListView(generics.ListAPIView):
+class MenuImportView(generics.GenericAPIView):
+    """
+    Importa o cardápio em lote: JSON (lista), NDJSON ou CSV com as colunas
+    id, name, description, price e is_available. Linhas com id atualizam o
+    item; sem id, criam. Linhas inválidas voltam em `errors` sem impedir as demais.
+    """
+    permission_classes = [IsAuthenticated, IsRestauranteOwner]
+
+    def post(self, request, *args, **kwargs):
+        restaurant = get_object_or_404(Restaurant, pk=self.kwargs['restaurant_pk'], owner_id=request.user.id)
+        report = import_menu(restaurant, read_rows(request))
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class MenuExportView(generics.GenericAPIView):
+    """Exporta o cardápio em streaming, em JSON (padrão) ou CSV (?file_format=csv), no formato aceito pela importação."""
+    permission_classes = [IsAuthenticated, IsRestauranteOwner]
+
+    def get(self, request, *args, **kwargs):
+        restaurant = get_object_or_404(Restaurant, pk=self.kwargs['restaurant_pk'], owner_id=request.user.id)
+        file_format = request.query_params.get('file_format', 'json')
+        if file_format not in ('json', 'csv'):
+            return Response({"detail": "file_format deve ser json ou csv."}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = 'text/csv' if file_format == 'csv' else 'application/json'
+        response = StreamingHttpResponse(streaming_content(request._request, export_menu(restaurant.pk, file_format)), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="cardapio-{restaurant.pk}.{file_format}"'
+        return response
+
+
+class PublicRestaurantListView(ReplicaReadMixin, CachedListMixin, generics.ListAPIView):
     serializer_class = RestaurantSerializer
     permission_classes = [AllowAny]
+    pagination_class = IdCursorPagination
+
+    def get_cache_scope(self):
+        return RESTAURANT_LIST_SCOPE
 
     def get_queryset(self):
-        return Restaurant.objects.filter(is_active=True)
+        return Restaurant.objects.select_related('owner').filter(is_active=True)
     
-class PublicRestaurantMenuView(generics.ListAPIView):
+class PublicRestaurantMenuView(ReplicaReadMixin, CachedListMixin, generics.ListAPIView):
     serializer_class = MenuItemSerializer
     permission_classes = [AllowAny]
+    pagination_class = IdCursorPagination
+
+    def get_cache_scope(self):
+        return menu_scope(self.kwargs['restaurant_pk'])
 
     def get_queryset(self):
         restaurant_pk = self.kwargs['restaurant_pk']
-        return MenuItem.objects.filter(restaurant__pk=restaurant_pk, is_available=True)
-    
-class OrderListCreateView(generics.ListCreateAPIView):
+        return MenuItem.objects.select_related('restaurant').filter(restaurant__pk=restaurant_pk, is_available=True)
+
+
+class SearchView(ReplicaReadMixin, CachedListMixin, generics.ListAPIView):
+    """
+    Busca em restaurantes ativos e itens disponíveis (?q=), por relevância.
+    Cada resultado traz `type` ('restaurant' ou 'menu_item'), `score` e o
+    objeto correspondente. Veja api/search.py.
+    """
+    serializer_class = SearchResultSerializer
+    permission_classes = [AllowAny]
+    pagination_class = SearchPagination
+
+    def get_cache_scope(self):
+        return SEARCH_SCOPE
+
+    def get_queryset(self):
+        query = SearchQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        return search(query.validated_data['q'])
+
+    def paginate_queryset(self, queryset):
+        # A busca devolve só (tipo, id, score); os objetos são lidos apenas para a página.
+        return load_results(super().paginate_queryset(queryset))
+
+class OrderListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsCustomer]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
-        return Order.objects.filter(customer=self.request.user).order_by('-created_at')
+        return Order.objects.with_display_relations().filter(customer_id=self.request.user.id).order_by('-created_at')
     
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -126,47 +231,275 @@ class OrderListCreateView(generics.ListCreateAPIView):
         create_serializer.is_valid(raise_exception=True)
         order = create_serializer.save()
 
+        # Recarrega o pedido com as relações de exibição para não gerar uma query por item
+        order = Order.objects.with_display_relations().get(pk=order.pk)
+
         # Crie a resposta usando o serializer de exibição
         display_serializer = OrderDisplaySerializer(order, context=context)
         headers = self.get_success_headers(display_serializer.data)
         return Response(display_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
     
-class RestaurantOrderListView(generics.ListAPIView):
+class RestaurantOrderListView(ReplicaReadMixin, generics.ListAPIView):
     serializer_class = OrderDisplaySerializer
     permission_classes = [IsAuthenticated, IsRestauranteOwner]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
-        return Order.objects.filter(restaurant__owner=self.request.user).order_by('-created_at')
+        return Order.objects.with_display_relations().filter(restaurant__owner_id=self.request.user.id).order_by('-created_at')
     
+class OrderChangesFeedView(generics.ListAPIView):
+    """
+    Feed de mudanças: devolve só os pedidos criados ou alterados depois do
+    cursor `since` (veja ChangeCursor), em ordem de (updated_at, id). Sem `since`, devolve
+    apenas o cursor atual, a partir do qual o cliente passa a acompanhar.
+    Com `wait=N`, segura a requisição por até N segundos até surgir uma mudança.
+    As subclasses definem a chave do feed (get_feed_key), o ChangeNotifier
+    que a avisa e os pedidos que entram nele.
+    """
+    serializer_class = OrderDisplaySerializer
+    notifier = None
+
+    def get_feed_key(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        self.feed_key = self.get_feed_key()
+        if self.feed_key is None:
+            return Response({"results": [], "cursor": None, "has_more": False})
+
+        since = request.query_params.get('since')
+        if not since:
+            # O cursor parte de agora; os pedidos da janela de releitura já
+            # estão na listagem do cliente e entram como entregues.
+            cursor = ChangeCursor.starting_at(timezone.now())
+            recent = self.get_queryset().changed_since(cursor.watermark).values_list('id', 'updated_at')
+            return Response({"results": [], "cursor": cursor.advance(recent).encode(), "has_more": False})
+
+        cursor = decode_change_cursor(since)
+        wait = parse_feed_wait(request.query_params.get('wait'))
+        deadline = time.monotonic() + wait
+        limit = settings.API_MAX_PAGE_SIZE
+
+        while True:
+            version = self.notifier.version(self.feed_key)
+            changes = cursor.unseen(
+                self.get_queryset().with_display_relations().changed_since(cursor.watermark)[:limit + len(cursor.seen) + 1]
+            )
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                break
+            # Acorda quando este processo registrar uma mudança, ou reconsulta
+            # periodicamente para pegar mudanças feitas em outros workers.
+            self.notifier.wait(self.feed_key, version, min(remaining, settings.ORDER_FEED_POLL_INTERVAL))
+
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if changes:
+            since = cursor.advance([(order.pk, order.updated_at) for order in changes], has_more).encode()
+        return Response({
+            "results": self.get_serializer(changes, many=True).data,
+            "cursor": since,
+            "has_more": has_more,
+        })
+
+class RestaurantOrderChangesView(OrderChangesFeedView):
+    """Feed de mudanças dos pedidos do restaurante, para o painel."""
+    permission_classes = [IsAuthenticated, IsRestauranteOwner]
+    notifier = restaurant_order_changes
+
+    def get_feed_key(self):
+        return Restaurant.objects.filter(owner_id=self.request.user.id).values_list('id', flat=True).first()
+
+    def get_queryset(self):
+        return Order.objects.filter(restaurant_id=self.feed_key)
+
+class DriverOrderChangesView(OrderChangesFeedView):
+    """
+    Feed dos pedidos atribuídos ao entregador. No despacho em lote
+    (DISPATCH_MODE=batch) é por aqui, em long-poll, que ele fica sabendo
+    do pedido que recebeu.
+    """
+    permission_classes = [IsAuthenticated, IsDriver]
+    notifier = driver_order_changes
+
+    def get_feed_key(self):
+        return self.request.user.id
+
+    def get_queryset(self):
+        return Order.objects.filter(driver_id=self.feed_key)
+
 class RestaurantOrderDetailView(generics.UpdateAPIView):
     serializer_class = OrderStatusUpdateSerializer
     permission_classes = [IsAuthenticated, IsRestauranteOwner]
 
     def get_queryset(self):
-        return Order.objects.filter(restaurant__owner=self.request.user)
+        return Order.objects.filter(restaurant__owner_id=self.request.user.id)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Pedido relido com lock: o save grava a linha atual (e não a lida
+            # antes, que perderia o entregador de um claim concorrente) e duas
+            # atualizações simultâneas não contam a mesma transição duas vezes.
+            serializer.instance = Order.objects.select_for_update().get(pk=serializer.instance.pk)
+            old_status = serializer.instance.status
+            order = serializer.save()
+            record_status_change(order, old_status)
+        if old_status == 'out_for_delivery' and order.status != old_status and order.driver_id:
+            # Entrega encerrada pelo restaurante: o entregador volta a ficar livre.
+            release_driver(order.driver_id)
+        # Avisa os clientes acompanhando o pedido pelo stream
+        order_events.publish(order.pk, 'status', {'status': order.status})
+
+class RestaurantStatsView(generics.GenericAPIView):
+    """
+    Painel do dono: pedidos por status e pedidos/receita por dia nos
+    últimos `days` dias (padrão 30), lidos do agregado RestaurantDailyStats.
+    """
+    serializer_class = RestaurantStatsSerializer
+    permission_classes = [IsAuthenticated, IsRestauranteOwner]
+
+    def get(self, request, *args, **kwargs):
+        restaurant_id = Restaurant.objects.filter(owner_id=request.user.id).values_list('id', flat=True).first()
+        if restaurant_id is None:
+            return Response({"detail": "Você ainda não cadastrou um restaurante."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({"days": "Informe um número inteiro de dias."}, status=status.HTTP_400_BAD_REQUEST)
+        days = min(max(days, 1), 366)
+        return Response(self.get_serializer(dashboard(restaurant_id, days)).data)
+
+class RestaurantOrderExportView(generics.GenericAPIView):
+    """
+    Exporta o histórico de pedidos do restaurante em streaming, em NDJSON
+    (padrão) ou CSV (?file_format=csv), opcionalmente entre ?start= e ?end=
+    (datas, inclusive). Lê da réplica quando houver uma.
+    """
+    permission_classes = [IsAuthenticated, IsRestauranteOwner]
+
+    def get(self, request, *args, **kwargs):
+        restaurant_id = Restaurant.objects.filter(owner_id=request.user.id).values_list('id', flat=True).first()
+        if restaurant_id is None:
+            return Response({"detail": "Você ainda não cadastrou um restaurante."}, status=status.HTTP_404_NOT_FOUND)
+        query = OrderExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        file_format = params['file_format']
+
+        # O gerador roda depois que a view retorna, fora do roteamento por
+        # requisição do ReplicaReadMixin: o banco é escolhido aqui.
+        rows = export_orders(
+            restaurant_id, file_format, params.get('start'), params.get('end'),
+            using=settings.DATABASE_REPLICA_ALIAS or DEFAULT_DB_ALIAS,
+        )
+        content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(streaming_content(request._request, rows), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="pedidos-{restaurant_id}.{file_format}"'
+        return response
 
 class AvailableOrdersListView(generics.ListAPIView):
+    """
+    Pedidos prontos para entrega, paginados por cursor. Com ?lat=&lng= (a
+    posição do entregador) devolve só os pedidos de restaurantes até
+    ?radius= km (padrão DISPATCH_RADIUS_KM), do mais perto ao mais longe
+    (uma página, do mesmo tamanho da listagem por cursor), e registra a
+    posição no índice de despacho, como livre se não houver entrega em andamento.
+    """
     serializer_class = OrderDisplaySerializer
     permission_classes = [IsAuthenticated, IsDriver]
+    pagination_class = AvailableOrderCursorPagination
 
     def get_queryset(self):
-        return Order.objects.filter(status='out_for_delivery', driver=None).order_by('created_at')
+        return Order.objects.with_display_relations().filter(status='out_for_delivery', driver=None).order_by('created_at')
+
+    def list(self, request, *args, **kwargs):
+        if 'lat' not in request.query_params and 'lng' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        query = NearbyQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        lat, lng = query.validated_data['lat'], query.validated_data['lng']
+        radius = query.validated_data.get('radius', settings.DISPATCH_RADIUS_KM)
+        # Quem ainda está com um pedido em entrega não pode receber outro do despacho em lote.
+        idle = not Order.objects.filter(driver_id=request.user.id, status='out_for_delivery').exists()
+        get_driver_index().update(request.user.id, lat, lng, idle=idle)
+        if idle:
+            ensure_batch_dispatcher()
+
+        # O retângulo em volta do raio filtra no banco só id e coordenadas; a
+        # distância exata e a ordenação são feitas aqui, e só os pedidos que
+        # entram na resposta são carregados por inteiro.
+        lat_min, lat_max, lng_min, lng_max = bounding_box(lat, lng, radius)
+        candidates = Order.objects.filter(
+            status='out_for_delivery', driver=None,
+            restaurant__latitude__range=(lat_min, lat_max), restaurant__longitude__range=(lng_min, lng_max),
+        ).values_list('id', 'restaurant__latitude', 'restaurant__longitude')
+        nearest = heapq.nsmallest(self.paginator.get_page_size(request), (
+            (distance, order_id) for order_id, r_lat, r_lng in candidates.iterator()
+            if (distance := haversine_km(lat, lng, r_lat, r_lng)) <= radius
+        ))
+        orders = Order.objects.with_display_relations().in_bulk([order_id for _, order_id in nearest])
+        results = []
+        for distance, order_id in nearest:
+            order = orders[order_id]
+            order.distance_km = round(distance, 3)
+            results.append(order)
+        return Response({
+            "radius_km": radius,
+            "results": NearbyOrderSerializer(results, many=True, context=self.get_serializer_context()).data,
+        })
 
 class DriverClaimOrderView(generics.UpdateAPIView):
-    serializer_class = OrderStatusUpdateSerializer
+    """
+    Permite que um entregador aceite um pedido pronto para entrega.
+    A reserva é feita com um único UPDATE condicional: se vários entregadores
+    tentarem ao mesmo tempo, apenas um altera a linha e os demais recebem 409,
+    sem que ninguém fique esperando por locks.
+    """
     permission_classes = [IsAuthenticated, IsDriver]
-    lookup_field = 'pk'
 
-    def get_queryset(self):
-        return Order.objects.filter(status='out_for_delivery', driver=None)
-    
-    def perform_create(self, serializer):
-        order = self.get_object()
-        if order.driver is not None:
-            raise ValidationError("Este pedido já foi aceito por outro entregador.")
-        
-        serializer.instance.driver = self.request.user
-        serializer.save()
+    def update(self, request, *args, **kwargs):
+        order_id = self.kwargs.get('pk')
+        claimed = Order.objects.filter(
+            pk=order_id, status='out_for_delivery', driver__isnull=True
+        ).update(driver_id=request.user.id, updated_at=timezone.now())
+
+        if not claimed:
+            if Order.objects.filter(pk=order_id, status='out_for_delivery').exists():
+                return Response({"detail": "Este pedido já foi aceito por outro entregador."}, status=status.HTTP_409_CONFLICT)
+            return Response({"detail": "Pedido não encontrado ou não está disponível para entrega."}, status=status.HTTP_404_NOT_FOUND)
+
+        # O UPDATE não dispara signals: autoriza aqui os pings de localização deste
+        # entregador e avisa o painel do restaurante.
+        allow_driver_order(request.user.id, order_id)
+        get_driver_index().mark_busy(request.user.id)
+        order = Order.objects.with_display_relations().get(pk=order_id)
+        restaurant_order_changes.notify(order.restaurant_id)
+        driver_order_changes.notify(request.user.id)
+        return Response(OrderDisplaySerializer(order, context=self.get_serializer_context()).data, status=status.HTTP_200_OK)
+
+class DriverDeliverOrderView(generics.UpdateAPIView):
+    """
+    O entregador marca o pedido como entregue. O status final tira o pedido
+    das consultas de "entrega em andamento", e o entregador volta a ficar
+    livre para o despacho.
+    """
+    permission_classes = [IsAuthenticated, IsDriver]
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            order = Order.objects.select_for_update().filter(
+                pk=self.kwargs.get('pk'), driver_id=request.user.id, status='out_for_delivery'
+            ).first()
+            if order is None:
+                return Response({"detail": "Pedido não encontrado ou não está em entrega com você."}, status=status.HTTP_404_NOT_FOUND)
+            order.status = 'delivered'
+            order.save(update_fields=['status', 'updated_at'])
+            record_status_change(order, 'out_for_delivery')
+        release_driver(request.user.id)
+        order_events.publish(order.pk, 'status', {'status': order.status})
+        order = Order.objects.with_display_relations().get(pk=order.pk)
+        return Response(OrderDisplaySerializer(order, context=self.get_serializer_context()).data, status=status.HTTP_200_OK)
 
 class DriverLocationUpdateView(generics.UpdateAPIView):
     serializer_class = LocationSerializer
@@ -174,24 +507,53 @@ class DriverLocationUpdateView(generics.UpdateAPIView):
 
     def update(self, request, *args, **kwargs):
         order_id = self.kwargs.get('pk')
-        try:
-            order = Order.objects.get(pk=order_id, driver=self.request.user)
-        except Order.DoesNotExist:
-            return Response({"detail": "Pedido não encontrado ou não pertence a você."}, status=status.HTTP_404_NOT_FOUND)
-        
+        # Em regime normal a autorização vem do cache e o ping não consulta o banco.
+        if not is_driver_order_allowed(self.request.user.id, order_id):
+            try:
+                order = Order.objects.only('id', 'status').get(pk=order_id, driver_id=self.request.user.id)
+            except Order.DoesNotExist:
+                return Response({"detail": "Pedido não encontrado ou não pertence a você."}, status=status.HTTP_404_NOT_FOUND)
+            if order.status == 'out_for_delivery':
+                allow_driver_order(self.request.user.id, order_id)
+
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         location_data = serializer.validated_data
 
-        ref = db.reference(f'/order_locations/{order_id}')
-        ref.set({
+        location = {
             'lat': location_data['lat'],
             'lng': location_data['lng'],
             'driver_id': self.request.user.id
-        })
+        }
+        # A escrita no Firebase acontece em lote, fora da requisição.
+        get_location_buffer().submit(order_id, location)
+        get_driver_index().update(self.request.user.id, location['lat'], location['lng'], idle=False)
+        order_events.publish(order_id, 'location', location)
 
         return Response({"status": "localização atualizada com sucesso"}, status=status.HTTP_200_OK)
     
+class CustomerOrderStreamView(generics.GenericAPIView):
+    """
+    Versão WSGI do stream do pedido (async_views.customer_order_stream).
+    Um stream infinito prenderia o worker enquanto a conexão durasse, então
+    aqui a resposta traz só o status atual e fecha; o campo retry faz o
+    EventSource reconectar a cada ORDER_STREAM_KEEPALIVE segundos.
+    """
+    permission_classes = [IsAuthenticated, IsCustomer]
+
+    def perform_content_negotiation(self, request, force=False):
+        # O EventSource pede text/event-stream; os erros continuam saindo em JSON.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+        order = Order.objects.filter(pk=self.kwargs['pk'], customer_id=request.user.id).only('id', 'status').first()
+        if order is None:
+            return Response({"detail": "Pedido não encontrado ou não pertence a você."}, status=status.HTTP_404_NOT_FOUND)
+        retry = int(settings.ORDER_STREAM_KEEPALIVE * 1000)
+        response = HttpResponse(f"retry: {retry}\n" + format_sse('status', {'status': order.status}), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
 class CustomerTrackOrderView(generics.RetrieveAPIView):
     """
     View para o cliente obter as informações para rastrear um pedido.
@@ -202,7 +564,7 @@ class CustomerTrackOrderView(generics.RetrieveAPIView):
         order_id = self.kwargs.get('pk')
         try:
             # Garante que o cliente só pode rastrear seus próprios pedidos.
-            Order.objects.get(pk=order_id, customer=self.request.user)
+            Order.objects.get(pk=order_id, customer_id=self.request.user.id)
         except Order.DoesNotExist:
             return Response({"detail": "Pedido não encontrado ou não pertence a você."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -210,11 +572,30 @@ class CustomerTrackOrderView(generics.RetrieveAPIView):
         # e o enviaria para o cliente.
         # Por agora, apenas confirmamos o acesso.
 
-        firebase_db_url = os.getenv("FIREBASE_DATABASE_URL")
+        firebase_db_url = settings.FIREBASE_DATABASE_URL
         firebase_path = f"/order_locations/{order_id}"
 
         return Response({
             "message": "Acesso permitido. Ouça por atualizações no caminho especificado.",
             "firebase_database_url": firebase_db_url,
             "firebase_path": firebase_path
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+def metrics_view(request):
+    """
+    Métricas agregadas do processo no formato texto do Prometheus.
+    Só existe com PROFILING_ENABLED; se PROFILING_METRICS_TOKEN estiver
+    definido, exige o header "Authorization: Bearer <token>".
+    """
+    if not settings.PROFILING_ENABLED:
+        return JsonResponse({"detail": "Não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    token = settings.PROFILING_METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return JsonResponse({"detail": "Você não tem permissão para executar essa ação."}, status=status.HTTP_403_FORBIDDEN)
+
+    auth_cache = driver_auth_stats.snapshot()
+    body = request_metrics.render(extra_counters=[
+        ('api_driver_auth_cache_hits_total', 'Pings de localização autorizados pelo cache.', auth_cache['hits']),
+        ('api_driver_auth_cache_misses_total', 'Pings de localização que consultaram o banco.', auth_cache['misses']),
+    ])
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
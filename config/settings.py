@@ -47,15 +47,24 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Perfil por requisição (queries, tempo de banco, serializers e total).
+# Desligado, o middleware sai da pilha e não tem custo.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_HEADERS = os.environ.get('PROFILING_HEADERS', 'False') == 'True'
+PROFILING_QUERY_BUDGET = int(os.environ['PROFILING_QUERY_BUDGET']) if os.environ.get('PROFILING_QUERY_BUDGET') else None
+PROFILING_METRICS_TOKEN = os.environ.get('PROFILING_METRICS_TOKEN')
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -75,28 +84,182 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Deploy ASGI (uvicorn): rastreamento, cardápios públicos e os feeds de
+# mudanças (painel e entregador) passam a usar as views assíncronas de
+# api/async_views.py.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-# Adicione estas linhas para depuração
-print("--- DEBUGGING .ENV ---")
-print(f"Lendo DB_NAME: {os.environ.get('DB_NAME')}")
-print(f"Lendo DB_USER: {os.environ.get('DB_USER')}")
-print(f"Lendo DB_HOST: {os.environ.get('DB_HOST')}")
-print("------------------------")
+# Reuso de conexões, por worker. Com DB_POOL=True cada processo mantém um
+# pool do psycopg 3 (DB_POOL_MIN_SIZE a DB_POOL_MAX_SIZE conexões; quem não
+# consegue uma em DB_POOL_TIMEOUT segundos recebe erro). Sem pool, a conexão
+# fica aberta por DB_CONN_MAX_AGE segundos e é testada antes de ser reusada.
+# Sob ASGI (ASYNC_VIEWS) conexões persistentes não são reaproveitadas entre
+# requisições assíncronas e cada uma ficaria aberta até expirar, então sem
+# pool elas são desligadas (CONN_MAX_AGE = 0); use DB_POOL=True para reusar.
+# Dimensione para que instâncias × workers × DB_POOL_MAX_SIZE caiba no
+# max_connections do Postgres.
+# DB_ENGINE troca o banco (ex.: django.db.backends.sqlite3 para rodar os testes
+# e o benchmark sem PostgreSQL; sem DB_NAME o arquivo é db.sqlite3 na raiz). O
+# pool só existe no PostgreSQL.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.postgresql')
+DB_IS_SQLITE = DB_ENGINE == 'django.db.backends.sqlite3'
+DB_POOL = os.environ.get('DB_POOL', 'False') == 'True' and not DB_IS_SQLITE
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.environ.get('DB_NAME'),
+        'ENGINE': DB_ENGINE,
+        'NAME': os.environ.get('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3') if DB_IS_SQLITE else None),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
+        # O pool do Django exige CONN_MAX_AGE = 0: ele mesmo guarda as conexões.
+        'CONN_MAX_AGE': 0 if DB_POOL or ASYNC_VIEWS else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 4)),
+                'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            },
+        } if DB_POOL else {},
+    }
+}
+
+# Réplica de leitura (opcional), definida por DB_REPLICA_HOST ou DB_REPLICA_NAME
+# (os demais campos vêm do principal). Listagens públicas e históricos de
+# pedidos leem dela; quem acabou de escrever lê do principal por
+# REPLICA_STICKY_SECONDS (veja api/routers.py). Essa marca fica no cache, que
+# precisa ser compartilhado (CACHE_BACKEND de Redis ou Memcached): com o
+# LocMemCache o system check api.E001 impede a inicialização.
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICA_ALIAS = 'replica' if 'replica' in DATABASES else None
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+
+# Firebase (inicializado sob demanda em api/firebase.py)
+FIREBASE_CREDENTIALS_PATH = os.environ.get('FIREBASE_CREDENTIALS_PATH')
+FIREBASE_DATABASE_URL = os.environ.get('FIREBASE_DATABASE_URL')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Por padrão, memória local do processo. Com vários workers, use um backend
+# compartilhado (ex.: Redis) para que a invalidação valha para todos.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Cache das listagens públicas de restaurantes e cardápios
+PUBLIC_CACHE_ALIAS = 'default'
+PUBLIC_CACHE_TIMEOUT = int(os.environ.get('PUBLIC_CACHE_TIMEOUT', 300))
+
+# Cache da autorização "este entregador está com este pedido" usado nos pings de localização
+DRIVER_AUTH_CACHE_TIMEOUT = int(os.environ.get('DRIVER_AUTH_CACHE_TIMEOUT', 60))
+
+
+# Rastreamento: as localizações dos entregadores são acumuladas em memória
+# e enviadas ao sink em lote a cada LOCATION_FLUSH_INTERVAL segundos.
+LOCATION_SINK = os.environ.get('LOCATION_SINK', 'api.tracking.FirebaseSink')
+LOCATION_FLUSH_INTERVAL = float(os.environ.get('LOCATION_FLUSH_INTERVAL', 0.5))
+
+# Feeds de mudanças (painel do restaurante e entregador): espera máxima do
+# long-poll e intervalo para reconsultar o banco (mudanças feitas por outros
+# processos).
+# Sob WSGI cada long-poll prende um worker inteiro, então o padrão é 0 (o
+# feed responde na hora e o painel faz polling); só sob ASGI o padrão é 25 s.
+ORDER_FEED_MAX_WAIT = float(os.environ.get('ORDER_FEED_MAX_WAIT', 25 if ASYNC_VIEWS else 0))
+ORDER_FEED_POLL_INTERVAL = float(os.environ.get('ORDER_FEED_POLL_INTERVAL', 2))
+# O updated_at é o instante do save, não do commit: cada consulta do feed relê
+# os últimos ORDER_FEED_LOOKBACK segundos para pegar transações que terminaram
+# depois (os pedidos já entregues ficam no cursor e não se repetem). Deve
+# cobrir a transação de escrita mais longa mais a diferença entre os relógios.
+ORDER_FEED_LOOKBACK = float(os.environ.get('ORDER_FEED_LOOKBACK', 10))
+
+# Intervalo (segundos) dos keepalives enviados nas conexões SSE de acompanhamento
+ORDER_STREAM_KEEPALIVE = float(os.environ.get('ORDER_STREAM_KEEPALIVE', 15))
+# Com vários workers, os eventos publicados em um chegam aos streams abertos
+# nos outros pelo cache compartilhado (api/streams.py), com até
+# ORDER_STREAM_RELAY_INTERVAL segundos de atraso. Com o LocMemCache não há
+# relay: rode um único worker ASGI.
+ORDER_STREAM_RELAY_INTERVAL = float(os.environ.get('ORDER_STREAM_RELAY_INTERVAL', 1))
+ORDER_STREAM_RELAY_TIMEOUT = int(os.environ.get('ORDER_STREAM_RELAY_TIMEOUT', 300))
+
+# Despacho: índice em memória das posições dos entregadores (api/geo.py).
+# Células de DISPATCH_GRID_CELL_DEG graus (0.01 ≈ 1,1 km); posições mais velhas
+# que DISPATCH_DRIVER_TTL segundos são descartadas. DISPATCH_RADIUS_KM é o raio
+# padrão dos pedidos disponíveis e DISPATCH_MAX_RADIUS_KM o maior aceito.
+DISPATCH_GRID_CELL_DEG = float(os.environ.get('DISPATCH_GRID_CELL_DEG', 0.01))
+DISPATCH_DRIVER_TTL = float(os.environ.get('DISPATCH_DRIVER_TTL', 120))
+DISPATCH_RADIUS_KM = float(os.environ.get('DISPATCH_RADIUS_KM', 5))
+DISPATCH_MAX_RADIUS_KM = float(os.environ.get('DISPATCH_MAX_RADIUS_KM', 50))
+
+# Despacho em lote (api/dispatch.py): com DISPATCH_MODE=batch, a cada
+# DISPATCH_BATCH_INTERVAL segundos os pedidos sem entregador (até
+# DISPATCH_BATCH_MAX_ORDERS) são casados com os entregadores livres, olhando os
+# DISPATCH_BATCH_CANDIDATES mais próximos de cada pedido. DISPATCH_SOLVER:
+# auto (ótimo com SciPy, guloso sem), optimal ou greedy.
+DISPATCH_MODE = os.environ.get('DISPATCH_MODE', 'claim')
+DISPATCH_BATCH_INTERVAL = float(os.environ.get('DISPATCH_BATCH_INTERVAL', 3))
+DISPATCH_BATCH_MAX_ORDERS = int(os.environ.get('DISPATCH_BATCH_MAX_ORDERS', 500))
+DISPATCH_BATCH_CANDIDATES = int(os.environ.get('DISPATCH_BATCH_CANDIDATES', 8))
+DISPATCH_SOLVER = os.environ.get('DISPATCH_SOLVER', 'auto')
+
+# Importação do cardápio em lote: linhas gravadas por bulk_create e limite por arquivo
+MENU_IMPORT_BATCH_SIZE = int(os.environ.get('MENU_IMPORT_BATCH_SIZE', 500))
+MENU_IMPORT_MAX_ROWS = int(os.environ.get('MENU_IMPORT_MAX_ROWS', 5000))
+
+# Exportação do histórico de pedidos: pedidos lidos (e enviados) por bloco
+ORDER_EXPORT_CHUNK_SIZE = int(os.environ.get('ORDER_EXPORT_CHUNK_SIZE', 2000))
+
+# Busca (api/search.py). SEARCH_BACKEND: auto (busca textual do PostgreSQL se
+# for o banco, índice em memória nos demais), postgres ou memory. Cada busca
+# devolve no máximo SEARCH_MAX_RESULTS resultados. SEARCH_FUZZY_THRESHOLD é a
+# similaridade mínima para erros de digitação no índice em memória; no
+# PostgreSQL vale o pg_trgm.word_similarity_threshold do banco (também 0.6).
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', 200))
+SEARCH_FUZZY_THRESHOLD = float(os.environ.get('SEARCH_FUZZY_THRESHOLD', 0.6))
+SEARCH_INDEX_CHUNK_SIZE = int(os.environ.get('SEARCH_INDEX_CHUNK_SIZE', 2000))
+
+
+# Hash de senhas: scrypt (memory-hard) com custo ajustável, calculado num pool
+# limitado para que picos de login não tomem a CPU dos demais endpoints.
+# Hashes PBKDF2 antigos continuam válidos (verificados no mesmo pool) e são
+# convertidos no próximo login.
+# O pool é por processo (no máximo workers do servidor × PASSWORD_HASHING_WORKERS
+# hashes ao mesmo tempo) e só serve com workers que atendem várias requisições:
+# gthread ou ASGI, como no Dockerfile. Num worker síncrono o login ocupa o
+# processo inteiro de qualquer forma.
+PASSWORD_HASHERS = [
+    'api.hashers.BoundedScryptPasswordHasher',
+    'api.hashers.BoundedPBKDF2PasswordHasher',
+    'api.hashers.BoundedPBKDF2SHA1PasswordHasher',
+]
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 15))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', 1))
+# Hashes simultâneos, hashes aguardando na fila e espera máxima (s) por uma vaga antes do 503
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 2))
+PASSWORD_HASHING_MAX_PENDING = int(os.environ.get('PASSWORD_HASHING_MAX_PENDING', 32))
+PASSWORD_HASHING_TIMEOUT = float(os.environ.get('PASSWORD_HASHING_TIMEOUT', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,8 +304,28 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Autenticação sem consulta ao banco: id e papel vêm dos claims do token
+        'api.authentication.StatelessJWTAuthentication',
     )
 }
 
+SIMPLE_JWT = {
+    'TOKEN_USER_CLASS': 'api.authentication.ApiTokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.RevocableTokenRefreshSerializer',
+}
+
+# Cache usado pela lista de tokens revogados e pelo cache curto de usuários.
+# A revogação vale para todos os processos: a lista fica no banco e, se este
+# cache for compartilhado (CACHE_BACKEND de Redis ou Memcached), é lida dele;
+# com o LocMemCache padrão cada processo guarda uma cópia da tabela,
+# recarregada a cada AUTH_REVOCATION_REFRESH segundos (0 = a cada requisição).
+AUTH_CACHE_ALIAS = 'default'
+AUTH_REVOCATION_REFRESH = float(os.environ.get('AUTH_REVOCATION_REFRESH', 5))
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 60))
+
+# Paginação por cursor das listagens: tamanho padrão e limite para o ?page_size=
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 20))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 100))
+
 AUTH_USER_MODEL = 'api.User'
\ No newline at end of file